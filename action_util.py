@@ -1,13 +1,42 @@
 import datetime
 import logging
 import re
+import threading
 import time
 
 import requests
+from requests.adapters import HTTPAdapter
 
 from config_manager import ConfigManager
+from log import HotLogger
 
 logger = logging.getLogger(__name__)
+hot_logger = HotLogger(logger)
+# 按 host 复用的 keep-alive 会话
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def get_session(host):
+    """获取 host 对应的连接池会话，连接数与转发并发数一致"""
+    session = _sessions.get(host)
+    if session is None:
+        with _sessions_lock:
+            session = _sessions.get(host)
+            if session is None:
+                pool_size = ConfigManager.get_init_param_by_key("third_concurrency", 8)
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                _sessions[host] = session
+    return session
+
+
+def third_path_kind(data):
+    """根据任务名区分转发路径：top 或 deal"""
+    task_name = data.get('task_name', 'N/A')
+    return "top" if "_top" in task_name else "deal"
 
 
 def extract_date(filename):
@@ -56,12 +85,11 @@ def call_third_api(data, **kwargs):
     if int(kwargs.get('push_data', 1)) == 0:
         return
     # 外层对象：{"task_name": task_name, "payload": inner_payload}
-    task_name = data.get('task_name', 'N/A')
     inner_payload = data.get('payload', 'N/A')
     the_host = ConfigManager.get_init_param_by_key("third_host", "http://10.184.37.90/api")
     top_path = ConfigManager.get_init_param_by_key("third_top_path", "/monitor/crawler/parseTopData")
     deal_path = ConfigManager.get_init_param_by_key("third_deal_path", "/monitor/crawler/parseDealData")
-    if "_top" in task_name:
+    if third_path_kind(data) == "top":
         the_path = top_path
     else:
         the_path = deal_path
@@ -73,18 +101,19 @@ def call_third_api(data, **kwargs):
     logger.debug("post payload: %s", data)
     payload = inner_payload.get('data', {})
     timeout = kwargs.get("timeout", (30, 30))
-    response = requests.post(
+    response = get_session(the_host).post(
         url=the_host + the_path,
         headers=header,
         json=payload,
         timeout=timeout
     )
-    rs = str(response.json())
     if response.status_code != requests.codes.ok:
-        raise Exception(rs)
-    if not response.json().get("success"):
-        raise Exception(rs)
-    logger.info(rs)
+        raise Exception(response.text)
+    # 响应只解析一次，转成字符串只在输出日志或失败时进行
+    result = response.json()
+    if not result.get("success"):
+        raise Exception(str(result))
+    hot_logger.info("third_api", "%s", result)
     return True
 
 
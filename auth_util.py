@@ -0,0 +1,239 @@
+# -*- coding:utf-8 -*-
+# @FileName  :auth_util.py
+# @Time      :2026/10/18 04:40
+# @Author    :shi lei.wei  <slwei@eppei.com>.
+# 接口签名校验中间件：HMAC-SHA256 + 常量时间比较 + 跨进程共享的防重放缓存
+# 客户端请求头:
+#   X-API-Key    账号
+#   X-Timestamp  秒级时间戳，与服务器时间相差不超过 auth_max_skew 秒
+#   X-Nonce      每次请求唯一的随机串
+#   X-Signature  sign(api_key, secret, timestamp, nonce, method, path)
+# 没有 X-Nonce 的旧客户端（sha256(api_key + timestamp + secret)）在 auth_legacy_signature 开启时仍然接受，
+# 只校验时间偏差，没有防重放：共用同一个 API Key 的机器在同一秒内的签名完全相同，无法与重放区分
+import functools
+import hashlib
+import hmac
+import logging
+import multiprocessing
+import threading
+import time
+from collections import namedtuple
+
+from flask import Flask, g, jsonify, request
+
+from config_manager import ConfigManager
+from log import HotLogger
+
+logger = logging.getLogger(__name__)
+hot_logger = HotLogger(logger)
+
+# 注册在 app.extensions 中的名称，LoginApi 等通过它复用同一个实例
+EXTENSION_NAME = "signature_auth"
+HEADER_API_KEY = "X-API-Key"
+HEADER_TIMESTAMP = "X-Timestamp"
+HEADER_NONCE = "X-Nonce"
+HEADER_SIGNATURE = "X-Signature"
+# 校验结果，同时是 pec_auth_requests_total 的标签值
+RESULTS = ("ok", "missing", "unknown_key", "expired", "bad_signature", "replay")
+_MESSAGES = {"missing": "Missing authentication headers", "replay": "Replayed request"}
+_DEFAULT_API_KEYS = {"unit-epm-pm-epise-chd-gs-pec": "1974596b2bb3423e8ec16ea0851455a8"}
+# 一次加载得到的全部配置，整体替换，请求线程看到的要么是旧配置要么是新配置
+_AuthState = namedtuple("_AuthState", ["macs", "secrets", "paths", "max_skew", "legacy"])
+
+
+def sign(api_key: str, secret: str, timestamp, nonce: str, method: str, path: str) -> str:
+    """客户端签名：HMAC-SHA256(secret, "METHOD\\npath\\napi_key\\ntimestamp\\nnonce")，十六进制"""
+    message = f"{method.upper()}\n{path}\n{api_key}\n{timestamp}\n{nonce}"
+    return hmac.new(secret.encode(), message.encode(), hashlib.sha256).hexdigest()
+
+
+def legacy_sign(api_key: str, secret: str, timestamp) -> str:
+    """旧客户端的签名：sha256(api_key + timestamp + secret)"""
+    return hashlib.sha256(f"{api_key}{timestamp}{secret}".encode()).hexdigest()
+
+
+class NonceCache:
+    """
+    防重放缓存：定长开放寻址哈希表，保存 (api_key, nonce) 的 64 位摘要与过期时间
+    表保存在共享内存 RawArray 中，必须在 fork（gunicorn worker）之前创建，
+    同一个 nonce 重放到任一 worker 都会被拒绝
+    - 每次检查最多探测 probes 个槽位，与已保存的条数无关
+    - 过期的槽位直接复用，不需要清理线程
+    - 探测范围内没有空槽时覆盖最早过期的一条（只会在表远小于签名窗口内的请求量时发生，计入 evictions）
+    """
+
+    def __init__(self, slots: int = 262144, probes: int = 8):
+        self.slots = max(probes, slots)
+        self.probes = probes
+        self._digests = multiprocessing.RawArray('Q', self.slots)
+        self._expires = multiprocessing.RawArray('d', self.slots)
+        self._lock = multiprocessing.Lock()
+        self._evictions = multiprocessing.RawValue('q', 0)
+
+    @staticmethod
+    def _digest(api_key: str, nonce: str) -> int:
+        digest = int.from_bytes(hashlib.blake2b(f"{api_key}\0{nonce}".encode(), digest_size=8).digest(), "big")
+        # 0 表示空槽位
+        return digest or 1
+
+    def add(self, api_key: str, nonce: str, expires_at: float, now: float = None) -> bool:
+        """记录 nonce，返回 False 表示 expires_at 之前已经出现过（重放）"""
+        now = time.time() if now is None else now
+        digest = self._digest(api_key, nonce)
+        digests, expires = self._digests, self._expires
+        start = digest % self.slots
+        with self._lock:
+            free = None
+            oldest = start
+            for i in range(self.probes):
+                slot = (start + i) % self.slots
+                if expires[slot] < now:
+                    if free is None:
+                        free = slot
+                elif digests[slot] == digest:
+                    return False
+                elif expires[slot] < expires[oldest]:
+                    oldest = slot
+            if free is None:
+                free = oldest
+                self._evictions.value += 1
+            digests[free] = digest
+            expires[free] = expires_at
+            return True
+
+    def evictions(self) -> int:
+        """未过期就被覆盖的条数，持续增长说明 auth_nonce_slots 偏小"""
+        return self._evictions.value
+
+
+class SignatureAuth:
+    """
+    签名校验中间件，fork 之前创建（防重放缓存与指标在共享内存中）
+    - init_app 注册 before_request，auth_paths 中的路径（接收数据、登录状态等）统一校验，处理函数不需要改动
+    - require 装饰器用于必须校验的处理函数；同一请求只校验一次
+    - api_keys: {"api_key": "secret"}，配置文件修改后最多 reload_interval 秒内生效，用于轮换密钥
+    """
+
+    def __init__(self, registry=None, reload_interval: float = 5.0):
+        """
+        :param registry: metrics_util.MetricsRegistry，为空时不记录指标
+        :param reload_interval: 检查配置文件修改的间隔（秒）
+        """
+        self.reload_interval = reload_interval
+        self.nonces = NonceCache(ConfigManager.get_param_by_key("auth_nonce_slots", 262144))
+        self.requests = None
+        if registry is not None:
+            self.requests = registry.counter("pec_auth_requests_total", "Signature checks by result",
+                                             label="result", values=RESULTS)
+            registry.gauge("pec_auth_nonce_evictions", "Unexpired nonces overwritten because the cache was full",
+                           func=self.nonces.evictions)
+        self._lock = threading.Lock()
+        self._raw = None
+        self._state = None
+        self._load()
+
+    @staticmethod
+    def _read_config():
+        return (ConfigManager.get_param_by_key("api_keys", _DEFAULT_API_KEYS),
+                ConfigManager.get_param_by_key("auth_paths", []),
+                ConfigManager.get_param_by_key("auth_max_skew", 300),
+                ConfigManager.get_param_by_key("auth_legacy_signature", True))
+
+    def _load(self, raw=None):
+        raw = raw or self._read_config()
+        api_keys, paths, max_skew, legacy = raw
+        # 每个密钥只做一次 HMAC 密钥填充，校验时复制
+        macs = {api_key: hmac.new(secret.encode(), digestmod=hashlib.sha256) for api_key, secret in api_keys.items()}
+        self._state = _AuthState(macs, dict(api_keys), frozenset(paths), int(max_skew), bool(legacy))
+        self._raw = raw
+        self._checked_at = time.time()
+        logger.info("签名校验加载 %d 个 API Key，统一校验的路径: %s，时间偏差: %d 秒，旧签名: %s",
+                    len(macs), sorted(paths), int(max_skew), "接受" if legacy else "拒绝")
+
+    def maybe_reload(self):
+        """按间隔检查配置文件，相关配置有修改时重新加载"""
+        if time.time() - self._checked_at < self.reload_interval:
+            return
+        with self._lock:
+            if time.time() - self._checked_at < self.reload_interval:
+                return
+            self._checked_at = time.time()
+            # 其他组件（如 Cryptor）可能已经触发了重新加载，因此比较配置值而不是只看返回值
+            ConfigManager.reload_if_changed()
+            raw = self._read_config()
+            if raw != self._raw:
+                try:
+                    self._load(raw)
+                except Exception as e:
+                    logger.exception(f"重新加载 API Key 失败，继续使用原配置: {e}")
+
+    def verify(self, api_key, timestamp, nonce, signature, method: str, path: str, now: float = None) -> str:
+        """校验签名，返回 RESULTS 中的一项"""
+        self.maybe_reload()
+        state = self._state
+        if not (api_key and timestamp and signature):
+            return "missing"
+        mac = state.macs.get(api_key)
+        if mac is None:
+            return "unknown_key"
+        now = time.time() if now is None else now
+        try:
+            ts = int(timestamp)
+        except ValueError:
+            return "expired"
+        if abs(now - ts) > state.max_skew:
+            return "expired"
+        if not nonce:
+            if not state.legacy:
+                return "missing"
+            # 旧签名不记录到防重放缓存，见文件头说明
+            expected = legacy_sign(api_key, state.secrets[api_key], timestamp)
+            return "ok" if hmac.compare_digest(expected.encode(), signature.encode()) else "bad_signature"
+        mac = mac.copy()
+        mac.update(f"{method.upper()}\n{path}\n{api_key}\n{timestamp}\n{nonce}".encode())
+        if not hmac.compare_digest(mac.hexdigest().encode(), signature.encode()):
+            return "bad_signature"
+        # 签名正确后才记录 nonce，伪造的请求不会占用缓存；超出时间窗口的时间戳已在上面拒绝
+        if not self.nonces.add(api_key, nonce, ts + state.max_skew, now):
+            return "replay"
+        return "ok"
+
+    def check_request(self):
+        """校验当前请求，通过返回 None，否则返回 401 响应；同一请求只校验一次"""
+        if g.get("auth_api_key") is not None:
+            return None
+        headers = request.headers
+        api_key = headers.get(HEADER_API_KEY)
+        result = self.verify(api_key, headers.get(HEADER_TIMESTAMP), headers.get(HEADER_NONCE),
+                             headers.get(HEADER_SIGNATURE), request.method, request.path)
+        if self.requests is not None:
+            self.requests.labels(result).inc()
+        if result == "ok":
+            g.auth_api_key = api_key
+            return None
+        hot_logger.warning("auth", "签名校验失败: %s %s, api_key: %s, 原因: %s",
+                           request.method, request.path, api_key, result)
+        return jsonify({"error": _MESSAGES.get(result, "Invalid signature")}), 401
+
+    def require(self, view):
+        """装饰器：处理函数执行前校验签名"""
+
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            denied = self.check_request()
+            if denied is not None:
+                return denied
+            return view(*args, **kwargs)
+
+        return wrapper
+
+    def _before_request(self):
+        self.maybe_reload()
+        if request.path in self._state.paths:
+            return self.check_request()
+        return None
+
+    def init_app(self, app: Flask):
+        """注册为 app 的中间件，对 auth_paths 中的路径统一校验"""
+        app.extensions[EXTENSION_NAME] = self
+        app.before_request(self._before_request)
@@ -3,21 +3,23 @@
 # @Time      :2025/10/12 17:05
 # @Author    :shi lei.wei  <slwei@eppei.com>.
 
-import queue
 import threading
 import time
 import random
 import logging
 from typing import Callable, Any, Optional
 
-# 基于PriorityQueue实现的，指数退避重试任务队列
+from back_off_store import MemoryBackoffStore, BackoffStoreFull
+
+# 基于最小堆（或 SQLite 持久化存储）+ 条件变量实现的，指数退避重试任务队列
 logger = logging.getLogger(__name__)
 
 
 class ExponentialBackoffQueue:
     """
-    一个支持指数退避重试的优先级队列。
+    一个支持指数退避重试的延迟队列。
     任务失败后会自动按指数退避时间重新入队，直到成功或达到最大重试次数。
+    工作线程在条件变量上等待，精确地在最早的任务到期时被唤醒，不再轮询。
     """
 
     def __init__(
@@ -28,7 +30,9 @@ class ExponentialBackoffQueue:
         max_backoff: float = 60.0,
         jitter: bool = True,
         dead_letter_callback: Optional[Callable[[Any, int, Exception], None]] = None,
-        worker_count: int = 1
+        worker_count: int = 1,
+        store=None,
+        metrics=None
     ):
         """
         :param process_func: 处理任务的函数，接受一个参数 data
@@ -38,6 +42,8 @@ class ExponentialBackoffQueue:
         :param jitter: 是否添加随机抖动（推荐开启）
         :param dead_letter_callback: 当任务达到最大重试次数时的回调函数
         :param worker_count: 启动多少个工作线程
+        :param store: 任务存储，默认内存最小堆，传入 SqliteBackoffStore 可在重启后重放
+        :param metrics: metrics_util.BackoffMetrics，统计各次重试失败、死信与排队数
         """
         self.process_func = process_func
         self.max_retries = max_retries
@@ -45,8 +51,16 @@ class ExponentialBackoffQueue:
         self.max_backoff = max_backoff
         self.jitter = jitter
         self.dead_letter_callback = dead_letter_callback
-        # 优先级队列: (next_run_time, data, retry_count)
-        self.queue = queue.PriorityQueue()
+        self.metrics = metrics
+        # 按 next_run_time 排序的任务存储，所有访问都在 self._cond 的锁内
+        self._store = store if store is not None else MemoryBackoffStore()
+        lock = threading.Lock()
+        self._cond = threading.Condition(lock)
+        # 未完成的任务数（包含等待重试及重放的任务），用于 join
+        self._unfinished = len(self._store)
+        self._all_done = threading.Condition(lock)
+        # 持久化存储启动时重放的任务计入排队数
+        self._update_size()
         # 启动工作线程
         for i in range(worker_count):
             t = threading.Thread(target=self._worker, name=f"BackoffWorker-{i}", daemon=True)
@@ -56,62 +70,130 @@ class ExponentialBackoffQueue:
         monitor_t.start()
         logger.info(f"ExponentialBackoffQueue 启动，{worker_count} 个工作线程，最大重试: {max_retries}")
 
-    def add_task(self, data: Any):
+    def add_task(self, data: Any, delay: float = 0.0):
         """
         添加新任务（初始重试次数为 0）
+        :param data: 任务数据
+        :param delay: 首次执行前的延迟（秒），默认立即执行
         """
-        # 下一次执行时间：立即执行（time.time()）
-        self.queue.put((time.time(), data, 0))
-        logger.debug(f"📥 添加任务: {data}")
+        next_run_time = time.time() + delay
+        try:
+            with self._cond:
+                self._store.put(next_run_time, data, 0)
+                self._unfinished += 1
+                self._notify_if_earliest(next_run_time)
+                self._update_size()
+        except BackoffStoreFull as e:
+            logger.error(f"💀 {data} 无法加入退避队列: {e}")
+            if self.metrics:
+                self.metrics.dead_letters.inc()
+            if self.dead_letter_callback:
+                self.dead_letter_callback(data, 0, e)
+            return
+        logger.debug("📥 添加任务: %s", data)
+
+    def _update_size(self):
+        """更新排队任务数指标，调用方持有 self._cond 的锁（或在构造时）"""
+        if self.metrics:
+            self.metrics.size.set(len(self._store))
+
+    def _notify_if_earliest(self, next_run_time: float):
+        """新任务成为最早到期的任务时，唤醒一个工作线程重新计算等待时间"""
+        if self._store.next_run_time() == next_run_time:
+            self._cond.notify()
+
+    def _take(self):
+        """阻塞直到最早的任务到期，返回 (task_id, data, retry_count)"""
+        with self._cond:
+            while True:
+                next_time = self._store.next_run_time()
+                if next_time is None:
+                    self._cond.wait()
+                    continue
+                delay = next_time - time.time()
+                if delay <= 0:
+                    task = self._store.take()
+                    # 下一个任务可能也已到期，交给其他空闲的工作线程
+                    if self._store.next_run_time() is not None:
+                        self._cond.notify()
+                    return task
+                self._cond.wait(timeout=delay)
+
+    def _reschedule(self, task_id, next_run_time: float, data: Any, retry_count: int):
+        with self._cond:
+            self._store.reschedule(task_id, next_run_time, data, retry_count)
+            self._notify_if_earliest(next_run_time)
+            self._update_size()
+
+    def _task_done(self, task_id):
+        with self._cond:
+            self._store.done(task_id)
+            self._unfinished -= 1
+            self._update_size()
+            if self._unfinished <= 0:
+                self._all_done.notify_all()
 
     def _worker(self):
         """
-        工作线程：从队列取出任务并处理
+        工作线程：等待到期任务并处理
         """
         while True:
             try:
-                next_time, data, retry_count = self.queue.get(timeout=1)
-                # 如果还没到执行时间，放回队列
-                now = time.time()
-                if now < next_time:
-                    self.queue.put((next_time, data, retry_count))
-                    time.sleep(60)
-                    continue
+                task_id, data, retry_count = self._take()
                 # 执行任务
                 try:
                     self.process_func(data)
-                    logger.debug(f"✅ 成功处理: {data}")
+                    logger.debug("✅ 成功处理: %s", data)
+                    self._task_done(task_id)
                 except Exception as e:
                     retry_count += 1
+                    if self.metrics:
+                        self.metrics.failed(retry_count)
                     if retry_count < self.max_retries:
                         delay = (2 ** retry_count) * self.base_delay
                         delay = min(delay, self.max_backoff)
                         # 添加抖动
                         if self.jitter:
                             delay += random.uniform(0, 1)
-                        next_run_time = now + delay
-                        self.queue.put((next_run_time, data, retry_count))
+                        self._reschedule(task_id, time.time() + delay, data, retry_count)
                         logger.warning(f"🔁 {data} 第 {retry_count} 次失败，{delay:.2f}s 后重试")
                     else:
                         logger.error(f"💀 {data} 达到最大重试次数 {self.max_retries}，放弃")
-                        if self.dead_letter_callback:
-                            self.dead_letter_callback(data, retry_count, e)
-                finally:
-                    self.queue.task_done()
-            except queue.Empty:
-                continue
+                        if self.metrics:
+                            self.metrics.dead_letters.inc()
+                        try:
+                            if self.dead_letter_callback:
+                                self.dead_letter_callback(data, retry_count, e)
+                        finally:
+                            self._task_done(task_id)
             except Exception as e:
                 logger.exception(f"Worker 发生未预期错误: {e}")
 
     def join(self):
-        """等待所有任务完成"""
-        self.queue.join()
+        """等待所有任务完成（包括等待中的重试）"""
+        with self._all_done:
+            while self._unfinished > 0:
+                self._all_done.wait()
+
+    def sync(self):
+        """把已加入的任务立即写入持久化存储（确认模式下回确认前调用）"""
+        with self._cond:
+            self._store.sync()
+
+    def close(self):
+        """关闭任务存储，未落盘的写操作会被提交"""
+        with self._cond:
+            self._store.close()
+
+    def qsize(self) -> int:
+        """等待执行的任务数量（近似值）"""
+        return len(self._store)
 
     def _stat_queue(self):
         """返回队列中任务数量（近似值）"""
         while True:
             try:
-                logger.info("backoff queue size: %d", self.queue.qsize())
+                logger.info("backoff queue size: %d", self.qsize())
             except Exception as e:
                 logger.exception(e)
             finally:
@@ -0,0 +1,254 @@
+# -*- coding:utf-8 -*-
+# @FileName  :back_off_store.py
+# @Time      :2026/10/17 11:03
+# @Author    :shi lei.wei  <slwei@eppei.com>.
+# 指数退避队列的任务存储：内存最小堆 / SQLite WAL 持久化
+import heapq
+import itertools
+import logging
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class BackoffStoreFull(Exception):
+    """持久化存储超过磁盘预算"""
+    pass
+
+
+class MemoryBackoffStore:
+    """
+    内存存储，基于最小堆: (next_run_time, seq, data, retry_count)
+    进程重启后数据丢失
+    """
+
+    def __init__(self):
+        self._heap = []
+        self._seq = itertools.count()
+
+    def put(self, next_run_time: float, data: Any, retry_count: int = 0):
+        heapq.heappush(self._heap, (next_run_time, next(self._seq), data, retry_count))
+
+    def next_run_time(self) -> Optional[float]:
+        return self._heap[0][0] if self._heap else None
+
+    def take(self) -> Tuple[Any, Any, int]:
+        """弹出最早到期的任务，返回 (task_id, data, retry_count)"""
+        _, _, data, retry_count = heapq.heappop(self._heap)
+        return None, data, retry_count
+
+    def reschedule(self, task_id, next_run_time: float, data: Any, retry_count: int):
+        self.put(next_run_time, data, retry_count)
+
+    def done(self, task_id):
+        pass
+
+    def sync(self):
+        pass
+
+    def __len__(self):
+        return len(self._heap)
+
+    def close(self):
+        pass
+
+
+class SqliteBackoffStore:
+    """
+    SQLite WAL 持久化存储，按 next_run_time 建索引，只在内存中缓存最早到期时间，
+    数十万条待重试数据不会常驻内存。
+    - 批量 fsync：写操作累积在同一个事务中，满 sync_batch 条或 sync_interval 秒提交一次
+    - 磁盘预算：超过 max_entries 条或 max_bytes 字节时拒绝写入
+    - 压缩：完成的任务直接删除，定期 checkpoint 截断 WAL 并回收空闲页
+    - 重放：启动时把上次进程中正在处理（leased）的任务恢复为待执行
+    - 刷盘线程在第一次写操作时启动（按进程），构造时不创建线程
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_entries: int = 500000,
+        max_bytes: int = 1024 * 1024 * 1024,
+        sync_batch: int = 256,
+        sync_interval: float = 1.0,
+        compact_interval: float = 300.0,
+        dumps: Callable[[Any], bytes] = pickle.dumps,
+        loads: Callable[[bytes], Any] = pickle.loads
+    ):
+        """
+        :param path: 数据库文件路径
+        :param max_entries: 最多保存的任务条数
+        :param max_bytes: 任务数据最多占用的字节数
+        :param sync_batch: 累积多少次写操作提交一次
+        :param sync_interval: 最长多少秒提交一次
+        :param compact_interval: 多少秒执行一次 checkpoint 与空闲页回收
+        :param dumps: 任务数据序列化函数
+        :param loads: 任务数据反序列化函数
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.sync_batch = sync_batch
+        self.sync_interval = sync_interval
+        self.compact_interval = compact_interval
+        self.dumps = dumps
+        self.loads = loads
+        dir_name = os.path.dirname(path)
+        if dir_name:
+            os.makedirs(dir_name, exist_ok=True)
+        self._lock = threading.RLock()
+        # 手动管理事务
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS backoff_tasks (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                next_run_time REAL NOT NULL,
+                retry_count INTEGER NOT NULL,
+                leased INTEGER NOT NULL DEFAULT 0,
+                payload BLOB NOT NULL
+            )
+        ''')
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_backoff_due ON backoff_tasks (leased, next_run_time)")
+        # 重放：上次退出时正在处理的任务重新变为待执行
+        replayed = self._conn.execute("UPDATE backoff_tasks SET leased=0 WHERE leased=1").rowcount
+        self._count, self._bytes = self._conn.execute(
+            "SELECT COUNT(*), IFNULL(SUM(LENGTH(payload)), 0) FROM backoff_tasks").fetchone()
+        self._next_time = None
+        self._next_time_dirty = True
+        self._dirty_ops = 0
+        self._last_commit = time.time()
+        self._conn.execute("BEGIN")
+        logger.info("backoff store %s 加载 %d 条任务（%d 条重放）", path, self._count, replayed)
+        self._running = True
+        self._flush_thread: Optional[threading.Thread] = None
+        self._flush_pid = None
+
+    def put(self, next_run_time: float, data: Any, retry_count: int = 0):
+        payload = self.dumps(data)
+        with self._lock:
+            if self._count >= self.max_entries or self._bytes + len(payload) > self.max_bytes:
+                raise BackoffStoreFull(f"backoff store full: {self._count} 条, {self._bytes} 字节")
+            self._conn.execute(
+                "INSERT INTO backoff_tasks (next_run_time, retry_count, payload) VALUES (?, ?, ?)",
+                (next_run_time, retry_count, payload))
+            self._count += 1
+            self._bytes += len(payload)
+            if not self._next_time_dirty and (self._next_time is None or next_run_time < self._next_time):
+                self._next_time = next_run_time
+            self._wrote()
+
+    def next_run_time(self) -> Optional[float]:
+        with self._lock:
+            if self._next_time_dirty:
+                row = self._conn.execute(
+                    "SELECT MIN(next_run_time) FROM backoff_tasks WHERE leased=0").fetchone()
+                self._next_time = row[0]
+                self._next_time_dirty = False
+            return self._next_time
+
+    def take(self) -> Tuple[Any, Any, int]:
+        """取出最早到期的任务并标记为处理中，返回 (task_id, data, retry_count)"""
+        with self._lock:
+            task_id, retry_count, payload = self._conn.execute(
+                "SELECT id, retry_count, payload FROM backoff_tasks WHERE leased=0 "
+                "ORDER BY next_run_time LIMIT 1").fetchone()
+            self._conn.execute("UPDATE backoff_tasks SET leased=1 WHERE id=?", (task_id,))
+            self._next_time_dirty = True
+            self._wrote()
+        return task_id, self.loads(payload), retry_count
+
+    def reschedule(self, task_id, next_run_time: float, data: Any, retry_count: int):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE backoff_tasks SET leased=0, next_run_time=?, retry_count=? WHERE id=?",
+                (next_run_time, retry_count, task_id))
+            if not self._next_time_dirty and (self._next_time is None or next_run_time < self._next_time):
+                self._next_time = next_run_time
+            self._wrote()
+
+    def done(self, task_id):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT LENGTH(payload) FROM backoff_tasks WHERE id=?", (task_id,)).fetchone()
+            if row:
+                self._conn.execute("DELETE FROM backoff_tasks WHERE id=?", (task_id,))
+                self._count -= 1
+                self._bytes -= row[0]
+            self._wrote()
+
+    def sync(self):
+        """立即提交未提交的写操作（不等 sync_batch / sync_interval）"""
+        with self._lock:
+            if self._dirty_ops:
+                self._commit()
+
+    def __len__(self):
+        return self._count
+
+    def _ensure_started(self):
+        """启动刷盘线程，调用方持有 self._lock"""
+        pid = os.getpid()
+        if self._flush_pid != pid and self._running:
+            self._flush_thread = threading.Thread(target=self._flush_loop, name="BackoffStore-Flush", daemon=True)
+            self._flush_thread.start()
+            self._flush_pid = pid
+
+    def _wrote(self):
+        """记录一次写操作，满批量时提交"""
+        self._ensure_started()
+        self._dirty_ops += 1
+        if self._dirty_ops >= self.sync_batch:
+            self._commit()
+
+    def _commit(self):
+        self._conn.execute("COMMIT")
+        self._conn.execute("BEGIN")
+        self._dirty_ops = 0
+        self._last_commit = time.time()
+
+    def _flush_loop(self):
+        """按时间间隔提交未落盘的写操作，并定期压缩"""
+        last_compact = time.time()
+        while self._running:
+            time.sleep(self.sync_interval)
+            try:
+                with self._lock:
+                    if not self._running:
+                        break
+                    if self._dirty_ops and time.time() - self._last_commit >= self.sync_interval:
+                        self._commit()
+                    if time.time() - last_compact >= self.compact_interval:
+                        self._compact()
+                        last_compact = time.time()
+            except Exception as e:
+                logger.exception(f"backoff store 刷盘异常: {e}")
+
+    def _compact(self):
+        self._conn.execute("COMMIT")
+        self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        self._conn.execute("PRAGMA incremental_vacuum")
+        self._conn.execute("BEGIN")
+        self._dirty_ops = 0
+        self._last_commit = time.time()
+
+    def close(self):
+        with self._lock:
+            self._running = False
+            self._conn.execute("COMMIT")
+            self._conn.close()
+
+
+def create_backoff_store(path: Optional[str] = None, max_entries: int = 500000, max_mb: int = 1024):
+    """根据配置创建任务存储，未配置路径时使用内存存储"""
+    if not path:
+        return MemoryBackoffStore()
+    return SqliteBackoffStore(path, max_entries=max_entries, max_bytes=max_mb * 1024 * 1024)
@@ -0,0 +1,114 @@
+# -*- coding:utf-8 -*-
+# @FileName  :bench_auth.py
+# @Time      :2026/10/18 05:00
+# @Author    :shi lei.wei  <slwei@eppei.com>.
+# 签名校验压测：对比改造前（每次拼接字符串 sha256 + == 比较，无防重放）与 SignatureAuth.verify（HMAC 预填充密钥 +
+# compare_digest + 共享内存防重放缓存）的每秒校验次数，并通过 Flask 测试客户端检查中间件的拒绝结果
+#   python bench_auth.py --count 200000
+import argparse
+import hashlib
+import json
+import os
+import tempfile
+import time
+import uuid
+
+from flask import Flask, jsonify
+
+from config_manager import ConfigManager
+
+API_KEY = "bench-key"
+SECRET = "bench-secret-0123456789abcdef"
+
+
+def old_verify(api_keys, api_key, timestamp, signature):
+    """改造前的 LoginApi.verify_signature"""
+    if api_key not in api_keys:
+        return False
+    if abs(int(time.time()) - int(timestamp)) > 300:
+        return False
+    secret_key = api_keys[api_key]
+    expected_signature = hashlib.sha256(f"{api_key}{timestamp}{secret_key}".encode()).hexdigest()
+    return signature == expected_signature
+
+
+def main():
+    parser = argparse.ArgumentParser(description="接口签名校验压测")
+    parser.add_argument("--count", type=int, default=100000, help="每种方式的校验次数")
+    parser.add_argument("--slots", type=int, default=262144, help="auth_nonce_slots")
+    args = parser.parse_args()
+
+    # 只使用本脚本的参数，不读取 config.json
+    fd, config_path = tempfile.mkstemp(suffix=".json")
+    with os.fdopen(fd, "w") as f:
+        json.dump({"api_keys": {API_KEY: SECRET}, "auth_paths": ["/api/data"], "auth_nonce_slots": args.slots}, f)
+    ConfigManager.load_config(config_path)
+    try:
+        import auth_util
+        auth = auth_util.SignatureAuth()
+        timestamp = str(int(time.time()))
+        path = "/api/available_unit"
+
+        legacy = auth_util.legacy_sign(API_KEY, SECRET, timestamp)
+        start = time.perf_counter()
+        for _ in range(args.count):
+            assert old_verify({API_KEY: SECRET}, API_KEY, timestamp, legacy)
+        elapsed = time.perf_counter() - start
+        print(f"改造前     {args.count / elapsed:>9.0f} 次/秒  {elapsed / args.count * 1e6:.2f} 微秒/次（无防重放）")
+
+        # 每次请求不同的 nonce，签名由客户端预先算好，只统计服务端校验
+        requests = []
+        for _ in range(args.count):
+            nonce = uuid.uuid4().hex
+            requests.append((nonce, auth_util.sign(API_KEY, SECRET, timestamp, nonce, "GET", path)))
+        start = time.perf_counter()
+        for nonce, signature in requests:
+            assert auth.verify(API_KEY, timestamp, nonce, signature, "GET", path) == "ok"
+        elapsed = time.perf_counter() - start
+        print(f"HMAC+nonce {args.count / elapsed:>9.0f} 次/秒  {elapsed / args.count * 1e6:.2f} 微秒/次，"
+              f"覆盖未过期 nonce {auth.nonces.evictions()} 条")
+        replays = sum(auth.verify(API_KEY, timestamp, nonce, signature, "GET", path) == "replay"
+                      for nonce, signature in requests[-1000:])
+        print(f"重放最近 1000 个请求，拒绝 {replays} 个")
+
+        # 中间件：before_request 统一校验 auth_paths，require 装饰器校验单个接口
+        app = Flask(__name__)
+        auth.init_app(app)
+        app.add_url_rule("/api/data", "data", lambda: jsonify({"status": "success"}), methods=["POST"])
+        app.add_url_rule(path, "unit", auth.require(lambda: jsonify({"unit": 1})))
+        client = app.test_client()
+
+        def headers(method, url, nonce=None, **override):
+            nonce = nonce or uuid.uuid4().hex
+            ts = str(int(time.time()))
+            result = {"X-API-Key": API_KEY, "X-Timestamp": ts, "X-Nonce": nonce,
+                      "X-Signature": auth_util.sign(API_KEY, SECRET, ts, nonce, method, url)}
+            result.update(override)
+            return {k: v for k, v in result.items() if v is not None}
+
+        replayed = headers("GET", path)
+        cases = [
+            ("正确签名", 200, lambda: client.get(path, headers=replayed)),
+            ("重放", 401, lambda: client.get(path, headers=replayed)),
+            ("缺少请求头", 401, lambda: client.get(path, headers=headers("GET", path, **{"X-Signature": None}))),
+            ("签名错误", 401, lambda: client.get(path, headers=headers("GET", path, **{"X-Signature": "0" * 64}))),
+            ("换用其他接口", 401, lambda: client.post("/api/data", headers=headers("GET", path))),
+            ("时间戳过期", 401, lambda: client.get(path, headers=headers("GET", path, **{"X-Timestamp": "1"}))),
+            ("旧客户端签名", 200, lambda: client.get(path, headers={
+                "X-API-Key": API_KEY, "X-Timestamp": timestamp, "X-Signature": legacy})),
+            # 共用 API Key 的另一台机器同一秒内的旧签名完全相同，不能当作重放拒绝
+            ("旧签名同一秒", 200, lambda: client.get(path, headers={
+                "X-API-Key": API_KEY, "X-Timestamp": timestamp, "X-Signature": legacy})),
+            ("中间件保护接收数据", 200, lambda: client.post("/api/data", headers=headers("POST", "/api/data"))),
+            ("接收数据未签名", 401, lambda: client.post("/api/data")),
+        ]
+        for name, expected, call in cases:
+            response = call()
+            print(f"{name:<10} {response.status_code} {'正确' if response.status_code == expected else '错误'} "
+                  f"{response.get_data(as_text=True).strip()}")
+    finally:
+        os.unlink(config_path)
+
+
+if __name__ == "__main__":
+    main()
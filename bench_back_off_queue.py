@@ -0,0 +1,51 @@
+# -*- coding:utf-8 -*-
+# @FileName  :bench_back_off_queue.py
+# @Time      :2026/10/17 10:12
+# @Author    :shi lei.wei  <slwei@eppei.com>.
+# 退避队列重试时延精度压测：预先放入大量待重试任务，统计实际执行时间相对到期时间的偏差
+import argparse
+import threading
+import time
+
+from back_off_queue import ExponentialBackoffQueue
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    idx = min(len(sorted_values) - 1, int(len(sorted_values) * p / 100))
+    return sorted_values[idx]
+
+
+def run(pending, spread, workers):
+    lateness = []
+    lock = threading.Lock()
+
+    def process(due_time):
+        late = time.time() - due_time
+        with lock:
+            lateness.append(late)
+
+    ebq = ExponentialBackoffQueue(process_func=process, worker_count=workers)
+    start = time.time()
+    for i in range(pending):
+        # 到期时间均匀分布在 [1, 1 + spread) 秒之间，模拟大量挂起的重试
+        delay = 1.0 + spread * i / pending
+        ebq.add_task(start + delay, delay=delay - (time.time() - start))
+    enqueue_cost = time.time() - start
+    ebq.join()
+    total = time.time() - start
+    lateness.sort()
+    print(f"pending={pending} spread={spread}s workers={workers}")
+    print(f"  入队耗时: {enqueue_cost:.3f}s  总耗时: {total:.3f}s")
+    print(f"  延迟偏差(ms) p50={percentile(lateness, 50) * 1000:.2f} "
+          f"p99={percentile(lateness, 99) * 1000:.2f} max={lateness[-1] * 1000:.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="ExponentialBackoffQueue 重试时延精度压测")
+    parser.add_argument("--pending", type=int, default=100000)
+    parser.add_argument("--spread", type=float, default=10.0, help="到期时间分布区间（秒）")
+    parser.add_argument("--workers", type=int, default=2)
+    args = parser.parse_args()
+    run(args.pending, args.spread, args.workers)
@@ -0,0 +1,42 @@
+# -*- coding:utf-8 -*-
+# @FileName  :bench_codec.py
+# @Time      :2026/10/17 18:10
+# @Author    :shi lei.wei  <slwei@eppei.com>.
+# 各压缩算法在真实样本上的压缩比与吞吐，样本格式同 train_zstd_dict.py
+import argparse
+import time
+
+import codec_util
+from config_manager import ConfigManager
+from train_zstd_dict import load_samples
+
+
+def bench(codec, samples, rounds):
+    raw = sum(len(s) for s in samples)
+    start = time.perf_counter()
+    for _ in range(rounds):
+        compressed = [codec.compress(s) for s in samples]
+    compress_cost = time.perf_counter() - start
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for c in compressed:
+            codec.decompress(c)
+    decompress_cost = time.perf_counter() - start
+    size = sum(len(c) for c in compressed)
+    mb = raw * rounds / 1024 / 1024
+    print(f"{codec.name:<6} 压缩比 {raw / size:6.2f}  压缩 {mb / compress_cost:8.1f} MB/s  "
+          f"解压 {mb / decompress_cost:8.1f} MB/s  ({len(samples) * rounds / compress_cost:,.0f} 条/s)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="压缩算法压缩比与吞吐对比")
+    parser.add_argument("samples", nargs="+", help="样本文件或目录，如 requests.jsonl")
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--zstd-dict", help="zstd 字典路径，不指定时 zstd 不使用字典")
+    args = parser.parse_args()
+    ConfigManager._data = {}
+    ConfigManager._param = {"zstd_dict_path": args.zstd_dict}
+    data = load_samples(args.samples)
+    print(f"样本 {len(data)} 条, 平均 {sum(len(s) for s in data) / len(data):.0f} 字节")
+    for name in codec_util.available_codecs():
+        bench(codec_util.get_codec_by_name(name), data, args.rounds)
@@ -0,0 +1,152 @@
+# -*- coding:utf-8 -*-
+# @FileName  :bench_http_load.py
+# @Time      :2026/10/17 23:00
+# @Author    :shi lei.wei  <slwei@eppei.com>.
+# 接口压测：并发请求 /api/data，同时低频访问 /api/health 与 /api/login_status，
+# 统计各接口吞吐、状态码与 p50/p99 延迟，用于对比 gunicorn sync 与 gthread 模式
+# 不连接内网客户端时，发布进程发不出数据，ingest 队列很快饱和，/api/data 进入阻塞/503 状态
+#
+# 压测已运行的服务:
+#   python bench_http_load.py --url http://127.0.0.1:6100
+# 依次以两种模式启动服务并压测（需要安装 gunicorn）:
+#   python bench_http_load.py --spawn sync,gthread
+import argparse
+import http.client
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from urllib.parse import urlsplit
+
+
+class Recorder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(Counter)
+
+    def add(self, name, latency, status):
+        with self._lock:
+            self.latencies[name].append(latency)
+            self.statuses[name][status] += 1
+
+    def report(self, elapsed):
+        for name in sorted(self.latencies):
+            values = sorted(self.latencies[name])
+            p50 = values[len(values) // 2] * 1000
+            p99 = values[min(len(values) - 1, int(len(values) * 0.99))] * 1000
+            print(f"  {name:<18} 请求={len(values):>7} RPS={len(values) / elapsed:>8.1f} "
+                  f"p50={p50:>8.1f}ms p99={p99:>8.1f}ms 状态码={dict(self.statuses[name])}")
+
+
+def request_loop(host, port, name, method, path, body, headers, deadline, recorder, interval=0.0):
+    """单个连接循环发送请求（keep-alive），连接异常时重建"""
+    conn = None
+    while time.time() < deadline:
+        start = time.perf_counter()
+        try:
+            if conn is None:
+                conn = http.client.HTTPConnection(host, port, timeout=30)
+                conn.connect()
+                # 请求头与请求体分两次发送，关闭 Nagle 避免与延迟确认叠加出 40ms 延迟
+                conn.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            conn.request(method, path, body=body, headers=headers)
+            response = conn.getresponse()
+            response.read()
+            status = response.status
+            if response.getheader("Connection", "").lower() == "close":
+                conn.close()
+                conn = None
+        except Exception as e:
+            status = type(e).__name__
+            if conn:
+                conn.close()
+            conn = None
+        recorder.add(name, time.perf_counter() - start, status)
+        if interval:
+            time.sleep(interval)
+    if conn:
+        conn.close()
+
+
+def run(url, concurrency, duration, payload_size):
+    parts = urlsplit(url)
+    host, port = parts.hostname, parts.port or 80
+    # 首字节 0x81 的二进制信封，服务端只校验首字节，不解密
+    payload = bytes([0x81]) + os.urandom(payload_size - 1)
+    deadline = time.time() + duration
+    recorder = Recorder()
+    threads = [threading.Thread(target=request_loop, args=(
+        host, port, "POST /api/data", "POST", "/api/data", payload,
+        {"Content-Type": "application/octet-stream"}, deadline, recorder)) for _ in range(concurrency)]
+    # 其他接口的探测请求，观察是否被 /api/data 的阻塞拖慢
+    threads.append(threading.Thread(target=request_loop, args=(
+        host, port, "GET /api/health", "GET", "/api/health", None, {}, deadline, recorder, 0.1)))
+    threads.append(threading.Thread(target=request_loop, args=(
+        host, port, "GET /api/login_status", "GET", "/api/login_status?limit=10", None, {}, deadline, recorder,
+        0.1)))
+    start = time.time()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    recorder.report(time.time() - start)
+
+
+def wait_ready(url, timeout=30):
+    parts = urlsplit(url)
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=2)
+            conn.request("GET", "/api/health")
+            conn.getresponse().read()
+            conn.close()
+            return True
+        except OSError:
+            time.sleep(0.5)
+    return False
+
+
+def spawn(mode, port):
+    """以指定模式启动 gunicorn，日志输出到标准错误"""
+    env = dict(os.environ, GUNICORN_WORKER_CLASS=mode)
+    return subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "-b", f"127.0.0.1:{port}",
+         "--access-logfile", "/dev/null", "--error-logfile", "-", "zeromq_server:gun_app"],
+        env=env, cwd=os.path.dirname(os.path.abspath(__file__)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HTTP 接口压测")
+    parser.add_argument("--url", default="http://127.0.0.1:6100")
+    parser.add_argument("--spawn", default="", help="依次启动的 gunicorn 模式，如 sync,gthread")
+    parser.add_argument("--port", type=int, default=6180, help="--spawn 时服务监听的端口")
+    parser.add_argument("--concurrency", type=int, default=64, help="/api/data 并发连接数")
+    parser.add_argument("--duration", type=float, default=30.0)
+    parser.add_argument("--payload-size", type=int, default=2048)
+    args = parser.parse_args()
+
+    if not args.spawn:
+        print(f"压测 {args.url}")
+        run(args.url, args.concurrency, args.duration, args.payload_size)
+        return
+    url = f"http://127.0.0.1:{args.port}"
+    for mode in args.spawn.split(","):
+        server = spawn(mode, args.port)
+        try:
+            if not wait_ready(url):
+                print(f"{mode}: 服务启动失败")
+                continue
+            print(f"模式 {mode}:")
+            run(url, args.concurrency, args.duration, args.payload_size)
+        finally:
+            server.terminate()
+            server.wait(30)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+# -*- coding:utf-8 -*-
+# @FileName  :bench_ingest_broker.py
+# @Time      :2026/10/17 13:40
+# @Author    :shi lei.wei  <slwei@eppei.com>.
+# 入口吞吐压测：多进程共享 multiprocessing.Queue（旧方案） vs ipc PUSH/PULL 汇聚到发布进程（新方案）
+# 注意：zeromq_server 在 import 时会创建应用，这里按两种方案的数据路径独立复现
+import argparse
+import multiprocessing
+import os
+import struct
+import time
+from queue import Empty
+
+import zmq
+
+_TS_FORMAT = struct.Struct("!d")
+
+
+def _queue_producer(q, count, payload):
+    for _ in range(count):
+        q.put({"payload": payload.decode("utf-8"), "received_at": time.time()})
+
+
+def _queue_consumer(q, total, result):
+    start = None
+    received = 0
+    while received < total:
+        try:
+            item = q.get(timeout=5)
+        except Empty:
+            break
+        if start is None:
+            start = time.time()
+        item["payload"].encode("utf-8")
+        received += 1
+    result.put((received, time.time() - (start or time.time())))
+
+
+def bench_queue(workers, count, payload):
+    q = multiprocessing.Queue(maxsize=1000)
+    result = multiprocessing.Queue()
+    consumer = multiprocessing.Process(target=_queue_consumer, args=(q, workers * count, result))
+    consumer.start()
+    producers = [multiprocessing.Process(target=_queue_producer, args=(q, count, payload)) for _ in range(workers)]
+    start = time.time()
+    for p in producers:
+        p.start()
+    for p in producers:
+        p.join()
+    consumer.join()
+    received, _ = result.get()
+    return received, time.time() - start
+
+
+def _ipc_producer(address, count, payload):
+    sock = zmq.Context.instance().socket(zmq.PUSH)
+    sock.setsockopt(zmq.SNDHWM, 1000)
+    sock.setsockopt(zmq.IMMEDIATE, 1)
+    sock.connect(address)
+    for _ in range(count):
+        sock.send_multipart([_TS_FORMAT.pack(time.time()), payload], copy=False)
+    sock.close(linger=-1)
+
+
+def _ipc_consumer(address, total, result, ready):
+    sock = zmq.Context.instance().socket(zmq.PULL)
+    sock.setsockopt(zmq.RCVHWM, 1000)
+    sock.setsockopt(zmq.RCVTIMEO, 5000)
+    sock.bind(address)
+    ready.set()
+    received = 0
+    while received < total:
+        try:
+            ts_frame, payload = sock.recv_multipart()
+        except zmq.Again:
+            break
+        _TS_FORMAT.unpack(ts_frame)
+        received += 1
+    result.put(received)
+    sock.close()
+
+
+def bench_ipc(workers, count, payload):
+    address = f"ipc:///tmp/bench-ingest-{os.getpid()}.ipc"
+    result = multiprocessing.Queue()
+    ready = multiprocessing.Event()
+    consumer = multiprocessing.Process(target=_ipc_consumer, args=(address, workers * count, result, ready))
+    consumer.start()
+    ready.wait()
+    producers = [multiprocessing.Process(target=_ipc_producer, args=(address, count, payload))
+                 for _ in range(workers)]
+    start = time.time()
+    for p in producers:
+        p.start()
+    for p in producers:
+        p.join()
+    consumer.join()
+    return result.get(), time.time() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="multiprocessing.Queue 与 ipc 汇聚的入口吞吐对比")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--count", type=int, default=20000, help="每个 worker 发送条数")
+    parser.add_argument("--size", type=int, default=4096, help="单条数据字节数")
+    args = parser.parse_args()
+    data = b"A" * args.size
+    for n in args.workers:
+        for name, func in (("mp.Queue", bench_queue), ("ipc fan-in", bench_ipc)):
+            received, cost = func(n, args.count, data)
+            print(f"{name:<10} workers={n:<3} 接收 {received} 条, 耗时 {cost:.3f}s, {received / cost:,.0f} msg/s")
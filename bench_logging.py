@@ -0,0 +1,119 @@
+# -*- coding:utf-8 -*-
+# @FileName  :bench_logging.py
+# @Time      :2026/10/18 03:10
+# @Author    :shi lei.wei  <slwei@eppei.com>.
+# 高频路径日志压测：INFO 级别下，模拟发布循环与 DataSubscriber.process_data 每条数据的日志，比较
+#   改造前：f-string 立即格式化 + 每条 5 行 + 调用线程直接写文件
+#   后台写：同样的日志，文件 I/O 交给 BackgroundHandler 的后台线程
+#   改造后：HotLogger（惰性格式化、采样、限速）+ BackgroundHandler
+#   python bench_logging.py --count 200000 --threads 4
+import argparse
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+from datetime import datetime
+from logging.handlers import TimedRotatingFileHandler
+
+import log
+from config_manager import ConfigManager
+
+FORMAT = "%(asctime)s %(name)s PID:%(process)d %(processName)s %(filename)s %(funcName)s[line:%(lineno)d] " \
+         "%(levelname)s %(threadName)s - %(message)s"
+
+
+def make_payload():
+    return {"task_name": "t_top", "payload": {
+        "sequence": 1, "timestamp": time.time(), "data": {"rows": [{"id": i, "value": i * 1.5} for i in range(50)]}}}
+
+
+def old_style(logger, data, process_time):
+    """改造前的写法"""
+    logger.info("zmq push data: %d 条, %s", 1, str(time.time()))
+    inner_payload = data.get('payload', 'N/A')
+    sequence = inner_payload.get('sequence', 'N/A')
+    timestamp = inner_payload.get('timestamp', 'N/A')
+    data_size = len(str(inner_payload.get('data', '')))
+    logger.info(f"[数据] 接收消息 #{sequence}")
+    logger.info(
+        f"      时间戳: {datetime.fromtimestamp(timestamp) if isinstance(timestamp, (int, float)) else timestamp}")
+    logger.info(f"      数据大小: {data_size} 字节")
+    logger.info(f"      处理耗时: {process_time:.3f} 秒")
+
+
+def new_style(hot_logger, data, process_time):
+    """改造后的写法（与 zeromq_server、zeremq_client 相同）"""
+    hot_logger.info("publish", "zmq push data: %d 条, %s", 1, time.time())
+    inner_payload = data.get('payload', 'N/A')
+    timestamp = inner_payload.get('timestamp', 'N/A')
+    hot_logger.info(
+        "data", "[数据] 接收消息 #%s, 时间戳: %s, 数据大小: %d 字节, 处理耗时: %.3f 秒",
+        inner_payload.get('sequence', 'N/A'),
+        lambda: datetime.fromtimestamp(timestamp) if isinstance(timestamp, (int, float)) else timestamp,
+        lambda: len(str(inner_payload.get('data', ''))), process_time)
+
+
+def run(name, count, threads, path, background, hot):
+    file_handler = TimedRotatingFileHandler(path, when="midnight", backupCount=1, encoding="utf-8")
+    file_handler.setFormatter(logging.Formatter(FORMAT))
+    logger = logging.getLogger(f"bench.{name}")
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    handler = log.BackgroundHandler([file_handler]) if background else file_handler
+    logger.addHandler(handler)
+    hot_logger = log.HotLogger(logger)
+    data = make_payload()
+    per_thread = count // threads
+
+    def work():
+        for _ in range(per_thread):
+            if hot:
+                new_style(hot_logger, data, 0.001)
+            else:
+                old_style(logger, data, 0.001)
+
+    workers = [threading.Thread(target=work) for _ in range(threads)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - start
+    if background:
+        handler.stop()
+    flushed = time.perf_counter() - start
+    file_handler.close()
+    with open(path, "rb") as f:
+        lines = sum(1 for _ in f)
+    print(f"{name:<8} {per_thread * threads / elapsed:>10.0f} 条/秒  写出 {lines:>8} 行  "
+          f"总耗时 {flushed:.2f}s（含写完后台队列）")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="INFO 级别下每条数据的日志开销")
+    parser.add_argument("--count", type=int, default=100000, help="模拟的数据条数")
+    parser.add_argument("--threads", type=int, default=4, help="并发线程数（gunicorn 线程 / 转发线程）")
+    parser.add_argument("--rate", type=int, default=10, help="log_hot_rate")
+    parser.add_argument("--sample", type=int, default=1, help="log_hot_sample")
+    args = parser.parse_args()
+
+    # 只使用本脚本的参数，不读取 config.json
+    fd, config_path = tempfile.mkstemp(suffix=".json")
+    with os.fdopen(fd, "w") as f:
+        json.dump({"log_hot_rate": args.rate, "log_hot_sample": args.sample}, f)
+    ConfigManager.load_config(config_path)
+    directory = tempfile.mkdtemp(prefix="bench_logging_")
+    try:
+        run("改造前", args.count, args.threads, os.path.join(directory, "old.log"), background=False, hot=False)
+        run("后台写", args.count, args.threads, os.path.join(directory, "bg.log"), background=True, hot=False)
+        run("改造后", args.count, args.threads, os.path.join(directory, "new.log"), background=True, hot=True)
+    finally:
+        os.unlink(config_path)
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
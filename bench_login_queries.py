@@ -0,0 +1,93 @@
+# -*- coding:utf-8 -*-
+# @FileName  :bench_login_queries.py
+# @Time      :2026/10/17 20:50
+# @Author    :shi lei.wei  <slwei@eppei.com>.
+# 登录记录查询压测：构造大表（默认 1000 万行），对比迁移前（TEXT 时间、无索引）与迁移后（ts 列 + 索引）的查询耗时
+import argparse
+import os
+import random
+import tempfile
+import time
+from datetime import datetime
+
+import login_db
+
+UNITS = [f"unit-{i}" for i in range(1, 38)]
+
+OLD_QUERIES = {
+    "最近记录": ("SELECT id, unit, unit_id, timestamp, machine, state, ip FROM logins "
+             "ORDER BY timestamp DESC LIMIT 10", ()),
+    "单位最近记录": ("SELECT id, unit, unit_id, timestamp, machine, state, ip FROM logins "
+               "WHERE unit=? ORDER BY timestamp DESC LIMIT 10", ("unit-7",)),
+    "今日登录单位": ("SELECT unit_id FROM logins WHERE date(timestamp) = date('now') AND state=1", ()),
+}
+
+
+def new_queries():
+    start, end = login_db.day_bounds()
+    return {
+        "最近记录": ("SELECT id, unit, unit_id, timestamp, machine, state, ip FROM logins "
+                 "ORDER BY ts DESC LIMIT 10", ()),
+        "单位最近记录": ("SELECT id, unit, unit_id, timestamp, machine, state, ip FROM logins "
+                   "WHERE unit=? ORDER BY ts DESC LIMIT 10", ("unit-7",)),
+        "今日登录单位": ("SELECT unit_id FROM logins WHERE state=1 AND ts >= ? AND ts < ?", (start, end)),
+        # 写入时维护的每日汇总（迁移 v4），行数为当天登录过的账号数
+        "今日登录单位(汇总)": ("SELECT unit_id FROM daily_units WHERE day=? AND logins > 0",
+                         (login_db.day_key(time.time()),)),
+    }
+
+
+def build(db_path, rows, days):
+    """按 v1 表结构写入 rows 行，时间均匀分布在最近 days 天"""
+    conn = login_db.connect(db_path)
+    login_db.MIGRATIONS[0](conn)
+    conn.execute("PRAGMA user_version = 1")
+    now = time.time()
+    batch = 100000
+    rnd = random.Random(1)
+    start = time.perf_counter()
+    for offset in range(0, rows, batch):
+        conn.execute("BEGIN")
+        conn.executemany(
+            "INSERT INTO logins (unit, unit_id, timestamp, machine, state, ip) VALUES (?, ?, ?, ?, ?, ?)",
+            ((UNITS[i % len(UNITS)], i % len(UNITS) + 1,
+              datetime.fromtimestamp(now - days * 86400 * (1 - i / rows)).strftime("%Y/%m/%d %H:%M:%S"),
+              f"machine-{rnd.randrange(5000)}", i % 2, "10.0.0.1")
+             for i in range(offset, min(rows, offset + batch)))
+        )
+        conn.execute("COMMIT")
+    print(f"写入 {rows} 行耗时 {time.perf_counter() - start:.1f}s")
+    return conn
+
+
+def measure(conn, queries, repeat):
+    for name, (sql, params) in queries.items():
+        plan = "; ".join(row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params))
+        start = time.perf_counter()
+        for _ in range(repeat):
+            result = conn.execute(sql, params).fetchall()
+        cost = (time.perf_counter() - start) / repeat
+        print(f"  {name:<8} {cost * 1000:>10.2f}ms  行数={len(result):>6}  {plan}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="登录记录查询压测")
+    parser.add_argument("--rows", type=int, default=10000000)
+    parser.add_argument("--days", type=int, default=365, help="数据分布的天数")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = build(os.path.join(tmp, "logins.db"), args.rows, args.days)
+        print("迁移前（TEXT 时间，无索引）:")
+        measure(conn, OLD_QUERIES, args.repeat)
+        start = time.perf_counter()
+        login_db.migrate(conn)
+        print(f"迁移到版本 {len(login_db.MIGRATIONS)} 耗时 {time.perf_counter() - start:.1f}s")
+        print("迁移后（ts 列 + 索引）:")
+        measure(conn, new_queries(), args.repeat * 100)
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
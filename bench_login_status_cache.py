@@ -0,0 +1,81 @@
+# -*- coding:utf-8 -*-
+# @FileName  :bench_login_status_cache.py
+# @Time      :2026/10/18 03:50
+# @Author    :shi lei.wei  <slwei@eppei.com>.
+# GET /api/login_status 读缓存压测：看板以相同参数轮询，对比不缓存与缓存（按提交代数失效）的每秒请求数，
+# 并检查有新的登录记录提交后下一次请求能读到
+# 在临时目录中建库，不影响当前目录的 login_status.db
+#   python bench_login_status_cache.py --rows 200000 --requests 20000
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+
+from flask import Flask
+
+from config_manager import ConfigManager
+
+
+def main():
+    parser = argparse.ArgumentParser(description="GET /api/login_status 读缓存压测")
+    parser.add_argument("--rows", type=int, default=200000, help="预先写入的登录记录条数")
+    parser.add_argument("--requests", type=int, default=20000, help="每种模式的请求数")
+    parser.add_argument("--keys", type=int, default=8, help="不同的 (unit, limit) 组合数")
+    args = parser.parse_args()
+
+    ConfigManager.load_config(os.path.abspath("config.json"))
+    directory = tempfile.mkdtemp(prefix="bench_login_status_")
+    cwd = os.getcwd()
+    os.chdir(directory)
+    try:
+        import login_api
+        app = Flask(__name__)
+        api = login_api.LoginApi(app)
+        units = list(ConfigManager.get_param_by_key("unit_name"))
+        for i in range(args.rows):
+            login_api.db_writer.add(units[i % len(units)], i % len(units) + 1,
+                                    time.strftime("%Y/%m/%d %H:%M:%S"), f"machine-{i % 500}", 1, "10.0.0.1")
+        login_api.db_writer.flush()
+        client = app.test_client()
+        urls = [f"/api/login_status?unit={units[i % len(units)]}&limit={10 + i}" for i in range(args.keys)]
+
+        def run(name):
+            start = time.perf_counter()
+            for i in range(args.requests):
+                response = client.get(urls[i % len(urls)])
+                assert response.status_code == 200
+            elapsed = time.perf_counter() - start
+            print(f"{name:<6} {args.requests / elapsed:>8.0f} 请求/秒  缓存: {login_api.status_cache.stats()}")
+
+        cache_size = login_api.status_cache.max_entries
+        login_api.status_cache.max_entries = 0
+        run("不缓存")
+        login_api.status_cache.max_entries = cache_size
+        run("缓存")
+
+        # 不含 HTTP 处理：查询 + 编码 与 缓存命中
+        keys = [(units[i % len(units)], 10 + i) for i in range(args.keys)]
+        for name, func in (("查询+编码", lambda key: api._query_status(*key)),
+                           ("缓存命中", lambda key: login_api.status_cache.get_or_load(key, None))):
+            start = time.perf_counter()
+            for i in range(args.requests):
+                func(keys[i % len(keys)])
+            print(f"{name:<6} {(time.perf_counter() - start) / args.requests * 1e6:>8.1f} 微秒/次")
+
+        # 新提交后缓存失效
+        before = client.get(urls[0]).get_data()
+        login_api.db_writer.add(units[0], 1, time.strftime("%Y/%m/%d %H:%M:%S"), "machine-new", 1, "10.0.0.2")
+        login_api.db_writer.flush()
+        after = json.loads(client.get(urls[0]).get_data())
+        ok = after[0]["machine"] == "machine-new" and before != client.get(urls[0]).get_data()
+        print("提交后读到新记录: " + ("是" if ok else "否"))
+        login_api.db_writer.close()
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+# -*- coding:utf-8 -*-
+# @FileName  :bench_login_writer.py
+# @Time      :2026/10/17 20:05
+# @Author    :shi lei.wei  <slwei@eppei.com>.
+# 登录记录写入压测：逐条提交（原实现，回滚日志模式）与 LoginWriter 批量提交（WAL）对比
+# 按目标速率（事件/秒）持续写入，统计实际吞吐、事务数与全部写完所需时间
+import argparse
+import os
+import sqlite3
+import tempfile
+import time
+
+import login_db
+import login_writer
+from login_writer import LoginWriter
+
+
+def create_db(db_path):
+    conn = login_db.connect(db_path)
+    login_db.migrate(conn)
+    conn.close()
+
+
+def paced(rate, duration):
+    """按目标速率产生事件序号，跟不上时不补发"""
+    total = int(rate * duration)
+    start = time.perf_counter()
+    for i in range(total):
+        due = start + i / rate
+        now = time.perf_counter()
+        if due > now:
+            time.sleep(due - now)
+        yield i
+
+
+def event(i):
+    return f"unit-{i % 37}", i % 37, "2026-10-17 20:05:00", f"machine-{i % 500}", i % 2, "10.0.0.1"
+
+
+def run_per_row(db_path, rate, duration):
+    create_db(db_path)
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA journal_mode=DELETE")
+    conn.execute("PRAGMA synchronous=FULL")
+    start = time.perf_counter()
+    count = 0
+    for i in paced(rate, duration):
+        conn.execute(login_writer.INSERT_SQL, event(i) + (int(time.time()),))
+        conn.commit()
+        count += 1
+    elapsed = time.perf_counter() - start
+    conn.close()
+    return count, elapsed, count, 0.0
+
+
+def run_batched(db_path, rate, duration, batch_size, max_latency):
+    create_db(db_path)
+    writer = LoginWriter(db_path, batch_size=batch_size, max_latency=max_latency, queue_size=rate * 2)
+    start = time.perf_counter()
+    count = 0
+    for i in paced(rate, duration):
+        writer.add(*event(i))
+        count += 1
+    produced = time.perf_counter()
+    writer.flush()
+    elapsed = time.perf_counter() - start
+    writer.close()
+    return count, elapsed, writer.batches, time.perf_counter() - produced
+
+
+def main():
+    parser = argparse.ArgumentParser(description="登录记录写入吞吐压测")
+    parser.add_argument("--rates", default="1000,10000,100000", help="目标速率（事件/秒），逗号分隔")
+    parser.add_argument("--duration", type=float, default=3.0, help="每个速率持续时间（秒）")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--max-latency-ms", type=float, default=50)
+    parser.add_argument("--skip-per-row", action="store_true", help="跳过逐条提交的对照组")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for rate in (int(r) for r in args.rates.split(",")):
+            modes = [("batched", lambda p: run_batched(p, rate, args.duration, args.batch_size,
+                                                       args.max_latency_ms / 1000.0))]
+            if not args.skip_per_row:
+                modes.insert(0, ("per-row", lambda p: run_per_row(p, rate, args.duration)))
+            for name, fn in modes:
+                db_path = os.path.join(tmp, f"{name}-{rate}.db")
+                count, elapsed, commits, drain = fn(db_path)
+                print(f"rate={rate:>6}/s {name:<8} events={count:>7} 实际吞吐={count / elapsed:>9.0f}/s "
+                      f"事务数={commits:>7} 写完耗时={drain * 1000:>7.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
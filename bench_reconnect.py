@@ -0,0 +1,174 @@
+# -*- coding:utf-8 -*-
+# @FileName  :bench_reconnect.py
+# @Time      :2026/10/18 01:40
+# @Author    :shi lei.wei  <slwei@eppei.com>.
+# 断线重连集成检查：本地起一个模拟服务端（PUSH，按固定速率发送带追踪帧的数据），DataSubscriber 接收，
+# 依次 kill -9 后重启服务端、SIGSTOP 挂起服务端（模拟网络中断，只能靠 ZMTP 心跳发现），统计重连耗时与序列号缺口
+# 任一场景在期限内没有恢复接收时以非 0 退出
+#   python bench_reconnect.py
+import argparse
+import json
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ADDRESS = "tcp://127.0.0.1:16688"
+
+
+def serve(rate):
+    """模拟服务端，直到被 kill"""
+    import zmq
+    import frame_util
+    import trace_util
+    import zmq_util
+    sock = zmq.Context().socket(zmq.PUSH)
+    zmq_util.configure_liveness(sock)
+    sock.bind(ADDRESS)
+    epoch = int(time.time() * 1000) & 0xFFFFFFFF
+    seq = 0
+    while True:
+        now = time.time()
+        trace = trace_util.pack_traces(epoch, [(seq, now, now)])
+        try:
+            sock.send_multipart(frame_util.pack_data([b"x" * 256], trace), zmq.NOBLOCK)
+            seq += 1
+        except zmq.Again:
+            # 没有连接的客户端，序列号不增加
+            pass
+        time.sleep(1.0 / rate)
+
+
+def write_config(args):
+    with open("config_client.json", encoding="utf-8") as f:
+        config = json.load(f)
+    config.update({
+        "zmq_address": ADDRESS,
+        "zmq_transport": "push",
+        "metrics_port": 0,
+        "pipeline_decode_workers": 0,
+        "backoff_store_path": os.path.join(tempfile.gettempdir(), "bench_reconnect_backoff.db"),
+        "zmq_heartbeat_ivl_ms": args.heartbeat_ivl,
+        "zmq_heartbeat_timeout_ms": args.heartbeat_timeout,
+        "zero_mq_heart_beat_timeout": args.liveness_timeout,
+    })
+    fd, path = tempfile.mkstemp(suffix=".json")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(config, f)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="DataSubscriber 断线重连检查")
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--config", help=argparse.SUPPRESS)
+    parser.add_argument("--rate", type=int, default=200, help="模拟服务端每秒发送条数")
+    parser.add_argument("--down", type=float, default=3.0, help="kill 后多久重启服务端（秒）")
+    parser.add_argument("--heartbeat-ivl", type=int, default=1000, help="zmq_heartbeat_ivl_ms")
+    parser.add_argument("--heartbeat-timeout", type=int, default=3000, help="zmq_heartbeat_timeout_ms")
+    parser.add_argument("--liveness-timeout", type=int, default=900, help="zero_mq_heart_beat_timeout（秒）")
+    parser.add_argument("--deadline", type=float, default=30.0, help="每个场景恢复接收的最长等待（秒）")
+    args = parser.parse_args()
+
+    from config_manager import ConfigManager
+    if args.serve:
+        ConfigManager.load_config(args.config)
+        serve(args.rate)
+        return
+
+    config_path = write_config(args)
+    ConfigManager.load_config(config_path)
+    from zeremq_client import DataSubscriber
+
+    class CountingSubscriber(DataSubscriber):
+        """只统计到达的数据，不解码、不转发"""
+
+        def __init__(self, *a, **kw):
+            super().__init__(*a, **kw)
+            self.count = 0
+            self.last_at = 0.0
+
+        def handle_data(self, compressed_data, trace=None):
+            self.count += 1
+            self.last_at = time.time()
+
+    def start_server():
+        return subprocess.Popen([sys.executable, __file__, "--serve", "--config", config_path,
+                                 "--rate", str(args.rate)])
+
+    def wait_for_data(since, deadline):
+        """等待 since 之后收到新数据，返回等待秒数，超时返回 None"""
+        count = subscriber.count
+        end = time.time() + deadline
+        while time.time() < end:
+            if subscriber.count > count and subscriber.last_at > since:
+                return subscriber.last_at - since
+            time.sleep(0.01)
+        return None
+
+    server = start_server()
+    subscriber = CountingSubscriber(ADDRESS)
+    threading.Thread(target=subscriber.start_subscribing, daemon=True).start()
+    failures = []
+    try:
+        if wait_for_data(time.time(), args.deadline) is None:
+            failures.append("首次连接")
+
+        # 场景一：服务端进程被 kill 后重启
+        time.sleep(1)
+        server.send_signal(signal.SIGKILL)
+        server.wait()
+        time.sleep(args.down)
+        restarted_at = time.time()
+        server = start_server()
+        elapsed = wait_for_data(restarted_at, args.deadline)
+        print(f"kill -9 + {args.down:.0f}s 后重启: " + (f"重启后 {elapsed:.3f}s 恢复接收" if elapsed else "未恢复"))
+        if elapsed is None:
+            failures.append("kill 重启")
+
+        # 场景二：服务端挂起，连接不关闭，只能由 ZMTP 心跳发现
+        time.sleep(1)
+        disconnects = subscriber.disconnects.get()
+        stopped_at = time.time()
+        server.send_signal(signal.SIGSTOP)
+        detected = None
+        while time.time() - stopped_at < args.deadline:
+            if subscriber.disconnects.get() > disconnects:
+                detected = time.time() - stopped_at
+                break
+            time.sleep(0.05)
+        resumed_at = time.time()
+        server.send_signal(signal.SIGCONT)
+        elapsed = wait_for_data(resumed_at, args.deadline)
+        print("SIGSTOP: " + (f"{detected:.3f}s 后发现断线" if detected else "未发现断线")
+              + ("，SIGCONT 后 " + f"{elapsed:.3f}s 恢复接收" if elapsed else "，未恢复接收"))
+        if detected is None:
+            failures.append("挂起检测")
+        if elapsed is None:
+            failures.append("挂起恢复")
+        time.sleep(2)
+    finally:
+        server.kill()
+        server.wait()
+        subscriber.running = False
+        os.unlink(config_path)
+
+    summary = subscriber.latency_tracker.summary()
+    print(f"接收 {subscriber.count} 条，序列号缺口 {summary['gap_events']} 次共 {summary['missing']} 条，"
+          f"服务端重启 {summary['resets']} 次")
+    for line in subscriber.registry.render().splitlines():
+        if line.startswith(("pec_client_connected", "pec_client_disconnects", "pec_client_socket_recreations",
+                            "pec_client_reconnect_seconds_sum", "pec_client_reconnect_seconds_count",
+                            "pec_client_sequence")):
+            print("  " + line)
+    if failures:
+        print("失败: " + ", ".join(failures))
+        sys.exit(1)
+    print("通过")
+
+
+if __name__ == "__main__":
+    main()
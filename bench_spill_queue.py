@@ -0,0 +1,80 @@
+# -*- coding:utf-8 -*-
+# @FileName  :bench_spill_queue.py
+# @Time      :2026/10/18 02:40
+# @Author    :shi lei.wei  <slwei@eppei.com>.
+# 待推送队列压测：模拟客户端长时间离线（只写不读，数据溢出到磁盘），之后恢复推送（按顺序读完磁盘积压）
+# 检查取出顺序与写入顺序一致，并检查重新打开目录后能从读位置继续重放
+#   python bench_spill_queue.py --count 500000 --size 2048
+import argparse
+import os
+import shutil
+import struct
+import tempfile
+import time
+
+from spill_queue import SpillQueue
+
+
+def main():
+    parser = argparse.ArgumentParser(description="待推送队列（内存 + 磁盘溢出）压测")
+    parser.add_argument("--count", type=int, default=200000, help="离线期间写入的条数")
+    parser.add_argument("--size", type=int, default=2048, help="单条数据字节数")
+    parser.add_argument("--memory-items", type=int, default=1000, help="spill_memory_items")
+    parser.add_argument("--segment-mb", type=int, default=64, help="spill_segment_mb")
+    parser.add_argument("--max-mb", type=int, default=10240, help="spill_max_mb")
+    parser.add_argument("--dir", help="段文件目录，默认临时目录")
+    args = parser.parse_args()
+
+    directory = args.dir or tempfile.mkdtemp(prefix="bench_spill_")
+    padding = os.urandom(max(0, args.size - 8))
+
+    def open_queue():
+        return SpillQueue(directory, memory_items=args.memory_items, segment_bytes=args.segment_mb * 1024 * 1024,
+                          max_bytes=args.max_mb * 1024 * 1024)
+
+    def check(queue_data, expected):
+        (seq,) = struct.unpack_from("!Q", queue_data["payload"])
+        if seq != expected:
+            raise SystemExit(f"顺序错误: 期望 {expected}，取出 {seq}")
+
+    try:
+        queue = open_queue()
+        start = time.perf_counter()
+        for seq in range(args.count):
+            if not queue.put({"payload": struct.pack("!Q", seq) + padding, "received_at": time.time()}, timeout=0):
+                raise SystemExit(f"磁盘配额已满，写入 {seq} 条")
+        elapsed = time.perf_counter() - start
+        print(f"离线写入 {args.count} 条: {args.count / elapsed:.0f} 条/秒，"
+              f"{args.count * args.size / elapsed / 1024 / 1024:.1f} MB/s，"
+              f"磁盘 {queue.disk_items()} 条 / {queue.disk_bytes() / 1024 / 1024:.0f} MB")
+
+        # 读出一半后关闭，模拟发布进程重启
+        half = args.count // 2
+        start = time.perf_counter()
+        for seq in range(half):
+            check(queue.get(0), seq)
+        queue.close()
+        queue = open_queue()
+        print(f"读出 {half} 条后重启，恢复 {len(queue)} 条")
+        for seq in range(half, args.count):
+            check(queue.get(0), seq)
+        elapsed = time.perf_counter() - start
+        print(f"恢复推送 {args.count} 条: {args.count / elapsed:.0f} 条/秒，顺序正确，"
+              f"剩余 {len(queue)} 条，磁盘 {queue.disk_bytes()} 字节")
+
+        # 没有积压时走内存快路径
+        start = time.perf_counter()
+        payload = padding + b"\0" * 8
+        for _ in range(args.count):
+            queue.put({"payload": payload, "received_at": 0.0})
+            queue.get()
+        elapsed = time.perf_counter() - start
+        print(f"在线（内存）put + get: {args.count / elapsed:.0f} 条/秒")
+        queue.close()
+    finally:
+        if not args.dir:
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+# -*- coding:utf-8 -*-
+# @FileName  :bench_weighted_sampler.py
+# @Time      :2026/10/17 22:10
+# @Author    :shi lei.wei  <slwei@eppei.com>.
+# 空闲账号加权抽取压测：原实现（过滤列表 + random.choices）与 WeightedSampler 对比，
+# 以及 /api/available_unit 的完整路径（读取活跃登记表 + 同步占用集合 + 抽取）
+import argparse
+import os
+import random
+import tempfile
+import time
+
+import login_db
+from unit_registry import ActiveUnitRegistry
+from weighted_sampler import WeightedSampler
+
+
+def old_choice(unit_pool, active_name):
+    """原 get_random_name_by_priority 的实现"""
+    candidates = [name for name in unit_pool.keys() if name not in active_name]
+    if not candidates:
+        return None
+    weights = [1 / unit_pool[name] for name in candidates]
+    return random.choices(candidates, weights=weights, k=1)[0]
+
+
+def timed(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+def run(units, active_ratio, repeat):
+    rnd = random.Random(1)
+    unit_pool = {str(i): rnd.randint(500, 15000) for i in range(1, units + 1)}
+    names = list(unit_pool)
+    active = rnd.sample(names, int(units * active_ratio))
+    sampler = WeightedSampler.from_priority(unit_pool)
+    sampler.set_active(active)
+
+    # 原实现的 active_name 是 list，过滤为 O(pool × active)
+    old_repeat = max(1, min(repeat, 2000000 // max(1, units * max(1, len(active)))))
+    old_us = timed(lambda: old_choice(unit_pool, active), old_repeat)
+    sample_us = timed(sampler.sample, repeat)
+
+    def toggle():
+        name = names[rnd.randrange(units)]
+        sampler.activate(name)
+        sampler.deactivate(name)
+
+    toggle_us = timed(toggle, repeat) / 2
+    build_start = time.perf_counter()
+    WeightedSampler.from_priority(unit_pool)
+    build_ms = (time.perf_counter() - build_start) * 1000
+    print(f"units={units:>6} active={len(active):>6}  原实现={old_us:>12.2f}us  "
+          f"sample={sample_us:>6.2f}us  activate/deactivate={toggle_us:>5.2f}us  重建={build_ms:>7.2f}ms")
+
+
+def run_request(units, active_ratio, repeat):
+    """与 get_available_unit 相同的每次请求路径，登记表保存在临时数据库中"""
+    rnd = random.Random(1)
+    unit_pool = {str(i): rnd.randint(500, 15000) for i in range(1, units + 1)}
+    fd, db_path = tempfile.mkstemp(suffix=".db")
+    os.close(fd)
+    registry = ActiveUnitRegistry(db_path)
+    try:
+        conn = login_db.connect(db_path)
+        login_db.migrate(conn)
+        now = int(time.time())
+        conn.execute("BEGIN")
+        conn.executemany("INSERT INTO active_units (machine, unit_id, last_seen) VALUES (?, ?, ?)",
+                         ((f"machine-{i}", int(name), now)
+                          for i, name in enumerate(rnd.sample(list(unit_pool), int(units * active_ratio)))))
+        conn.execute("COMMIT")
+        conn.close()
+        sampler = WeightedSampler.from_priority(unit_pool)
+
+        def request(versioned):
+            active = registry.snapshot()
+            sampler.set_active(active.values(), active if versioned else None)
+            return sampler.sample()
+
+        # 改造前：每次请求都按整个活跃集合重新比较
+        full_us = timed(lambda: request(False), max(1, min(repeat, 2000000 // units)))
+        # 登记表未变化：一次 PRAGMA data_version + 抽取
+        versioned_us = timed(lambda: request(True), repeat)
+
+        # 每次请求前都有一次登录：重新加载登记表并比较，是按版本同步的最差情况
+        def login_then_request():
+            registry.activate(f"machine-{rnd.randrange(units)}", rnd.randint(1, units))
+            request(True)
+
+        login_us = timed(login_then_request, max(1, min(repeat, 200000 // units)))
+        print(f"units={units:>6} active={len(registry):>6}  每次比较={full_us:>9.2f}us  "
+              f"按版本={versioned_us:>6.2f}us  每次请求前有登录={login_us:>9.2f}us")
+    finally:
+        registry.close()
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(db_path + suffix):
+                os.unlink(db_path + suffix)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="WeightedSampler 微基准")
+    parser.add_argument("--units", default="35,1000,100000")
+    parser.add_argument("--active-ratio", type=float, default=0.3)
+    parser.add_argument("--repeat", type=int, default=20000)
+    args = parser.parse_args()
+    for n in (int(u) for u in args.units.split(",")):
+        run(n, args.active_ratio, args.repeat)
+    print("/api/available_unit 每次请求")
+    for n in (int(u) for u in args.units.split(",")):
+        run_request(n, args.active_ratio, args.repeat)
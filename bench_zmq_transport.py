@@ -0,0 +1,138 @@
+# -*- coding:utf-8 -*-
+# @FileName  :bench_zmq_transport.py
+# @Time      :2026/10/18 00:50
+# @Author    :shi lei.wei  <slwei@eppei.com>.
+# 链路吞吐压测：PUSH/PULL（发送即视为送达） vs ROUTER/DEALER 确认模式（滑动窗口 + 批量确认）
+# 两端在同一进程的两个线程中，经 tcp 回环传输，消息格式与发布进程一致（带追踪帧）
+import argparse
+import os
+import threading
+import time
+
+import zmq
+
+import frame_util
+import reliable_link
+import trace_util
+
+ADDRESS = "tcp://127.0.0.1:16699"
+
+
+def _messages(count, batch, size, epoch=1):
+    payload = os.urandom(size)
+    for first in range(0, count, batch):
+        n = min(batch, count - first)
+        now = time.time()
+        trace = trace_util.pack_traces(epoch, [(first + i, now, now) for i in range(n)])
+        yield first, n, frame_util.pack_data([payload] * n, trace)
+
+
+def bench_push(count, batch, size):
+    ctx = zmq.Context()
+    push = ctx.socket(zmq.PUSH)
+    push.bind(ADDRESS)
+    pull = ctx.socket(zmq.PULL)
+    pull.connect(ADDRESS)
+    received = [0]
+
+    def consume():
+        while received[0] < count:
+            payloads, trace = frame_util.unpack_message(pull.recv_multipart())
+            received[0] += len(trace_util.unpack_traces(trace))
+
+    consumer = threading.Thread(target=consume)
+    consumer.start()
+    start = time.perf_counter()
+    for _, _, frames in _messages(count, batch, size):
+        push.send_multipart(frames, copy=False)
+    consumer.join()
+    elapsed = time.perf_counter() - start
+    push.close(0)
+    pull.close(0)
+    ctx.term()
+    return elapsed
+
+
+def bench_ack(count, batch, size, window, ack_batch):
+    ctx = zmq.Context()
+    router = ctx.socket(zmq.ROUTER)
+    router.setsockopt(zmq.ROUTER_MANDATORY, 1)
+    router.bind(ADDRESS)
+    dealer = ctx.socket(zmq.DEALER)
+    dealer.connect(ADDRESS)
+    done = threading.Event()
+
+    def consume():
+        dedup = reliable_link.SequenceFilter()
+        acks = reliable_link.AckBatcher(batch_size=ack_batch, interval=0.005)
+        dealer.send_multipart([reliable_link.MSG_HELLO])
+        received = 0
+        while received < count:
+            if acks.due():
+                dealer.send_multipart(acks.take())
+            try:
+                parts = dealer.recv_multipart(zmq.NOBLOCK)
+            except zmq.Again:
+                dealer.poll(5)
+                continue
+            payloads, trace = frame_util.unpack_message(parts)
+            traces = trace_util.unpack_traces(trace)
+            received += sum(1 for t in traces if dedup.accept(t.epoch, t.seq))
+            acks.add(traces[0].epoch, traces[0].seq)
+        frames = acks.take()
+        if frames:
+            dealer.send_multipart(frames)
+        done.set()
+
+    # 与发布进程相同：发送、收确认、重发都在同一线程
+    ack_window = reliable_link.AckWindow(router, 1, window=window, ack_timeout=5.0)
+    messages = _messages(count, batch, size)
+    poller = zmq.Poller()
+    poller.register(router, zmq.POLLIN)
+    consumer = threading.Thread(target=consume)
+    consumer.start()
+    start = time.perf_counter()
+    pending = next(messages, None)
+    while not done.is_set() or ack_window.unacked:
+        # 与发布进程相同：窗口有空位时连续发送一批再处理确认
+        timeout = 10
+        for _ in range(64):
+            if not pending or not ack_window.has_credit():
+                break
+            first, n, frames = pending
+            ack_window.send(first, frames, n)
+            pending = next(messages, None)
+            timeout = 0
+        if poller.poll(timeout):
+            for _ in range(1000):
+                try:
+                    parts = router.recv_multipart(zmq.NOBLOCK)
+                except zmq.Again:
+                    break
+                ack_window.on_message(parts[0], parts[1:])
+        ack_window.resend_due()
+    elapsed = time.perf_counter() - start
+    consumer.join()
+    router.close(0)
+    dealer.close(0)
+    ctx.term()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ZMQ 链路吞吐：PUSH vs 确认模式")
+    parser.add_argument("--count", type=int, default=200000, help="数据条数")
+    parser.add_argument("--size", type=int, default=2048, help="单条数据字节数")
+    parser.add_argument("--batch", default="1,16", help="每条消息的数据条数（zmq_batch_size）")
+    parser.add_argument("--window", type=int, default=10000, help="确认模式窗口（条）")
+    parser.add_argument("--ack-batch", type=int, default=64)
+    args = parser.parse_args()
+    for batch in (int(b) for b in args.batch.split(",")):
+        push = bench_push(args.count, batch, args.size)
+        ack = bench_ack(args.count, batch, args.size, args.window, args.ack_batch)
+        print(f"batch={batch:>3} size={args.size}B  PUSH: {args.count / push:>9.0f} 条/秒  "
+              f"确认模式: {args.count / ack:>9.0f} 条/秒  ({push / ack * 100:.0f}%)")
+
+
+if __name__ == "__main__":
+    main()
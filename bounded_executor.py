@@ -0,0 +1,206 @@
+# -*- coding:utf-8 -*-
+# @FileName  :bounded_executor.py
+# @Time      :2026/10/17 22:30
+# @Author    :shi lei.wei  <slwei@eppei.com>.
+# 有界线程池：队列满时按策略阻塞 / 拒绝 / 合并，关闭时执行完剩余任务，提供队列深度与耗时统计
+import collections
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, Optional
+
+logger = logging.getLogger(__name__)
+
+POLICY_BLOCK = "block"
+POLICY_REJECT = "reject"
+POLICY_COALESCE = "coalesce"
+
+
+class TaskRejected(Exception):
+    """队列已满（或线程池已关闭），任务未被接受"""
+    pass
+
+
+class BoundedExecutor:
+    """
+    进程内有界线程池，任务只在本进程线程间传递，不做序列化
+    队列满时的策略:
+    - block: 阻塞等待空位，超过 block_timeout 秒抛出 TaskRejected
+    - reject: 立即抛出 TaskRejected，由调用方返回 503
+    - coalesce: 同一 key 的任务已在排队时用新任务替换旧任务，否则抛出 TaskRejected
+    工作线程在第一次提交任务时启动，gunicorn preload 时 fork 之后各 worker 各自启动
+    """
+
+    def __init__(self, num_threads: int = 4, queue_size: int = 10000, policy: str = POLICY_BLOCK,
+                 block_timeout: Optional[float] = 5.0, name: str = "TaskPool"):
+        """
+        :param num_threads: 工作线程数
+        :param queue_size: 最多排队的任务数
+        :param policy: 队列满时的策略 block / reject / coalesce
+        :param block_timeout: block 策略的最长等待秒数，None 表示一直等待
+        :param name: 线程名前缀
+        """
+        if policy not in (POLICY_BLOCK, POLICY_REJECT, POLICY_COALESCE):
+            raise ValueError(f"unknown policy: {policy}")
+        self.num_threads = num_threads
+        self.queue_size = queue_size
+        self.policy = policy
+        self.block_timeout = block_timeout
+        self.name = name
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._not_full = threading.Condition(self._lock)
+        self._all_done = threading.Condition(self._lock)
+        # 排队中的任务: [func, args, kwargs, 入队时间, key]，coalesce 时原地替换
+        self._tasks = collections.deque()
+        self._pending: Dict[Hashable, list] = {}
+        self._running = 0
+        self._threads = []
+        self._pid = None
+        self._shutdown = False
+        # 统计
+        self._submitted = 0
+        self._completed = 0
+        self._failed = 0
+        self._rejected = 0
+        self._coalesced = 0
+        self._max_depth = 0
+        self._wait_times = collections.deque(maxlen=1024)
+        self._run_times = collections.deque(maxlen=1024)
+
+    def add_task(self, func: Callable[..., Any], *args, key: Optional[Hashable] = None, **kwargs):
+        """
+        提交任务，按策略处理队列满的情况
+        :param key: coalesce 策略下用于合并的任务标识
+        :raises TaskRejected: 任务未被接受
+        """
+        self._ensure_started()
+        with self._lock:
+            if self._shutdown:
+                self._rejected += 1
+                raise TaskRejected(f"{self.name} is shut down")
+            if len(self._tasks) >= self.queue_size and self._on_full(func, args, kwargs, key):
+                # 已合并到排队中的任务
+                return
+            entry = [func, args, kwargs, time.monotonic(), key]
+            self._tasks.append(entry)
+            if key is not None:
+                self._pending[key] = entry
+            self._submitted += 1
+            self._max_depth = max(self._max_depth, len(self._tasks))
+            self._not_empty.notify()
+
+    def _on_full(self, func, args, kwargs, key) -> bool:
+        """队列满时调用（持有锁），返回 True 表示任务已合并，False 表示已有空位"""
+        if self.policy == POLICY_COALESCE and key is not None and key in self._pending:
+            entry = self._pending[key]
+            entry[0], entry[1], entry[2] = func, args, kwargs
+            self._coalesced += 1
+            return True
+        if self.policy == POLICY_BLOCK:
+            if self._not_full.wait_for(lambda: len(self._tasks) < self.queue_size or self._shutdown,
+                                       self.block_timeout) and not self._shutdown:
+                return False
+        self._rejected += 1
+        raise TaskRejected(f"{self.name} queue full")
+
+    def _ensure_started(self):
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+        with self._lock:
+            if self._pid == pid:
+                return
+            # fork 前的线程不会带到子进程，fork 前排队的任务也不属于本进程
+            self._tasks.clear()
+            self._pending.clear()
+            self._running = 0
+            self._threads = []
+            for i in range(self.num_threads):
+                t = threading.Thread(target=self._worker, name=f"{self.name}-{i}", daemon=True)
+                t.start()
+                self._threads.append(t)
+            self._pid = pid
+
+    def _worker(self):
+        while True:
+            with self._lock:
+                self._not_empty.wait_for(lambda: self._tasks or self._shutdown)
+                if not self._tasks:
+                    # 已关闭且队列已空
+                    return
+                entry = self._tasks.popleft()
+                func, args, kwargs, enqueued_at, key = entry
+                if key is not None and self._pending.get(key) is entry:
+                    del self._pending[key]
+                self._running += 1
+                self._not_full.notify()
+            started = time.monotonic()
+            failed = False
+            try:
+                func(*args, **kwargs)
+            except Exception as e:
+                failed = True
+                logger.error(f"线程池任务执行出错: {e}")
+                logger.exception(e)
+            finished = time.monotonic()
+            with self._lock:
+                self._running -= 1
+                self._completed += 1
+                if failed:
+                    self._failed += 1
+                self._wait_times.append(started - enqueued_at)
+                self._run_times.append(finished - started)
+                if not self._tasks and not self._running:
+                    self._all_done.notify_all()
+
+    def qsize(self) -> int:
+        return len(self._tasks)
+
+    def stats(self) -> Dict[str, Any]:
+        """队列深度、任务数与最近 1024 个任务的排队/执行耗时（毫秒）"""
+        with self._lock:
+            wait_times = sorted(self._wait_times)
+            run_times = sorted(self._run_times)
+            return {
+                "policy": self.policy,
+                "threads": self.num_threads,
+                "queue_size": self.queue_size,
+                "depth": len(self._tasks),
+                "max_depth": self._max_depth,
+                "running": self._running,
+                "submitted": self._submitted,
+                "completed": self._completed,
+                "failed": self._failed,
+                "rejected": self._rejected,
+                "coalesced": self._coalesced,
+                "wait_ms": _summary(wait_times),
+                "run_ms": _summary(run_times),
+            }
+
+    def shutdown(self, timeout: Optional[float] = 10.0) -> bool:
+        """停止接收新任务，执行完已排队的任务后结束线程，返回是否在超时前执行完"""
+        logger.info("关闭线程池 %s，剩余任务 %d", self.name, len(self._tasks))
+        with self._lock:
+            self._shutdown = True
+            self._not_empty.notify_all()
+            self._not_full.notify_all()
+            if self._pid != os.getpid():
+                return True
+            drained = self._all_done.wait_for(lambda: not self._tasks and not self._running, timeout)
+        for t in self._threads:
+            t.join(0.1)
+        if not drained:
+            logger.warning("线程池 %s 关闭超时，丢弃 %d 个任务", self.name, len(self._tasks))
+        return drained
+
+
+def _summary(values):
+    if not values:
+        return {"p50": 0.0, "p99": 0.0, "max": 0.0}
+    return {
+        "p50": round(values[len(values) // 2] * 1000, 3),
+        "p99": round(values[min(len(values) - 1, int(len(values) * 0.99))] * 1000, 3),
+        "max": round(values[-1] * 1000, 3),
+    }
@@ -0,0 +1,132 @@
+# -*- coding:utf-8 -*-
+# @FileName  :codec_util.py
+# @Time      :2026/10/17 17:20
+# @Author    :shi lei.wei  <slwei@eppei.com>.
+# 压缩编解码注册表，编号写入二进制信封头
+# 1 gzip / 2 zlib / 3 zstd（可带预训练字典）/ 4 lz4
+# zstd、lz4 为可选依赖，未安装时对应编解码不可用
+import gzip
+import logging
+import threading
+import zlib
+from typing import Callable, Dict
+
+from config_manager import ConfigManager
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+try:
+    import lz4.frame as lz4_frame
+except ImportError:
+    lz4_frame = None
+
+logger = logging.getLogger(__name__)
+
+CODEC_GZIP = 1
+CODEC_ZLIB = 2
+CODEC_ZSTD = 3
+CODEC_LZ4 = 4
+# 可选依赖的编解码 -> 需要安装的包，未安装时报错中给出包名
+_OPTIONAL = {CODEC_ZSTD: ("zstd", "zstandard"), CODEC_LZ4: ("lz4", "lz4")}
+
+
+class Codec:
+    """一种压缩算法"""
+
+    def __init__(self, codec_id: int, name: str, compress: Callable[[bytes], bytes],
+                 decompress: Callable[[bytes], bytes]):
+        self.codec_id = codec_id
+        self.name = name
+        self.compress = compress
+        self.decompress = decompress
+
+
+_codecs: Dict[int, Codec] = {}
+_codecs_by_name: Dict[str, Codec] = {}
+
+
+def register(codec: Codec):
+    _codecs[codec.codec_id] = codec
+    _codecs_by_name[codec.name] = codec
+
+
+def _missing(codec_id: int) -> ValueError:
+    name, package = _OPTIONAL[codec_id]
+    return ValueError(f"codec {name} requires the {package} package (pip install -r requirements.txt)")
+
+
+def get_codec(codec_id: int) -> Codec:
+    codec = _codecs.get(codec_id)
+    if codec is None:
+        if codec_id in _OPTIONAL:
+            raise _missing(codec_id)
+        raise ValueError(f"unsupported codec id: {codec_id}")
+    return codec
+
+
+def get_codec_by_name(name: str) -> Codec:
+    codec = _codecs_by_name.get(name)
+    if codec is None:
+        for codec_id, (optional_name, _) in _OPTIONAL.items():
+            if name == optional_name:
+                raise _missing(codec_id)
+        raise ValueError(f"unsupported codec: {name}")
+    return codec
+
+
+def available_codecs():
+    return list(_codecs_by_name)
+
+
+register(Codec(CODEC_GZIP, "gzip", gzip.compress, gzip.decompress))
+register(Codec(CODEC_ZLIB, "zlib", zlib.compress, zlib.decompress))
+
+
+class _ZstdCodec:
+    """
+    zstd 编解码，可加载 train_zstd_dict.py 训练的字典（配置 zstd_dict_path）
+    ZstdCompressor/ZstdDecompressor 不能被多个线程同时使用，按线程缓存
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+        self._dict = None
+        self._dict_loaded = False
+        self._lock = threading.Lock()
+
+    def _dict_data(self):
+        if not self._dict_loaded:
+            with self._lock:
+                if not self._dict_loaded:
+                    dict_path = ConfigManager.get_init_param_by_key("zstd_dict_path")
+                    if dict_path:
+                        with open(dict_path, "rb") as f:
+                            self._dict = zstandard.ZstdCompressionDict(f.read())
+                        logger.info("加载 zstd 字典: %s, dict_id=%d", dict_path, self._dict.dict_id())
+                    self._dict_loaded = True
+        return self._dict
+
+    def compress(self, data: bytes) -> bytes:
+        compressor = getattr(self._local, "compressor", None)
+        if compressor is None:
+            level = ConfigManager.get_init_param_by_key("zstd_level", 3)
+            compressor = zstandard.ZstdCompressor(level=level, dict_data=self._dict_data())
+            self._local.compressor = compressor
+        return compressor.compress(data)
+
+    def decompress(self, data: bytes) -> bytes:
+        decompressor = getattr(self._local, "decompressor", None)
+        if decompressor is None:
+            decompressor = zstandard.ZstdDecompressor(dict_data=self._dict_data())
+            self._local.decompressor = decompressor
+        return decompressor.decompress(data)
+
+
+if zstandard is not None:
+    _zstd = _ZstdCodec()
+    register(Codec(CODEC_ZSTD, "zstd", _zstd.compress, _zstd.decompress))
+
+if lz4_frame is not None:
+    register(Codec(CODEC_LZ4, "lz4", lz4_frame.compress, lz4_frame.decompress))
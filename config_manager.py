@@ -6,11 +6,15 @@
 import json
 import os
 import sys
+import threading
 
 
 class ConfigManager:
     _data = None
     _param = {}
+    _file_path = None
+    _mtime = None
+    _reload_lock = threading.Lock()
 
     @staticmethod
     def load_config(file_path):
@@ -24,8 +28,34 @@ class ConfigManager:
             ConfigManager._data = json.load(file)
         for key, value in ConfigManager._data.items():
             ConfigManager._param.setdefault(key, value)
+        ConfigManager._file_path = file_path
+        ConfigManager._mtime = os.path.getmtime(file_path)
         return ConfigManager._data
 
+    @staticmethod
+    def reload_if_changed():
+        """
+        配置文件修改后重新加载，返回是否重新加载
+        只影响 get_param_by_key，get_init_param_by_key 仍返回启动时的值
+        """
+        file_path = ConfigManager._file_path
+        if file_path is None:
+            return False
+        try:
+            mtime = os.path.getmtime(file_path)
+            if mtime == ConfigManager._mtime:
+                return False
+            with ConfigManager._reload_lock:
+                if mtime == ConfigManager._mtime:
+                    return False
+                with open(file_path, 'r', encoding='utf-8') as file:
+                    ConfigManager._data = json.load(file)
+                ConfigManager._mtime = mtime
+            return True
+        except (OSError, ValueError):
+            # 文件正在写入或格式错误，保留原配置，下次再试
+            return False
+
     @staticmethod
     def get_init_param_by_key(key, default_value=None):
         param_value = ConfigManager._param.get(key)
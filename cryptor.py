@@ -0,0 +1,169 @@
+# -*- coding:utf-8 -*-
+# @FileName  :cryptor.py
+# @Time      :2026/10/17 19:05
+# @Author    :shi lei.wei  <slwei@eppei.com>.
+# 可复用的加解密器：密钥只在配置变化时解码一次，支持多密钥轮换与 AES-GCM
+import logging
+import threading
+import time
+from base64 import b64decode, b64encode
+from collections import namedtuple
+from typing import Optional
+
+from Crypto.Cipher import AES
+from Crypto.Random import get_random_bytes
+from Crypto.Util.Padding import pad, unpad
+
+import codec_util
+import envelope_util
+from config_manager import ConfigManager
+
+try:
+    # AESGCM 对象只做一次密钥扩展，可以用不同 nonce 反复加解密
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+except ImportError:
+    AESGCM = None
+
+logger = logging.getLogger(__name__)
+
+_MODES = {"cbc": envelope_util.MODE_CBC, "gcm": envelope_util.MODE_GCM}
+_DEFAULT_KEY = "1d5fd0779a124c5f8ec06bd3282f3a69"
+# 一次加载得到的全部密钥状态，整体替换，加解密线程看到的要么是旧配置要么是新配置
+_KeyState = namedtuple("_KeyState", ["keys", "gcm", "active_key_id", "mode", "codec"])
+
+
+class Cryptor:
+    """
+    加解密器，从配置构建一次后复用:
+    - key: 旧密钥，编号 0，V1/V2 信封与 Base64 旧格式使用
+    - keys: {"1": "base64 密钥", ...}，密钥编号写入 V3 信封，解密时按编号取密钥
+    - active_key_id: 加密使用的密钥编号
+    - cipher_mode: cbc 或 gcm
+    - codec: 压缩算法
+    配置文件修改后，最多 reload_interval 秒内重新加载，用于轮换当前密钥
+    """
+
+    def __init__(self, reload_interval: float = 30.0):
+        self.reload_interval = reload_interval
+        self._lock = threading.Lock()
+        self._state = None
+        self._load()
+
+    def _load(self):
+        keys = {envelope_util.DEFAULT_KEY_ID: b64decode(ConfigManager.get_param_by_key("key", _DEFAULT_KEY))}
+        for key_id, key in (ConfigManager.get_param_by_key("keys", {}) or {}).items():
+            keys[int(key_id)] = b64decode(key)
+        active_key_id = int(ConfigManager.get_param_by_key("active_key_id", envelope_util.DEFAULT_KEY_ID))
+        if active_key_id not in keys:
+            raise ValueError(f"active_key_id {active_key_id} not in keys")
+        mode = _MODES[ConfigManager.get_param_by_key("cipher_mode", "cbc")]
+        codec = codec_util.get_codec_by_name(ConfigManager.get_param_by_key("codec", "gzip"))
+        gcm = {key_id: AESGCM(key) for key_id, key in keys.items()} if AESGCM else {}
+        self._state = _KeyState(keys, gcm, active_key_id, mode, codec)
+        self._checked_at = time.time()
+        logger.info("加解密器加载 %d 个密钥，当前密钥: %d，模式: %s，压缩: %s",
+                    len(keys), active_key_id, mode, codec.name)
+
+    def maybe_reload(self):
+        """按间隔检查配置文件，有修改时重新加载密钥"""
+        if time.time() - self._checked_at < self.reload_interval:
+            return
+        with self._lock:
+            if time.time() - self._checked_at < self.reload_interval:
+                return
+            self._checked_at = time.time()
+            if ConfigManager.reload_if_changed():
+                try:
+                    self._load()
+                except Exception as e:
+                    logger.exception(f"重新加载密钥失败，继续使用原密钥: {e}")
+
+    @staticmethod
+    def _key(state: _KeyState, key_id: int) -> bytes:
+        key = state.keys.get(key_id)
+        if key is None:
+            raise ValueError(f"unknown key id: {key_id}")
+        return key
+
+    def encrypt(self, plaintext: bytes, codec: Optional[codec_util.Codec] = None) -> bytes:
+        """压缩 + 加密，返回二进制信封"""
+        self.maybe_reload()
+        state = self._state
+        codec = codec or state.codec
+        key_id = state.active_key_id
+        compressed = codec.compress(plaintext)
+        head = envelope_util.header(codec.codec_id, key_id, state.mode)
+        if state.mode == envelope_util.MODE_GCM:
+            nonce = get_random_bytes(envelope_util.NONCE_SIZE)
+            return b"".join((head, nonce, self._gcm_encrypt(state, key_id, nonce, compressed, head)))
+        iv = get_random_bytes(envelope_util.IV_SIZE)
+        cipher = AES.new(self._key(state, key_id), AES.MODE_CBC, iv)
+        return b"".join((head, iv, cipher.encrypt(pad(compressed, AES.block_size))))
+
+    def decrypt(self, blob) -> bytes:
+        """解密二进制信封（首字节 >= 0x80）或旧的 Base64 文本，返回明文字节"""
+        self.maybe_reload()
+        if not envelope_util.is_binary(blob):
+            return self.decrypt_legacy(blob)
+        state = self._state
+        envelope = envelope_util.unpack(blob)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("信封版本: %#x, 密钥: %d, 模式: %d, 密文长度: %d 字节",
+                         envelope.version, envelope.key_id, envelope.mode, len(envelope.body))
+        if envelope.mode == envelope_util.MODE_GCM:
+            compressed = self._gcm_decrypt(state, envelope.key_id, envelope.iv, envelope.body, envelope.header)
+        else:
+            cipher = AES.new(self._key(state, envelope.key_id), AES.MODE_CBC, envelope.iv)
+            compressed = unpad(cipher.decrypt(envelope.body), AES.block_size)
+        return codec_util.get_codec(envelope.codec_id).decompress(compressed)
+
+    def encrypt_legacy(self, plaintext: bytes) -> str:
+        """旧格式: Base64(IV + AES-CBC(gzip(明文)))，密钥 0"""
+        compressed = codec_util.get_codec(envelope_util.DEFAULT_CODEC_ID).compress(plaintext)
+        iv = get_random_bytes(envelope_util.IV_SIZE)
+        cipher = AES.new(self._key(self._state, envelope_util.DEFAULT_KEY_ID), AES.MODE_CBC, iv)
+        return b64encode(iv + cipher.encrypt(pad(compressed, AES.block_size))).decode('utf-8')
+
+    def decrypt_legacy(self, encrypted_b64) -> bytes:
+        combined_data = b64decode(encrypted_b64)
+        cipher = AES.new(self._key(self._state, envelope_util.DEFAULT_KEY_ID), AES.MODE_CBC,
+                         combined_data[:envelope_util.IV_SIZE])
+        compressed = unpad(cipher.decrypt(combined_data[envelope_util.IV_SIZE:]), AES.block_size)
+        return codec_util.get_codec(envelope_util.DEFAULT_CODEC_ID).decompress(compressed)
+
+    def _gcm_encrypt(self, state, key_id, nonce, data, aad) -> bytes:
+        """返回 密文 + 认证标签"""
+        if AESGCM:
+            return self._gcm_for(state, key_id).encrypt(nonce, data, aad)
+        cipher = AES.new(self._key(state, key_id), AES.MODE_GCM, nonce=nonce)
+        cipher.update(aad)
+        ciphertext, tag = cipher.encrypt_and_digest(data)
+        return ciphertext + tag
+
+    def _gcm_decrypt(self, state, key_id, nonce, body, aad) -> bytes:
+        if AESGCM:
+            return self._gcm_for(state, key_id).decrypt(nonce, bytes(body), aad)
+        cipher = AES.new(self._key(state, key_id), AES.MODE_GCM, nonce=nonce)
+        cipher.update(aad)
+        return cipher.decrypt_and_verify(body[:-envelope_util.TAG_SIZE], body[-envelope_util.TAG_SIZE:])
+
+    @staticmethod
+    def _gcm_for(state: _KeyState, key_id: int):
+        gcm = state.gcm.get(key_id)
+        if gcm is None:
+            raise ValueError(f"unknown key id: {key_id}")
+        return gcm
+
+
+_cryptor = None
+_cryptor_lock = threading.Lock()
+
+
+def get_cryptor() -> Cryptor:
+    """进程内共享的加解密器，首次使用时按配置创建"""
+    global _cryptor
+    if _cryptor is None:
+        with _cryptor_lock:
+            if _cryptor is None:
+                _cryptor = Cryptor(ConfigManager.get_param_by_key("key_reload_interval", 30))
+    return _cryptor
@@ -0,0 +1,72 @@
+# -*- coding:utf-8 -*-
+# @FileName  :daily_units.py
+# @Time      :2026/10/18 04:10
+# @Author    :shi lei.wei  <slwei@eppei.com>.
+# 当天登录过的账号：读取 daily_units 汇总表（由 LoginWriter 在写入登录记录的事务中维护），进程内缓存
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import FrozenSet, Optional
+
+from login_db import connect, day_bounds, day_key
+
+logger = logging.getLogger(__name__)
+
+
+class DailyUnits:
+    """
+    当天（本地时区，容器中为 Asia/Shanghai）有登录记录的账号编号
+    - 读：返回进程内缓存，只有批量写入器的提交代数变化或跨过零点时才重新加载，
+      重新加载只读汇总表中当天的行，行数等于当天登录过的账号数，与 logins 表大小无关
+    - 跨过零点后按新的日期读取，不需要清理旧数据
+    """
+
+    def __init__(self, db_path: str, generation):
+        """
+        :param db_path: 数据库文件路径（表由 login_db 迁移创建）
+        :param generation: LoginWriter 的提交代数（multiprocessing.Value，各 worker 共用）
+        """
+        self.db_path = db_path
+        self.generation = generation
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pid = None
+        self._units: FrozenSet[int] = frozenset()
+        self._generation = None
+        self._day = None
+        self._day_end = 0
+
+    def _connection(self) -> sqlite3.Connection:
+        # fork 前打开的连接不能在子进程中使用
+        if self._pid != os.getpid():
+            self._conn = connect(self.db_path)
+            self._pid = os.getpid()
+            self._generation = None
+        return self._conn
+
+    def today_unit_ids(self) -> FrozenSet[int]:
+        """当天登录过的账号编号，未重新加载时返回同一个对象"""
+        generation = self.generation.value
+        now = time.time()
+        with self._lock:
+            if now >= self._day_end:
+                # 跨过零点（或首次读取），按新的日期重新加载
+                _, self._day_end = day_bounds(now)
+                self._day = day_key(now)
+                self._generation = None
+            if generation != self._generation:
+                rows = self._connection().execute(
+                    "SELECT unit_id FROM daily_units WHERE day=? AND logins > 0", (self._day,)).fetchall()
+                self._units = frozenset(row[0] for row in rows)
+                # 用查询前读到的代数，查询期间的提交会在下次读取时重新加载
+                self._generation = generation
+            return self._units
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None and self._pid == os.getpid():
+                self._conn.close()
+            self._conn = None
+            self._pid = None
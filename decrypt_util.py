@@ -2,14 +2,9 @@
 # @FileName  :decrypt_util.py
 # @Time      :2025/9/8 19:22
 # @Author    :shi lei.wei  <slwei@eppei.com>.
-import gzip
 import logging
-from base64 import b64decode
 
-from Crypto.Cipher import AES
-from Crypto.Util.Padding import unpad
-
-from config_manager import ConfigManager
+from cryptor import get_cryptor
 
 logger = logging.getLogger(__name__)
 
@@ -21,22 +16,19 @@ def decrypt_data(encrypted_b64: str) -> str | None:
     返回原始文本
     """
     try:
-        # 1. Base64 解码，解码拼接的数据
-        combined_data = b64decode(encrypted_b64)
-        # 2. 提取IV和密文（IV固定16字节）
-        iv = combined_data[:16]  # 前16字节是IV
-        encrypted_data = combined_data[16:]  # 剩余部分是密文
-        logger.debug(f"提取IV长度: {len(iv)} 字节")
-        logger.debug(f"提取密文长度: {len(encrypted_data)} 字节")
-        # 3. 创建解密器
-        the_key = ConfigManager.get_init_param_by_key("key", "1d5fd0779a124c5f8ec06bd3282f3a69")
-        cipher = AES.new(b64decode(the_key), AES.MODE_CBC, iv)
-        # 解密并去除填充
-        decrypted_data = unpad(cipher.decrypt(encrypted_data), AES.block_size)
-        # 4. GZIP 解压
-        text_bytes = gzip.decompress(decrypted_data)
-        # 5. UTF-8 解码
-        return text_bytes.decode('utf-8')
+        return get_cryptor().decrypt_legacy(encrypted_b64).decode('utf-8')
+    except Exception as e:
+        logger.exception(f"解密错误: {e}")
+        return None
+
+
+def decrypt_payload(blob: bytes) -> str | None:
+    """
+    解密 ZMQ 帧中的原始字节
+    首字节为信封版本号时按二进制信封解析（按信封中的密钥编号取密钥），否则按旧的 Base64 文本解析
+    """
+    try:
+        return get_cryptor().decrypt(blob).decode('utf-8')
     except Exception as e:
         logger.exception(f"解密错误: {e}")
         return None
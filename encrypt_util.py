@@ -2,42 +2,43 @@
 # @FileName  :encrypt_util.py
 # @Time      :2025/9/8 19:36
 # @Author    :shi lei.wei  <slwei@eppei.com>.
-import gzip
 import json
-from base64 import b64encode, b64decode
+from base64 import b64encode
 
-from Crypto.Cipher import AES
 from Crypto.Random import get_random_bytes
-from Crypto.Util.Padding import pad
 
-from config_manager import ConfigManager
+import codec_util
+from cryptor import get_cryptor
 
 
 def encrypt_data(plaintext: str) -> str:
     """
     AES加密数据，IV与密文拼接
     压缩 + 加密 + Base64 编码
-    返回可传输的字符串
+    返回可传输的字符串（旧格式，兼容文本接口）
     """
-    # 1. UTF-8 编码
-    text_bytes = plaintext.encode('utf-8')
-    # 2. GZIP 压缩
-    compressed = gzip.compress(text_bytes)
-    # 3. AES-256-CBC 加密
-    # 生成随机IV (AES的IV固定为16字节)
-    iv = get_random_bytes(16)
-    # 创建加密器
-    the_key = ConfigManager.get_init_param_by_key("key", "1d5fd0779a124c5f8ec06bd3282f3a69")
-    cipher = AES.new(b64decode(the_key), AES.MODE_CBC, iv)
-    # 填充并加密
-    padded_data = pad(compressed, AES.block_size)
-    encrypted_data = cipher.encrypt(padded_data)
-    # 将IV和密文拼接在一起
-    # 格式: IV(16字节) + 密文
-    combined_data = iv + encrypted_data
-    # 5. Base64 编码
-    # 返回拼接后的数据（base64编码）
-    return b64encode(combined_data).decode('utf-8')
+    return get_cryptor().encrypt_legacy(plaintext.encode('utf-8'))
+
+
+def check_codec(codec_name: str = None):
+    """
+    启动时调用：加载密钥并检查压缩算法（默认取配置 codec）已注册，
+    zstd、lz4 未安装时在启动时失败，而不是在发送第一条数据时
+    """
+    get_cryptor()
+    if codec_name:
+        codec_util.get_codec_by_name(codec_name)
+
+
+def encrypt_bytes(plaintext: str, codec_name: str = None) -> bytes:
+    """
+    压缩 + 加密，返回二进制信封（格式见 envelope_util）
+    比 Base64 文本少约 33% 字节，以 application/octet-stream 上传
+    密钥、加密模式取配置 active_key_id / cipher_mode，密钥只在配置变化时重新解码
+    :param codec_name: 压缩算法（gzip/zlib/zstd/lz4），默认取配置 codec
+    """
+    codec = codec_util.get_codec_by_name(codec_name) if codec_name else None
+    return get_cryptor().encrypt(plaintext.encode('utf-8'), codec)
 
 
 if __name__ == "__main__":
@@ -50,3 +51,4 @@ if __name__ == "__main__":
     }
     print("发送到 API 的 JSON 数据：")
     print(json.dumps(payload, indent=2, ensure_ascii=False))
+    print(f"二进制信封: {len(encrypt_bytes(message))} 字节, Base64: {len(encrypted_data1)} 字节")
@@ -0,0 +1,67 @@
+# -*- coding:utf-8 -*-
+# @FileName  :envelope_util.py
+# @Time      :2026/10/17 16:48
+# @Author    :shi lei.wei  <slwei@eppei.com>.
+# 加密数据的二进制信封格式，采集端、服务端、客户端共用
+# V1: 版本(1字节, 0x81) + IV(16字节) + AES-256-CBC 密文，固定 gzip 压缩、密钥 0
+# V2: 版本(1字节, 0x82) + 压缩编号(1字节, 见 codec_util) + IV(16字节) + AES-256-CBC 密文，密钥 0
+# V3: 版本(1字节, 0x83) + 压缩编号(1字节) + 密钥编号(1字节) + 加密模式(1字节) + IV/nonce + 密文
+#     CBC 模式 IV 16 字节；GCM 模式 nonce 12 字节，密文末尾附 16 字节认证标签，信封头作为附加认证数据
+# 旧格式为 Base64(IV + 密文) 文本，全部是 ASCII 字符，首字节一定小于 0x80，据此区分
+from collections import namedtuple
+
+ENVELOPE_V1 = 0x81
+ENVELOPE_V2 = 0x82
+ENVELOPE_V3 = 0x83
+IV_SIZE = 16
+NONCE_SIZE = 12
+TAG_SIZE = 16
+MODE_CBC = 1
+MODE_GCM = 2
+# V1 与 Base64 旧格式使用的压缩编号（gzip）
+DEFAULT_CODEC_ID = 1
+# V1、V2 与 Base64 旧格式使用的密钥编号（配置项 key）
+DEFAULT_KEY_ID = 0
+# 二进制信封的 HTTP Content-Type
+BINARY_CONTENT_TYPE = "application/octet-stream"
+
+# header 为信封头（不含 IV），GCM 模式下作为附加认证数据
+Envelope = namedtuple("Envelope", ["version", "codec_id", "key_id", "mode", "header", "iv", "body"])
+
+
+def is_binary(blob) -> bool:
+    """是否为二进制信封（否则按旧的 Base64 文本处理）"""
+    return len(blob) > 0 and blob[0] >= 0x80
+
+
+def header(codec_id: int = DEFAULT_CODEC_ID, key_id: int = DEFAULT_KEY_ID, mode: int = MODE_CBC) -> bytes:
+    """生成信封头：能用 V1/V2 表示时保持旧格式，否则使用 V3"""
+    if key_id == DEFAULT_KEY_ID and mode == MODE_CBC:
+        if codec_id == DEFAULT_CODEC_ID:
+            return bytes((ENVELOPE_V1,))
+        return bytes((ENVELOPE_V2, codec_id))
+    return bytes((ENVELOPE_V3, codec_id, key_id, mode))
+
+
+def pack(iv: bytes, ciphertext: bytes, codec_id: int = DEFAULT_CODEC_ID, key_id: int = DEFAULT_KEY_ID,
+         mode: int = MODE_CBC) -> bytes:
+    """打包信封"""
+    return b"".join((header(codec_id, key_id, mode), iv, ciphertext))
+
+
+def unpack(blob) -> Envelope:
+    """拆分信封，IV 之后的密文（GCM 含认证标签）是原数据的视图，不复制"""
+    view = memoryview(blob)
+    version = view[0]
+    key_id, mode = DEFAULT_KEY_ID, MODE_CBC
+    if version == ENVELOPE_V1:
+        codec_id, offset = DEFAULT_CODEC_ID, 1
+    elif version == ENVELOPE_V2:
+        codec_id, offset = view[1], 2
+    elif version == ENVELOPE_V3:
+        codec_id, key_id, mode, offset = view[1], view[2], view[3], 4
+    else:
+        raise ValueError(f"unsupported envelope version: {version:#x}")
+    iv_size = NONCE_SIZE if mode == MODE_GCM else IV_SIZE
+    return Envelope(version, codec_id, key_id, mode, bytes(view[:offset]),
+                    bytes(view[offset:offset + iv_size]), view[offset + iv_size:])
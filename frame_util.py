@@ -0,0 +1,52 @@
+# -*- coding:utf-8 -*-
+# @FileName  :frame_util.py
+# @Time      :2026/10/17 14:25
+# @Author    :shi lei.wei  <slwei@eppei.com>.
+# ZMQ 多帧消息格式，服务端与客户端共用
+# 单条数据: [b"data", payload] 或带追踪帧 [b"data", payload, trace]
+# 批量数据: [b"batch", header, payload1, payload2, ...]，标志位含 FLAG_TRACED 时 header 之后是追踪帧
+# 心跳:     [b"heartbeat", zlib(json)]
+# 追踪帧格式见 trace_util
+import struct
+from typing import List, Optional, Tuple
+
+MSG_DATA = b"data"
+MSG_BATCH = b"batch"
+MSG_HEARTBEAT = b"heartbeat"
+
+# 批量头: 版本(1字节) + 标志位(1字节) + 条数(2字节)
+BATCH_VERSION = 1
+BATCH_HEADER = struct.Struct("!BBH")
+MAX_BATCH_SIZE = 0xFFFF
+# 批量头标志位：header 之后附带追踪帧
+FLAG_TRACED = 0x01
+
+
+def pack_data(payloads: List[bytes], trace: Optional[bytes] = None) -> list:
+    """
+    把一条或多条数据打包成多帧消息，只有一条时保持旧的 b"data" 格式
+    :param trace: 追踪帧，单条数据时追加在末尾（旧客户端只读前两帧），批量时放在 header 之后
+    """
+    if len(payloads) == 1:
+        return [MSG_DATA, payloads[0]] if trace is None else [MSG_DATA, payloads[0], trace]
+    if len(payloads) > MAX_BATCH_SIZE:
+        raise ValueError(f"batch too large: {len(payloads)}")
+    if trace is None:
+        return [MSG_BATCH, BATCH_HEADER.pack(BATCH_VERSION, 0, len(payloads))] + list(payloads)
+    return [MSG_BATCH, BATCH_HEADER.pack(BATCH_VERSION, FLAG_TRACED, len(payloads)), trace] + list(payloads)
+
+
+def unpack_message(message_parts: list) -> Tuple[list, Optional[bytes]]:
+    """拆分 b"data" / b"batch" 消息，返回 (各条数据, 追踪帧)，没有追踪帧时为 None"""
+    if message_parts[0] == MSG_DATA:
+        return message_parts[1:2], message_parts[2] if len(message_parts) > 2 else None
+    version, flags, count = BATCH_HEADER.unpack(message_parts[1])
+    if version != BATCH_VERSION:
+        raise ValueError(f"unsupported batch version: {version}")
+    trace = None
+    payloads = message_parts[2:]
+    if flags & FLAG_TRACED:
+        trace, payloads = payloads[0], payloads[1:]
+    if len(payloads) != count:
+        raise ValueError(f"batch size mismatch: header {count}, frames {len(payloads)}")
+    return payloads, trace
@@ -5,11 +5,19 @@
 
 # gunicorn.conf.py
 import multiprocessing
+import os
 
 # 服务器配置
 bind = "0.0.0.0:6100"
-workers = multiprocessing.cpu_count() * 2 + 1  # 工作进程数
-worker_class = "sync"  # 同步工作模式
+# 工作模式，环境变量 GUNICORN_WORKER_CLASS 选择:
+# - sync: 每个进程同时只处理一个请求，/api/data 在队列满时最多阻塞 5 秒，期间整个进程不可用
+# - gthread: 每个进程 threads 个线程，慢请求只占一个线程，登录、健康检查等接口不受影响
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS", "sync")
+if worker_class == "gthread":
+    workers = int(os.environ.get("GUNICORN_WORKERS", multiprocessing.cpu_count() + 1))  # 工作进程数
+    threads = int(os.environ.get("GUNICORN_THREADS", 16))  # 每个进程的线程数
+else:
+    workers = int(os.environ.get("GUNICORN_WORKERS", multiprocessing.cpu_count() * 2 + 1))  # 工作进程数
 worker_connections = 1000  # 每个工作进程的最大并发连接数
 timeout = 30  # 请求超时时间
 keepalive = 2  # Keep-Alive时间
@@ -21,7 +29,7 @@ loglevel = "info"
 access_log_format = '%(h)s %(l)s %(u)s %(t)s "%(r)s" %(s)s %(b)s "%(f)s" "%(a)s" %(D)s'
 
 # 进程管理
-preload_app = True  # 预加载应用
+preload_app = True  # 预加载应用（必须开启：共享计数在 master 中创建，发布进程只启动一次，worker 通过 ipc 汇聚数据）
 max_requests = 1000  # 每个工作进程处理1000个请求后重启
 max_requests_jitter = 100  # 随机抖动，避免所有进程同时重启
 
@@ -29,3 +37,15 @@ max_requests_jitter = 100  # 随机抖动，避免所有进程同时重启
 limit_request_line = 4094  # HTTP请求行最大长度
 limit_request_fields = 100  # 最大HTTP请求头字段数
 limit_request_field_size = 8190  # 最大HTTP请求头字段大小
+
+
+def when_ready(server):
+    """master 就绪、fork worker 之前启动发布进程的监督进程"""
+    import zeromq_server
+    zeromq_server.gun_app.publisher_supervisor.start(close_fds=[listener.fileno() for listener in server.LISTENERS])
+
+
+def on_exit(server):
+    """master 退出时停止发布进程（写出未推送的数据）"""
+    import zeromq_server
+    zeromq_server.gun_app.publisher_supervisor.stop()
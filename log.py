@@ -2,15 +2,23 @@
 # @FileName  :log.py
 # @Time      :2025/9/4 16:45
 # @Author    :shi lei.wei  <slwei@eppei.com>.
+import atexit
 import logging
 import os
+import queue
+import threading
+import time
 from logging.config import dictConfig
-from logging.handlers import TimedRotatingFileHandler
+from logging.handlers import QueueHandler, QueueListener, TimedRotatingFileHandler
 
 import yaml
 
+from config_manager import ConfigManager
+
 # 内部变量，不对外暴露
 _logger = None
+# setup_logger 安装的后台写日志处理器
+_background_handlers = []
 
 
 def get_logger(log_name='pec_cloud.log', log_level=logging.INFO):
@@ -39,6 +47,85 @@ def get_logger(log_name='pec_cloud.log', log_level=logging.INFO):
     return _logger
 
 
+class BackgroundHandler(QueueHandler):
+    """
+    后台写日志：调用线程只把记录放入队列，文件与控制台 I/O 由后台线程（QueueListener）完成。
+    后台线程在本进程第一次写日志时启动，gunicorn worker 与发布进程 fork 后各自启动自己的线程。
+    队列已满时丢弃并计数，不阻塞调用线程。
+    """
+
+    def __init__(self, handlers, maxsize=10000):
+        super().__init__(queue.Queue(maxsize))
+        self.targets = tuple(handlers)
+        self.maxsize = maxsize
+        self.dropped = 0
+        self._pid = None
+        self._listener = None
+        self._start_lock = threading.Lock()
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        # 父进程的后台线程不会带到子进程，队列中残留的记录由父进程写出
+        self.queue = queue.Queue(self.maxsize)
+        self._pid = None
+        self._listener = None
+        self._start_lock = threading.Lock()
+
+    def _start(self):
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            self._listener = QueueListener(self.queue, *self.targets, respect_handler_level=True)
+            self._listener.start()
+            self._pid = os.getpid()
+
+    def enqueue(self, record):
+        if self._pid != os.getpid():
+            self._start()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            return
+        if self.dropped:
+            dropped, self.dropped = self.dropped, 0
+            self.enqueue(logging.makeLogRecord({
+                "name": __name__, "levelno": logging.WARNING, "levelname": "WARNING",
+                "msg": "日志队列已满，丢弃 %d 条", "args": (dropped,)
+            }))
+
+    def stop(self):
+        """写出队列中剩余的记录并停止后台线程"""
+        with self._start_lock:
+            if self._listener is not None and self._pid == os.getpid():
+                self._listener.stop()
+            self._listener = None
+            self._pid = None
+
+
+def stop_logging():
+    """写出全部后台日志，进程退出前调用（multiprocessing 子进程不会执行 atexit）"""
+    for handler in _background_handlers:
+        handler.stop()
+
+
+def _install_background_handlers(config):
+    """把 dictConfig 配置在各 logger 上的处理器换成后台写日志，处理器相同的 logger 共用一个后台线程"""
+    loggers = [logging.getLogger()] + [logging.getLogger(name) for name in config.get("loggers", {})]
+    by_targets = {}
+    for lg in loggers:
+        if not lg.handlers:
+            continue
+        targets = tuple(lg.handlers)
+        handler = by_targets.get(targets)
+        if handler is None:
+            handler = BackgroundHandler(targets, ConfigManager.get_param_by_key("log_queue_size", 10000))
+            by_targets[targets] = handler
+            _background_handlers.append(handler)
+        lg.handlers = [handler]
+    atexit.register(stop_logging)
+
+
 def setup_logger(log_dir="log", log_name="app.log"):
     config_path = "log.yaml"
     with open(config_path, "r", encoding="utf-8") as f:
@@ -50,6 +137,85 @@ def setup_logger(log_dir="log", log_name="app.log"):
     os.makedirs(os.path.dirname(log_file_path), exist_ok=True)
     # 应用日志配置
     dictConfig(config)
+    # 文件 I/O 移到后台线程，请求线程与发布、接收循环只做入队
+    if ConfigManager.get_param_by_key("log_background", True):
+        _install_background_handlers(config)
+
+
+class _EventState:
+    __slots__ = ("rate", "sample", "tokens", "updated_at", "seen", "suppressed")
+
+    def __init__(self, rate, sample):
+        self.rate = rate
+        self.sample = max(1, sample)
+        self.tokens = float(max(1, rate))
+        self.updated_at = time.monotonic()
+        self.seen = 0
+        self.suppressed = 0
+
+
+class HotLogger:
+    """
+    每条数据、每个请求都会经过的路径上使用的日志
+    - 级别未开启时直接返回，不格式化；参数中的可调用对象只在确实输出时调用（如 queue_size）
+    - 采样：每个事件类型每 sample 条只取 1 条
+    - 限速：每个事件类型每秒最多输出 rate 条（rate 为 0 不限），超出的计数，下一次输出时附带省略的条数
+    默认值取配置 log_hot_rate、log_hot_sample，log_hot_events 按事件类型覆盖，如 {"publish": {"rate": 1}}
+    """
+
+    def __init__(self, logger: logging.Logger):
+        self.logger = logger
+        self._events = {}
+        self._lock = threading.Lock()
+
+    def _state(self, event) -> _EventState:
+        state = self._events.get(event)
+        if state is None:
+            override = ConfigManager.get_param_by_key("log_hot_events", {}).get(event, {})
+            state = _EventState(override.get("rate", ConfigManager.get_param_by_key("log_hot_rate", 10)),
+                                override.get("sample", ConfigManager.get_param_by_key("log_hot_sample", 1)))
+            self._events[event] = state
+        return state
+
+    def _admit(self, event):
+        """返回 None 表示不输出，否则返回此前省略的条数"""
+        with self._lock:
+            state = self._state(event)
+            state.seen += 1
+            if state.seen % state.sample:
+                state.suppressed += 1
+                return None
+            if state.rate:
+                now = time.monotonic()
+                state.tokens = min(float(state.rate), state.tokens + (now - state.updated_at) * state.rate)
+                state.updated_at = now
+                if state.tokens < 1:
+                    state.suppressed += 1
+                    return None
+                state.tokens -= 1
+            suppressed, state.suppressed = state.suppressed, 0
+            return suppressed
+
+    def _log(self, level, event, msg, *args):
+        if not self.logger.isEnabledFor(level):
+            return
+        suppressed = self._admit(event)
+        if suppressed is None:
+            return
+        args = tuple(arg() if callable(arg) else arg for arg in args)
+        if suppressed:
+            msg += " (省略 %d 条)"
+            args += (suppressed,)
+        self.logger.log(level, msg, *args, stacklevel=3)
+
+    def debug(self, event, msg, *args):
+        self._log(logging.DEBUG, event, msg, *args)
+
+    def info(self, event, msg, *args):
+        self._log(logging.INFO, event, msg, *args)
+
+    def warning(self, event, msg, *args):
+        self._log(logging.WARNING, event, msg, *args)
 
 
 if __name__ == "__main__":
@@ -3,54 +3,50 @@
 # @Time      :2025/8/28 21:32
 # @Author    :shi lei.wei  <slwei@eppei.com>.
 # 可选：在应用关闭时清理资源
-import hashlib
+import atexit
 import logging
-import random
 import sqlite3
 import threading
-import time
 from contextlib import contextmanager
-# 推荐使用 queue 来管理线程池
-from multiprocessing import Queue
-from queue import Empty
-
 # app.py
 from flask import Flask, request, jsonify
 
+import auth_util
+import login_db
+from bounded_executor import BoundedExecutor, TaskRejected
+from daily_units import DailyUnits
 from config_manager import ConfigManager, load_config
+from log import HotLogger
+from login_writer import LoginWriter
+from read_cache import GenerationCache
+from unit_registry import ActiveUnitRegistry
+from weighted_sampler import WeightedSampler
 
 logger = logging.getLogger(__name__)
+hot_logger = HotLogger(logger)
 # --- 配置 ---
 DB_NAME = 'login_status.db'
 # 线程池大小
 THREAD_POOL_SIZE = 4
-active_unit = {}
-# API_KEY
-API_KEYS = {
-    "unit-epm-pm-epise-chd-gs-pec": "1974596b2bb3423e8ec16ea0851455a8"
-}
+# 各 worker 共享的活跃账号登记表，在 LoginApi 初始化时创建
+unit_registry: ActiveUnitRegistry = None
+# 登录记录批量写入器，在 LoginApi 初始化时按配置创建
+db_writer: LoginWriter = None
+# GET /api/login_status 的读缓存，按批量写入器的提交代数失效，在 LoginApi 初始化时创建
+status_cache: GenerationCache = None
+# 当天登录过的账号（daily_units 汇总表 + 进程内缓存），在 LoginApi 初始化时创建
+daily_units: DailyUnits = None
 
 
 # --- 数据库初始化 ---
 def init_db():
-    """初始化数据库，创建表（如果不存在）"""
-    # 使用上下文管理器确保连接关闭
-    with get_db_connection() as conn:
-        c = conn.cursor()
-        # 使用 IF NOT EXISTS 确保幂等性
-        c.execute('''
-            CREATE TABLE IF NOT EXISTS logins (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                unit TEXT NOT NULL,
-                unit_id INTEGER NOT NULL,
-                timestamp TEXT NOT NULL,
-                machine TEXT NOT NULL,
-                state INTEGER,
-                ip TEXT -- 客户端IP
-            )
-        ''')
-        conn.commit()
-        logger.info("数据库已初始化或已存在。")
+    """初始化数据库：切换到 WAL 模式并执行未执行的表结构迁移（见 login_db.MIGRATIONS）"""
+    conn = login_db.connect(DB_NAME)
+    try:
+        version = login_db.migrate(conn)
+    finally:
+        conn.close()
+    logger.info("数据库已初始化，版本: %d", version)
 
 
 # --- 数据库连接管理 ---
@@ -99,79 +95,19 @@ def close_thread_db_connection():
             delattr(local_storage, 'connection')
 
 
-# --- 任务池实现 ---
-class TaskPool:
-    """一个简单的线程池实现"""
-
-    def __init__(self, num_threads):
-        self.tasks = Queue()
-        self.threads = []
-        self.running = True
-        for _ in range(num_threads):
-            t = threading.Thread(target=self.worker)
-            # 主线程结束时，守护线程也会结束
-            t.daemon = True
-            t.start()
-            self.threads.append(t)
-
-    def worker(self):
-        """工作线程函数"""
-        while self.running:
-            try:
-                # 从队列中获取任务，设置超时以便能响应 self.running 状态
-                func, args, kwargs = self.tasks.get(timeout=1)
-                try:
-                    func(*args, **kwargs)
-                except Exception as e:
-                    logger.error(f"线程池任务执行出错: {e}")
-                    logger.exception(e)
-                # finally:
-                #     self.tasks.task_done()
-            except Empty:
-                # 超时，继续检查 self.running
-                continue
-
-    def add_task(self, func, *args, **kwargs):
-        """向线程池添加任务"""
-        if self.running:
-            self.tasks.put((func, args, kwargs))
-            logger.info("add task success!")
-
-    # def wait_completion(self):
-    #     """等待所有任务完成"""
-    #     self.tasks.join()
-
-    def shutdown(self):
-        """关闭线程池"""
-        logger.info("关闭线程池")
-        self.running = False
-        # 等待所有线程结束
-        for t in self.threads:
-            t.join()
-
-
-# 全局线程池实例
-task_pool = TaskPool(THREAD_POOL_SIZE)
+# 后台任务线程池，在 LoginApi 初始化时按配置创建，线程在 fork 后第一次提交任务时启动
+task_pool: BoundedExecutor = None
 
 
 # --- 数据库操作函数 (在后台线程中执行) ---
 def _record_login_to_db(unit, unit_id, timestamp, machine, state, ip):
-    """实际执行数据库写入的操作"""
+    """交给批量写入器，与其他事件合并在一个事务中提交"""
     try:
-        with get_db_connection() as conn:
-            c = conn.cursor()
-            c.execute(
-                "INSERT INTO logins (unit, unit_id, timestamp, machine, state, ip) VALUES (?, ?, ?, ?, ?, ?)",
-                (unit, unit_id, timestamp, machine, state, ip)
-            )
-            conn.commit()
-            logger.info(f"用户 {unit} 登录状态已记录到数据库 (线程: {threading.get_ident()})")
+        if db_writer.add(unit, unit_id, timestamp, machine, state, ip):
+            hot_logger.info("login_queued", "用户 %s 登录状态已加入写入队列", unit)
     except Exception as e:
         logger.error(f"记录登录状态到数据库时出错: {e}")
         logger.exception(e)
-    # finally:
-    #     # 可选：任务完成后关闭线程的数据库连接
-    #     close_thread_db_connection()
 
 
 def _get_status_from_db(limit=10):
@@ -186,16 +122,90 @@ class LoginApi:
     def __init__(self, app: Flask):
         self.app = app
         self.unit_pool = ConfigManager.get_init_param_by_key("unit_pool")
+        # 按优先级加权抽取空闲账号，首次使用时创建
+        self._sampler: WeightedSampler = None
+        self._sampler_lock = threading.Lock()
         self.unit_name = ConfigManager.get_init_param_by_key("unit_name")
+        # 签名校验中间件，create_app 已注册时复用（防重放缓存需要在 fork 前创建）
+        self.auth: auth_util.SignatureAuth = app.extensions.get(auth_util.EXTENSION_NAME)
+        if self.auth is None:
+            self.auth = auth_util.SignatureAuth()
+            self.auth.init_app(app)
         self.init_db()
+        self._init_db_writer()
+        self._init_status_cache()
+        self._init_daily_units()
+        self._init_task_pool()
+        self._init_unit_registry()
         self._register_routes()
-        # atexit.register(self.cleanup)
+        atexit.register(self.cleanup)
 
     def init_db(self):
         # 应用启动时初始化数据库
         with self.app.app_context():
             init_db()
 
+    @staticmethod
+    def _init_task_pool():
+        global task_pool
+        if task_pool is None:
+            task_pool = BoundedExecutor(
+                num_threads=ConfigManager.get_param_by_key("task_pool_size", THREAD_POOL_SIZE),
+                queue_size=ConfigManager.get_param_by_key("task_queue_size", 10000),
+                # block / reject / coalesce
+                policy=ConfigManager.get_param_by_key("task_full_policy", "block"),
+                block_timeout=ConfigManager.get_param_by_key("task_block_timeout", 5)
+            )
+
+    @staticmethod
+    def _init_unit_registry():
+        global unit_registry
+        if unit_registry is None:
+            unit_registry = ActiveUnitRegistry(DB_NAME, ttl=ConfigManager.get_param_by_key("active_unit_ttl", 43200))
+
+    @staticmethod
+    def _init_db_writer():
+        global db_writer
+        if db_writer is None:
+            db_writer = LoginWriter(
+                DB_NAME,
+                batch_size=ConfigManager.get_param_by_key("login_writer_batch_size", 500),
+                max_latency=ConfigManager.get_param_by_key("login_writer_max_latency_ms", 50) / 1000.0,
+                queue_size=ConfigManager.get_param_by_key("login_writer_queue_size", 10000)
+            )
+
+    @staticmethod
+    def _init_status_cache():
+        global status_cache
+        if status_cache is None:
+            status_cache = GenerationCache(
+                db_writer.generation, max_entries=ConfigManager.get_param_by_key("login_status_cache_size", 256))
+
+    @staticmethod
+    def _init_daily_units():
+        global daily_units
+        if daily_units is None:
+            daily_units = DailyUnits(DB_NAME, db_writer.generation)
+
+    def _query_status(self, unit, limit) -> bytes:
+        """查询最近的登录记录，返回编码好的 JSON"""
+        with get_db_connection() as conn:
+            c = conn.cursor()
+            # 分别走 (unit, ts) 与 (ts) 索引倒序扫描，取到 limit 条即停止
+            if unit:
+                query_sql = ("SELECT id, unit, unit_id, timestamp, machine, state, ip FROM logins "
+                             "WHERE unit=? ORDER BY ts DESC LIMIT ?")
+                c.execute(query_sql, (unit, limit))
+            else:
+                query_sql = ("SELECT id, unit, unit_id, timestamp, machine, state, ip FROM logins "
+                             "ORDER BY ts DESC LIMIT ?")
+                c.execute(query_sql, (limit,))
+            rows = c.fetchall()
+        # 使用 sqlite3.Row 可以像字典一样访问列
+        logins = [dict(row) for row in rows]
+        # 与 jsonify 的输出相同
+        return (self.app.json.dumps(logins) + "\n").encode("utf-8")
+
     def _register_routes(self):
         logger.info("register login api")
 
@@ -205,10 +215,12 @@ class LoginApi:
             data = request.get_json()
             if not data:
                 return jsonify({"error": "无效的JSON数据"}), 400
-            logger.info("received: %s", data)
             unit = data.get('unitName')
             timestamp = data.get('timestamp')
             machine = data.get('uniqueId', 'Unknown')
+            # 不输出完整请求体，完整内容在 DEBUG 级别
+            hot_logger.info("login_received", "received: %s, %s, %s", unit, timestamp, machine)
+            logger.debug("received: %s", data)
             # 获取客户端IP
             # ip = request.environ.get('HTTP_X_REAL_IP', request.remote_addr)
             ip = data.get('ip')
@@ -218,9 +230,13 @@ class LoginApi:
                     logger.error("unknown unit: %s", unit)
                     return jsonify({"status": "unknown unit, no content"}), 204
                 # 记录活跃的账号
-                active_unit.setdefault(machine, unit_id)
+                unit_registry.activate(machine, unit_id)
                 # 将写入数据库的任务提交到线程池，避免阻塞HTTP响应
-                task_pool.add_task(_record_login_to_db, unit, unit_id, timestamp, machine, 1, ip)
+                try:
+                    task_pool.add_task(_record_login_to_db, unit, unit_id, timestamp, machine, 1, ip,
+                                       key=(machine, 1))
+                except TaskRejected:
+                    return jsonify({"error": "Queue full, try again later"}), 503
                 # 202 Accepted
                 return jsonify({"status": "received and queued"}), 202
             else:
@@ -230,48 +246,27 @@ class LoginApi:
         def get_status():
             """获取登录状态 (直接在请求线程中执行查询)"""
             try:
-                # 直接在处理HTTP请求的线程中执行查询
-                # 如果查询非常耗时，可以考虑也放入线程池
+                # 看板以相同的参数频繁轮询：按 (unit, limit) 缓存编码好的响应，有新的登录记录提交后失效
                 limit = request.args.get('limit', 10, type=int)
                 unit = request.args.get('unit', type=str)
-                with get_db_connection() as conn:
-                    c = conn.cursor()
-                    if unit:
-                        query_sql = ("SELECT id, unit, unit_id, timestamp, machine, state, ip FROM logins "
-                                     "WHERE unit=? ORDER BY timestamp DESC LIMIT ?")
-                        c.execute(query_sql, (unit, limit))
-                    else:
-                        query_sql = ("SELECT id, unit, unit_id, timestamp, machine, state, ip FROM logins "
-                                     "ORDER BY timestamp DESC LIMIT ?")
-                        c.execute(query_sql, (limit,))
-                    rows = c.fetchall()
-                # 使用 sqlite3.Row 可以像字典一样访问列
-                logins = [dict(row) for row in rows]
-                return jsonify(logins)
+                body = status_cache.get_or_load((unit, limit), lambda: self._query_status(unit, limit))
+                return self.app.response_class(body, mimetype="application/json")
             except Exception as e:
                 logger.error(f"查询数据库时出错: {e}")
                 logger.exception(e)
                 return jsonify({"error": "内部服务器错误"}), 500
 
         @self.app.route('/api/available_unit', methods=['GET'])
+        @self.auth.require
         def get_available_unit():
             """获取可登录的账号"""
             try:
-                # 获取请求头
-                api_key = request.headers.get('X-API-Key')
-                timestamp = request.headers.get('X-Timestamp')
-                signature = request.headers.get('X-Signature')
-                # 验证签名
-                if not all([api_key, timestamp, signature]):
-                    return jsonify({'error': 'Missing authentication headers'}), 401
-
-                if not self.verify_signature(api_key, timestamp, signature):
-                    return jsonify({'error': 'Invalid signature'}), 401
-                # 返回非活跃的账号
-                active_units = active_unit.values()
-                if not active_units:
-                    active_units = self.get_today_unit()
-                return self.get_random_name_by_priority(list(active_units))
+                # 返回非活跃的账号；登记表未变化时返回同一个对象，抽样器不需要重新比较
+                active = unit_registry.snapshot()
+                if active:
+                    return self.get_random_name_by_priority(active.values(), version=active)
+                today_units = self.get_today_unit()
+                return self.get_random_name_by_priority(today_units, version=today_units)
             except Exception as e:
                 logger.error(f"查询数据库时出错: {e}")
                 logger.exception(e)
@@ -288,11 +283,17 @@ class LoginApi:
                 unit = data.get('unitName')
                 timestamp = data.get('timestamp')
                 machine = data.get('uniqueId', 'Unknown')
-                if machine in active_unit:
+                active_unit_id = unit_registry.deactivate(machine)
+                if active_unit_id is not None:
                     unit_id = self.unit_name.get(unit)
-                    active_unit.pop(machine)
                     ip = data.get('ip')
-                    task_pool.add_task(_record_login_to_db, unit, unit_id, timestamp, machine, 0, ip)
+                    try:
+                        task_pool.add_task(_record_login_to_db, unit, unit_id, timestamp, machine, 0, ip,
+                                           key=(machine, 0))
+                    except TaskRejected:
+                        # 登出未能记录，恢复活跃状态，由客户端重试
+                        unit_registry.activate(machine, active_unit_id)
+                        return jsonify({"error": "Queue full, try again later"}), 503
                     logger.info("unit logout: %s, %s", unit, timestamp)
                 else:
                     logger.warning("unit not active: %s, %s, %s", unit, timestamp, machine)
@@ -302,58 +303,63 @@ class LoginApi:
                 logger.exception(e)
                 return jsonify({"error": "内部服务器错误"}), 500
 
+        @self.app.route('/api/login_stats', methods=['GET'])
+        def login_stats():
+            """后台线程池、批量写入器与活跃账号统计"""
+            return jsonify({
+                "task_pool": task_pool.stats(),
+                "writer": {
+                    "queue": db_writer.qsize(),
+                    "enqueued": db_writer.enqueued,
+                    "committed": db_writer.committed,
+                    "failed": db_writer.failed,
+                    "invalid": db_writer.invalid,
+                    "batches": db_writer.batches
+                },
+                "active_units": len(unit_registry),
+                "status_cache": status_cache.stats()
+            })
+
     def cleanup(self):
         logger.info("正在关闭应用...")
+        # 先执行完排队中的任务，再写完批量写入器中的记录
         task_pool.shutdown()
+        # 写完队列中剩余的登录记录
+        db_writer.close()
+        unit_registry.close()
+        daily_units.close()
         # 关闭所有线程的数据库连接
         # 这在守护线程和应用退出时可能不是必须的，但作为示例
         # 可以遍历所有活动线程并调用 close_thread_db_connection
         # 但在简单场景下，Python的垃圾回收通常会处理这些。
 
-    def get_random_name_by_priority(self, active_name):
+    def get_random_name_by_priority(self, active_name, version=None):
         """
-        从 name_pool 中随机选择一个不在 active_name 列表中的 key，
-        选择时根据 value（优先级）进行加权。
+        从 unit_pool 中随机选择一个不在 active_name 中的 key，
+        选择时根据 value（优先级）进行加权，优先级数值越小越容易被选中。
+        权重保存在 WeightedSampler 中，只同步 active_name 的变化，抽取为 O(log n)；
+        version 与上次相同时不遍历 active_name；unit_pool 配置变化时重建。
 
         Args:
-            # name_pool (dict): 名称和优先级的字典，如 {"name1": 23, "name2": 30}
-            active_name (list): 当前活跃的名称列表
+            active_name (iterable): 当前活跃的账号编号（int 或 str 均可）
+            version: active_name 的数据版本，见 WeightedSampler.set_active
 
         Returns:
             str or None: 选中的名称，如果没有符合条件的返回 None
         """
-        # 过滤出不在 active_name 中的候选 key
-        candidates = [name for name in self.unit_pool.keys() if name not in active_name]
-        # 如果没有候选者，返回 None
-        if not candidates:
-            return None
-        # 提取对应候选者的优先级（权重）
-        weights = [1 / self.unit_pool[name] for name in candidates]
-        # 使用 random.choices 进行加权随机选择（weights 参数）
-        # k=1 表示返回一个元素，结果是列表，取第一个
-        chosen = random.choices(candidates, weights=weights, k=1)[0]
-        return chosen
-
-    def verify_signature(self, api_key, timestamp, signature):
-        """验证签名"""
-        if api_key not in API_KEYS:
-            return False
-        # 检查时间戳（防止重放攻击，允许5分钟偏差）
-        current_time = int(time.time())
-        if abs(current_time - int(timestamp)) > 300:
-            return False
-        secret_key = API_KEYS[api_key]
-        sign_string = f"{api_key}{timestamp}{secret_key}"
-        expected_signature = hashlib.sha256(sign_string.encode()).hexdigest()
-        return signature == expected_signature
-
-    def get_today_unit(self):
-        with get_db_connection() as conn:
-            c = conn.cursor()
-            query_sql = "SELECT unit_id FROM logins WHERE date(timestamp) = date('now') AND state=1"
-            c.execute(query_sql)
-            rows = c.fetchall()
-        return [row[0] for row in rows]
+        with self._sampler_lock:
+            unit_pool = ConfigManager.get_param_by_key("unit_pool", self.unit_pool)
+            if self._sampler is None or unit_pool is not self.unit_pool:
+                self.unit_pool = unit_pool
+                self._sampler = WeightedSampler.from_priority(unit_pool)
+                logger.info("unit_pool 已加载，共 %d 个账号", len(self._sampler))
+            self._sampler.set_active(active_name, version)
+            return self._sampler.sample()
+
+    @staticmethod
+    def get_today_unit():
+        """当天登录过的账号，读取写入时维护的每日汇总，不扫描 logins 表"""
+        return daily_units.today_unit_ids()
 
 
 # --- 测试应用入口 ---
@@ -0,0 +1,182 @@
+# -*- coding:utf-8 -*-
+# @FileName  :login_db.py
+# @Time      :2026/10/17 20:30
+# @Author    :shi lei.wei  <slwei@eppei.com>.
+# 登录记录数据库：连接设置、按 PRAGMA user_version 编号的表结构迁移、时间换算
+import logging
+import sqlite3
+import time
+from datetime import datetime
+from collections import Counter
+from typing import Callable, Iterable, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 客户端上报的时间格式，如 2025/10/10 15:42:31
+_TIME_FORMATS = ("%Y/%m/%d %H:%M:%S", "%Y-%m-%d %H:%M:%S", "%Y/%m/%d %H:%M:%S.%f", "%Y-%m-%d %H:%M:%S.%f")
+
+
+def connect(db_path: str, timeout: float = 5.0) -> sqlite3.Connection:
+    """
+    打开数据库连接并切换到 WAL 模式
+    WAL 下读不阻塞写，synchronous=NORMAL 只在 checkpoint 时 fsync，
+    多个 gunicorn worker 的写入在 busy_timeout 内排队而不是直接报 database is locked
+    """
+    conn = sqlite3.connect(db_path, timeout=timeout, check_same_thread=False, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+def to_epoch(timestamp, default=None) -> int:
+    """
+    把客户端上报的时间换算为秒级时间戳（本地时区，容器中为 Asia/Shanghai）
+    支持秒/毫秒数字、"2025/10/10 15:42:31" 与 ISO 8601 字符串，无法解析时返回 default（默认当前时间）
+    """
+    if isinstance(timestamp, str):
+        text = timestamp.strip()
+        try:
+            timestamp = float(text)
+        except ValueError:
+            for fmt in _TIME_FORMATS:
+                try:
+                    return int(datetime.strptime(text, fmt).timestamp())
+                except ValueError:
+                    pass
+            try:
+                return int(datetime.fromisoformat(text).timestamp())
+            except ValueError:
+                timestamp = None
+    if isinstance(timestamp, (int, float)) and not isinstance(timestamp, bool):
+        # 毫秒时间戳
+        return int(timestamp / 1000) if timestamp > 1e11 else int(timestamp)
+    return int(time.time()) if default is None else default
+
+
+def day_bounds(now: float = None) -> Tuple[int, int]:
+    """本地时区当天的 [开始, 结束) 秒级时间戳，用于按 ts 做索引范围查询"""
+    day = datetime.fromtimestamp(time.time() if now is None else now).replace(
+        hour=0, minute=0, second=0, microsecond=0)
+    start = int(day.timestamp())
+    # 按日历日加一天，避免夏令时等情况下一天不是 86400 秒
+    end = int(datetime.fromordinal(day.toordinal() + 1).timestamp())
+    return start, end
+
+
+def day_key(ts: float) -> int:
+    """本地时区的日期编号，如 20251010，daily_units 表按此分天"""
+    day = datetime.fromtimestamp(ts)
+    return day.year * 10000 + day.month * 100 + day.day
+
+
+def record_daily_units(conn: sqlite3.Connection, rows: Iterable[tuple]):
+    """
+    在写入 logins 的同一事务中累加每日账号汇总
+    rows 为 (unit_id, state, ts)，unit_id 为空（未知账号）的跳过
+    """
+    counts = Counter((day_key(ts), unit_id, state) for unit_id, state, ts in rows if unit_id is not None)
+    conn.executemany(
+        "INSERT INTO daily_units (day, unit_id, logins, logouts) VALUES (?, ?, ?, ?) "
+        "ON CONFLICT(day, unit_id) DO UPDATE SET "
+        "logins = logins + excluded.logins, logouts = logouts + excluded.logouts",
+        [(day, unit_id, n if state == 1 else 0, 0 if state == 1 else n) for (day, unit_id, state), n in counts.items()]
+    )
+
+
+# --- 表结构迁移 ---
+# 每个迁移把 user_version 加一，已执行过的迁移不会重复执行
+
+def _migrate_v1(conn: sqlite3.Connection):
+    """初始表结构"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS logins (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            unit TEXT NOT NULL,
+            unit_id INTEGER NOT NULL,
+            timestamp TEXT NOT NULL,
+            machine TEXT NOT NULL,
+            state INTEGER,
+            ip TEXT -- 客户端IP
+        )
+    ''')
+
+
+def _migrate_v2(conn: sqlite3.Connection):
+    """增加秒级时间戳列 ts 并回填，按查询条件建索引"""
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(logins)")]
+    if "ts" not in columns:
+        conn.execute("ALTER TABLE logins ADD COLUMN ts INTEGER NOT NULL DEFAULT 0")
+    # 无法解析的历史时间记为 0
+    conn.create_function("to_epoch", 1, lambda value: to_epoch(value, 0), deterministic=True)
+    conn.execute("UPDATE logins SET ts = to_epoch(timestamp) WHERE ts = 0")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_logins_unit_ts ON logins (unit, ts)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_logins_state_ts ON logins (state, ts)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_logins_ts ON logins (ts)")
+
+
+def _migrate_v3(conn: sqlite3.Connection):
+    """各 worker 共享的活跃机器表，见 unit_registry"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS active_units (
+            machine TEXT PRIMARY KEY,
+            unit_id INTEGER NOT NULL,
+            last_seen INTEGER NOT NULL
+        )
+    ''')
+
+
+def _migrate_v4(conn: sqlite3.Connection):
+    """
+    每日账号汇总表（本地日期、账号 -> 登录/登出次数），由批量写入器在同一事务中维护，见 daily_units
+    回填最近 31 天，更早的日期不会再被查询
+    """
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS daily_units (
+            day INTEGER NOT NULL,
+            unit_id INTEGER NOT NULL,
+            logins INTEGER NOT NULL DEFAULT 0,
+            logouts INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, unit_id)
+        ) WITHOUT ROWID
+    ''')
+    conn.create_function("day_key", 1, day_key, deterministic=True)
+    start, _ = day_bounds(time.time() - 30 * 86400)
+    conn.execute('''
+        INSERT OR REPLACE INTO daily_units (day, unit_id, logins, logouts)
+        SELECT day_key(ts), unit_id, SUM(state = 1), SUM(state = 0) FROM logins
+        WHERE ts >= ? GROUP BY 1, 2
+    ''', (start,))
+
+
+MIGRATIONS: List[Callable[[sqlite3.Connection], None]] = [
+    _migrate_v1,
+    _migrate_v2,
+    _migrate_v3,
+    _migrate_v4,
+]
+
+
+def migrate(conn: sqlite3.Connection) -> int:
+    """
+    执行尚未执行的迁移，返回迁移后的版本号
+    每个迁移与 user_version 的更新在同一事务中，多个进程同时启动时由写锁串行，
+    拿到写锁后重新读取版本号，不会重复执行
+    """
+    target = len(MIGRATIONS)
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    while version < target:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            if version >= target:
+                conn.execute("COMMIT")
+                break
+            MIGRATIONS[version](conn)
+            version += 1
+            conn.execute(f"PRAGMA user_version = {version}")
+            conn.execute("COMMIT")
+            logger.info("数据库已迁移到版本 %d", version)
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+    return version
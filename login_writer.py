@@ -0,0 +1,215 @@
+# -*- coding:utf-8 -*-
+# @FileName  :login_writer.py
+# @Time      :2026/10/17 19:40
+# @Author    :shi lei.wei  <slwei@eppei.com>.
+# 登录/登出事件的批量写入器：WAL + synchronous=NORMAL，多条事件合并为一个事务提交
+import logging
+import multiprocessing
+import os
+import queue
+import sqlite3
+import threading
+import time
+from typing import Optional, Sequence
+
+from login_db import connect, record_daily_units, to_epoch
+
+logger = logging.getLogger(__name__)
+
+INSERT_SQL = ("INSERT INTO logins (unit, unit_id, timestamp, machine, state, ip, ts) "
+              "VALUES (?, ?, ?, ?, ?, ?, ?)")
+
+
+class LoginWriter:
+    """
+    单线程批量写入器，每个进程一个:
+    - add 只把事件放入有界内存队列，不等待数据库
+    - 写线程攒够 batch_size 条或最早一条等待超过 max_latency 秒后，用 executemany 在一个事务中提交
+    - close 把队列中剩余事件全部写完再退出
+    - 写线程在第一次 add 时启动，gunicorn preload 时 fork 之后各 worker 各自启动
+    - 每次提交后递增共享的提交代数 generation（fork 前创建，各 worker 共用），读缓存据此失效
+    """
+
+    def __init__(self, db_path: str, batch_size: int = 500, max_latency: float = 0.05, queue_size: int = 10000,
+                 generation=None):
+        """
+        :param db_path: 数据库文件路径
+        :param batch_size: 单个事务最多写入的事件数
+        :param max_latency: 事件从入队到提交的最长等待时间（秒）
+        :param queue_size: 内存队列长度，满时 add 阻塞
+        :param generation: 提交代数（multiprocessing.Value），默认新建
+        """
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.max_latency = max_latency
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._pid = None
+        self._closed = False
+        self._count_lock = threading.Lock()
+        # 已入队、已提交、写入失败、缺少必填字段被跳过的事件数与事务数，都在 _count_lock 下更新
+        self.enqueued = 0
+        self.committed = 0
+        self.failed = 0
+        self.invalid = 0
+        self.batches = 0
+        self.generation = generation if generation is not None else multiprocessing.Value('q', 0)
+
+    def add(self, unit, unit_id, timestamp, machine, state, ip) -> bool:
+        """
+        提交一条登录(state=1)/登出(state=0)事件
+        unit、unit_id、timestamp、machine 不能为空（logins 表的 NOT NULL 列），为空时跳过并返回 False，
+        不让一条坏数据进入批量事务
+        """
+        if self._closed:
+            raise RuntimeError("LoginWriter closed")
+        if unit is None or unit_id is None or timestamp is None or machine is None:
+            with self._count_lock:
+                self.invalid += 1
+            logger.warning("跳过缺少必填字段的登录记录: unit=%s, unit_id=%s, timestamp=%s, machine=%s",
+                           unit, unit_id, timestamp, machine)
+            return False
+        self._ensure_started()
+        self._queue.put((unit, unit_id, timestamp, machine, state, ip, to_epoch(timestamp)))
+        with self._count_lock:
+            self.enqueued += 1
+        return True
+
+    def qsize(self) -> int:
+        return self._queue.qsize()
+
+    def _ensure_started(self):
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+        with self._lock:
+            if self._pid != pid:
+                # fork 前创建的队列与线程在子进程中不可用，重新创建
+                if self._pid is not None:
+                    self._queue = queue.Queue(maxsize=self._queue.maxsize)
+                self._thread = threading.Thread(target=self._run, name="LoginWriter", daemon=True)
+                self._thread.start()
+                self._pid = pid
+
+    def _run(self):
+        conn = connect(self.db_path)
+        try:
+            while True:
+                rows = self._collect()
+                if rows is None:
+                    break
+                if rows:
+                    self._write(conn, rows)
+        finally:
+            conn.close()
+
+    def _collect(self):
+        """取一批事件；收到结束标记且队列已空时返回 None"""
+        try:
+            item = self._queue.get(timeout=1)
+        except queue.Empty:
+            return None if self._closed else []
+        if item is None:
+            return None
+        rows = [item]
+        deadline = time.monotonic() + self.max_latency
+        while len(rows) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                # 结束标记放回去，本批写完后退出
+                self._queue.put(item)
+                break
+            rows.append(item)
+        return rows
+
+    @staticmethod
+    def _insert_each(conn: sqlite3.Connection, rows: Sequence[tuple]):
+        """逐条插入，跳过违反约束的行，返回插入成功的行（调用方已开启事务）"""
+        written = []
+        for row in rows:
+            try:
+                conn.execute(INSERT_SQL, row)
+                written.append(row)
+            except sqlite3.IntegrityError as e:
+                # 单条语句失败只回滚该语句，事务中其他行不受影响
+                logger.error("丢弃违反约束的登录记录 %s: %s", row, e)
+        return written
+
+    def _write(self, conn: sqlite3.Connection, rows: Sequence[tuple], retries: int = 3):
+        each = False
+        for attempt in range(1, retries + 1):
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                if each:
+                    written = self._insert_each(conn, rows)
+                else:
+                    conn.executemany(INSERT_SQL, rows)
+                    written = rows
+                # 每日账号汇总与登录记录在同一事务中提交
+                record_daily_units(conn, ((row[1], row[4], row[6]) for row in written))
+                conn.execute("COMMIT")
+                with self.generation.get_lock():
+                    self.generation.value += 1
+                with self._count_lock:
+                    self.committed += len(written)
+                    self.failed += len(rows) - len(written)
+                    self.batches += 1
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("批量写入 %d 条登录记录", len(written))
+                return
+            except sqlite3.IntegrityError as e:
+                # 批量中有违反约束的行：整批回滚后逐条重试，只丢弃出错的行
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                if each:
+                    logger.exception(f"逐条写入登录记录失败: {e}")
+                    break
+                logger.warning("批量写入登录记录违反约束，改为逐条写入: %s", e)
+                each = True
+            except sqlite3.OperationalError as e:
+                # 其他 worker 长时间占用写锁（busy_timeout 已等待过），稍后整批重试
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                logger.warning("批量写入登录记录失败（第 %d 次）: %s", attempt, e)
+                time.sleep(0.1 * attempt)
+            except Exception as e:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                logger.exception(f"批量写入登录记录失败: {e}")
+                break
+        with self._count_lock:
+            self.failed += len(rows)
+        logger.error("丢弃 %d 条登录记录", len(rows))
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """等待当前已入队的事件全部提交，返回是否在超时前完成"""
+        with self._count_lock:
+            target = self.enqueued
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._done_count() < target and self._thread and self._thread.is_alive():
+            if deadline is not None and time.monotonic() > deadline:
+                return False
+            time.sleep(min(self.max_latency, 0.01))
+        return True
+
+    def _done_count(self) -> int:
+        with self._count_lock:
+            return self.committed + self.failed
+
+    def close(self, timeout: float = 10.0):
+        """停止接收新事件，写完队列中剩余事件后退出"""
+        if self._closed:
+            return
+        self._closed = True
+        thread = self._thread
+        if thread and thread.is_alive() and self._pid == os.getpid():
+            self._queue.put(None)
+            thread.join(timeout)
+            if thread.is_alive():
+                logger.warning("登录记录写入超时，剩余 %d 条未写入", self._queue.qsize())
+        logger.info("LoginWriter 已关闭，共写入 %d 条，%d 个事务", self.committed, self.batches)
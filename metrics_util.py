@@ -0,0 +1,276 @@
+# -*- coding:utf-8 -*-
+# @FileName  :metrics_util.py
+# @Time      :2026/10/17 23:30
+# @Author    :shi lei.wei  <slwei@eppei.com>.
+# 多进程共享的指标注册表，输出 Prometheus 文本格式
+# 指标值保存在共享内存 RawArray 中，必须在 fork（gunicorn worker、发布进程）之前创建全部指标，
+# 之后任一进程的更新对其他进程可见，/metrics 在任一 worker 中渲染的都是全局数值
+import bisect
+import logging
+import multiprocessing
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Iterable, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+# 默认耗时分桶（秒）
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class MetricsRegistry:
+    """
+    指标注册表，每个指标（含每个标签值）在共享数组中占固定的槽位
+    标签值需要在创建指标时全部给出，fork 之后不能再新增指标或标签值
+    """
+
+    def __init__(self, capacity: int = 4096, lock_stripes: int = 16):
+        """
+        :param capacity: 共享数组的槽位数
+        :param lock_stripes: 跨进程锁的数量，不同槽位分散到不同的锁上减少争用
+        """
+        self._values = multiprocessing.RawArray('d', capacity)
+        self._locks = [multiprocessing.Lock() for _ in range(lock_stripes)]
+        self._next = 0
+        self._metrics = []
+
+    def _alloc(self, size: int) -> int:
+        offset = self._next
+        if offset + size > len(self._values):
+            raise ValueError("metrics registry capacity exceeded")
+        self._next += size
+        return offset
+
+    def _lock(self, offset: int):
+        return self._locks[offset % len(self._locks)]
+
+    def _register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, documentation: str, label: str = None, values: Iterable[str] = ()):
+        return self._register(Counter(self, name, documentation, label, values))
+
+    def gauge(self, name: str, documentation: str, label: str = None, values: Iterable[str] = (),
+              func: Callable[[], float] = None):
+        """func 不为空时在渲染时调用取值（在渲染的进程内执行），不占共享槽位"""
+        return self._register(Gauge(self, name, documentation, label, values, func))
+
+    def histogram(self, name: str, documentation: str, label: str = None, values: Iterable[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS):
+        return self._register(Histogram(self, name, documentation, label, values, buckets))
+
+    def render(self) -> str:
+        """Prometheus 文本格式"""
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            try:
+                metric.render(lines)
+            except Exception as e:
+                logger.error(f"指标 {metric.name} 渲染失败: {e}")
+        lines.append("")
+        return "\n".join(lines)
+
+
+def _labels(label: Optional[str], value: Optional[str], extra: str = "") -> str:
+    parts = []
+    if label is not None:
+        parts.append(f'{label}="{value}"')
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format(value: float) -> str:
+    return str(int(value)) if value == int(value) and abs(value) < 1e15 else repr(value)
+
+
+class _Metric:
+    kind = "untyped"
+    width = 1
+
+    def __init__(self, registry: MetricsRegistry, name, documentation, label, values, allocate=True):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.label = label
+        self._children: Dict[Optional[str], "_Child"] = {}
+        if not allocate:
+            return
+        for value in (list(values) if label is not None else [None]):
+            offset = registry._alloc(self.width)
+            self._children[value] = self._child(offset)
+
+    def _child(self, offset):
+        return _Child(self, offset)
+
+    def labels(self, value) -> "_Child":
+        """按标签值取子指标，未声明的标签值抛出 KeyError"""
+        return self._children[str(value)]
+
+    def _only(self) -> "_Child":
+        return self._children[None]
+
+    def render(self, lines):
+        values = self.registry._values
+        for value, child in self._children.items():
+            lines.append(f"{self.name}{_labels(self.label, value)} {_format(values[child.offset])}")
+
+
+class _Child:
+    def __init__(self, metric: _Metric, offset: int):
+        self.metric = metric
+        self.offset = offset
+        self._values = metric.registry._values
+        self._lock = metric.registry._lock(offset)
+
+    def inc(self, amount: float = 1):
+        with self._lock:
+            self._values[self.offset] += amount
+
+    def set(self, value: float):
+        self._values[self.offset] = value
+
+    def get(self) -> float:
+        return self._values[self.offset]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1):
+        self._only().inc(amount)
+
+    def get(self) -> float:
+        return self._only().get()
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, registry, name, documentation, label, values, func=None):
+        self.func = func
+        super().__init__(registry, name, documentation, label, values, allocate=func is None)
+
+    def set(self, value: float):
+        self._only().set(value)
+
+    def inc(self, amount: float = 1):
+        self._only().inc(amount)
+
+    def render(self, lines):
+        if self.func is None:
+            return super().render(lines)
+        result = self.func()
+        # func 可以返回 {标签值: 数值}
+        if isinstance(result, dict):
+            for value, number in result.items():
+                lines.append(f"{self.name}{_labels(self.label, value)} {_format(float(number))}")
+        else:
+            lines.append(f"{self.name} {_format(float(result))}")
+
+
+class _HistogramChild(_Child):
+    def __init__(self, metric: "Histogram", offset: int):
+        super().__init__(metric, offset)
+        self._buckets = metric.buckets
+
+    def observe(self, value: float):
+        # 各分桶单独计数（非累加），渲染时再累加；最后两个槽位是 sum 与 count
+        i = bisect.bisect_left(self._buckets, value)
+        n = len(self._buckets)
+        with self._lock:
+            self._values[self.offset + i] += 1
+            self._values[self.offset + n + 1] += value
+            self._values[self.offset + n + 2] += 1
+
+    @contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, registry, name, documentation, label, values, buckets):
+        self.buckets = tuple(sorted(buckets))
+        # 每个分桶 + Inf 桶 + sum + count
+        self.width = len(self.buckets) + 3
+        super().__init__(registry, name, documentation, label, values)
+
+    def _child(self, offset):
+        return _HistogramChild(self, offset)
+
+    def observe(self, value: float):
+        self._only().observe(value)
+
+    def time(self):
+        return self._only().time()
+
+    def render(self, lines):
+        values = self.registry._values
+        n = len(self.buckets)
+        for value, child in self._children.items():
+            cumulative = 0.0
+            for i, bound in enumerate(self.buckets + (float("inf"),)):
+                cumulative += values[child.offset + i]
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                bucket_labels = _labels(self.label, value, 'le="' + le + '"')
+                lines.append(f"{self.name}_bucket{bucket_labels} {_format(cumulative)}")
+            lines.append(f"{self.name}_sum{_labels(self.label, value)} {_format(values[child.offset + n + 1])}")
+            lines.append(f"{self.name}_count{_labels(self.label, value)} {_format(values[child.offset + n + 2])}")
+
+
+class BackoffMetrics:
+    """ExponentialBackoffQueue 的指标：按重试次数统计失败、死信数与排队任务数"""
+
+    def __init__(self, registry: MetricsRegistry, queue: str, max_retries: int):
+        self.retries = registry.counter(
+            f"pec_{queue}_backoff_retries_total", "Failed attempts by attempt number",
+            label="attempt", values=[str(i) for i in range(1, max_retries + 1)])
+        self.dead_letters = registry.counter(
+            f"pec_{queue}_backoff_dead_letters_total", "Tasks dropped after the last retry")
+        self.size = registry.gauge(f"pec_{queue}_backoff_queue_size", "Tasks waiting for retry")
+
+    def failed(self, attempt: int):
+        try:
+            self.retries.labels(attempt).inc()
+        except KeyError:
+            pass
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry: MetricsRegistry = None
+
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = self.registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_http_exporter(registry: MetricsRegistry, port: int, host: str = "0.0.0.0") -> ThreadingHTTPServer:
+    """在后台线程中提供 http://host:port/metrics"""
+    handler = type("MetricsHandler", (_MetricsHandler,), {"registry": registry})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="MetricsExporter", daemon=True).start()
+    logger.info("metrics exporter: http://%s:%d/metrics", host, port)
+    return server
@@ -0,0 +1,54 @@
+# -*- coding:utf-8 -*-
+# @FileName  :read_cache.py
+# @Time      :2026/10/18 03:40
+# @Author    :shi lei.wei  <slwei@eppei.com>.
+# 按写入代数失效的读缓存：保存已编码好的响应字节，数据有新提交（代数变化）后条目失效，不按时间过期
+import collections
+import threading
+from typing import Callable, Hashable
+
+
+class GenerationCache:
+    """
+    有界 LRU 读缓存，每个进程一份
+    - generation 为跨进程共享的提交代数（multiprocessing.Value），任一 worker 提交后所有 worker 的旧条目失效
+    - 条目记录查询前读到的代数，查询期间有新提交时条目随即失效，不会返回旧数据
+    - max_entries 为 0 时不缓存
+    """
+
+    def __init__(self, generation, max_entries: int = 256):
+        """
+        :param generation: 提交代数，读取 .value
+        :param max_entries: 最多缓存的条目数，超过时淘汰最久未使用的
+        """
+        self.generation = generation
+        self.max_entries = max_entries
+        self._entries: "collections.OrderedDict[Hashable, tuple]" = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_load(self, key: Hashable, loader: Callable[[], bytes]) -> bytes:
+        """命中且代数未变化时返回缓存，否则调用 loader 查询并缓存"""
+        generation = self.generation.value
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == generation:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        value = loader()
+        if self.max_entries > 0:
+            with self._lock:
+                self._entries[key] = (generation, value)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return value
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        return {"size": len(self._entries), "hits": self.hits, "misses": self.misses}
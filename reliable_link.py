@@ -0,0 +1,291 @@
+# -*- coding:utf-8 -*-
+# @FileName  :reliable_link.py
+# @Time      :2026/10/18 00:20
+# @Author    :shi lei.wei  <slwei@eppei.com>.
+# 带确认的传输模式（zmq_transport = "ack"）：服务端 ROUTER，客户端 DEALER
+# 服务端 -> 客户端: 数据消息与 frame_util 格式相同，总是带追踪帧，以第一条数据的序列号标识整条消息
+# 客户端 -> 服务端: [b"hello"] 连接与保活；[b"ack", 纪元(4字节) + 若干消息序列号(各8字节)] 批量确认
+# 服务端在滑动窗口内保留未确认的消息，超时重发；客户端按数据序列号去重，重复的消息也要确认
+# 客户端在消息中的数据全部转发成功、写入重试队列或进入死信后才确认（AckTracker），保证至少一次送达
+import collections
+import functools
+import itertools
+import logging
+import struct
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+import zmq
+
+logger = logging.getLogger(__name__)
+
+MSG_HELLO = b"hello"
+MSG_ACK = b"ack"
+ACK_HEADER = struct.Struct("!I")
+ACK_ITEM = struct.Struct("!Q")
+
+
+def pack_ack(epoch: int, sequences: List[int]) -> list:
+    return [MSG_ACK, ACK_HEADER.pack(epoch) + b"".join(ACK_ITEM.pack(seq) for seq in sequences)]
+
+
+def unpack_ack(frame: bytes):
+    """返回 (纪元, [消息序列号, ...])"""
+    (epoch,) = ACK_HEADER.unpack_from(frame)
+    return epoch, [seq for (seq,) in ACK_ITEM.iter_unpack(frame[ACK_HEADER.size:])]
+
+
+class _Pending:
+    __slots__ = ("frames", "count", "sent_at", "attempts")
+
+    def __init__(self, frames, count):
+        self.frames = frames
+        self.count = count
+        self.sent_at = 0.0
+        self.attempts = 0
+
+
+class AckWindow:
+    """
+    服务端滑动窗口，只在发布线程内使用（ROUTER socket 不跨线程）
+    - 窗口按数据条数计算，未确认的条数达到 window 后停止从 ingest 读取，背压传给 worker
+    - 消息发给最近活跃的客户端，客户端全部离线时留在窗口中，等客户端上线后重发
+    - 超过 ack_timeout 未确认的消息重发，重发的消息序列号不变
+    """
+
+    def __init__(self, socket, epoch: int, window: int = 10000, ack_timeout: float = 5.0,
+                 peer_timeout: float = 30.0, stats=None):
+        """
+        :param socket: ROUTER socket（需设置 ROUTER_MANDATORY，发给已断开的客户端时抛出异常）
+                       发送不阻塞，客户端接收缓冲已满时消息留在窗口中稍后重发，避免与客户端的确认互相等待
+        :param epoch: 发布进程纪元，与追踪帧中的相同
+        :param window: 最多未确认的数据条数
+        :param ack_timeout: 重发超时（秒）
+        :param peer_timeout: 客户端多久没有消息视为离线（秒）
+        :param stats: PublisherStats，记录重发与确认数
+        """
+        self.socket = socket
+        self.epoch = epoch
+        self.window = window
+        self.ack_timeout = ack_timeout
+        self.peer_timeout = peer_timeout
+        self.stats = stats
+        # 消息序列号 -> _Pending，按最近一次发送时间排序，重发时移到末尾
+        self._pending: "collections.OrderedDict[int, _Pending]" = collections.OrderedDict()
+        self.unacked = 0
+        # 客户端 identity -> 最近一次收到消息的时间
+        self._peers: Dict[bytes, float] = {}
+        self._rotation = itertools.cycle(())
+
+    def has_credit(self) -> bool:
+        return self.unacked < self.window
+
+    def live_peers(self, now: Optional[float] = None) -> List[bytes]:
+        now = now or time.time()
+        return [peer for peer, seen in self._peers.items() if now - seen < self.peer_timeout]
+
+    def on_message(self, peer: bytes, parts: list):
+        """处理客户端发来的消息（不含 identity 帧）"""
+        first_seen = peer not in self._peers
+        self._peers[peer] = time.time()
+        if first_seen:
+            logger.info("客户端上线: %s，未确认 %d 条", peer.hex(), self.unacked)
+            self._rotation = itertools.cycle(list(self._peers))
+            # 新客户端上线时立即重发积压的消息
+            for pending in self._pending.values():
+                pending.sent_at = 0.0
+        if parts and parts[0] == MSG_ACK and len(parts) > 1:
+            epoch, sequences = unpack_ack(parts[1])
+            if epoch != self.epoch:
+                return
+            for seq in sequences:
+                pending = self._pending.pop(seq, None)
+                if pending is not None:
+                    self.unacked -= pending.count
+                    if self.stats:
+                        self.stats.acked_items.inc(pending.count)
+
+    def send(self, seq: int, frames: list, count: int):
+        """加入窗口并发送，没有在线客户端时只加入窗口"""
+        pending = _Pending(frames, count)
+        self._pending[seq] = pending
+        self.unacked += count
+        self._transmit(seq, pending, time.time())
+
+    def resend_due(self):
+        """重发超时未确认的消息"""
+        now = time.time()
+        due = []
+        for seq, pending in self._pending.items():
+            if now - pending.sent_at < self.ack_timeout:
+                break
+            due.append((seq, pending))
+        for seq, pending in due:
+            if not self._transmit(seq, pending, now):
+                break
+            if self.stats and pending.attempts > 1:
+                self.stats.retransmitted_items.inc(pending.count)
+
+    def broadcast(self, frames: list):
+        """发给所有在线客户端（心跳）"""
+        for peer in self.live_peers():
+            self._send_to(peer, frames)
+
+    def pending_messages(self) -> List[list]:
+        """未确认的消息（按序列号顺序），停止时用于保存"""
+        return [self._pending[seq].frames for seq in sorted(self._pending)]
+
+    def _transmit(self, seq: int, pending: _Pending, now: float) -> bool:
+        peer = self._next_peer(now)
+        if peer is None:
+            return False
+        if not self._send_to(peer, pending.frames):
+            return False
+        pending.sent_at = now
+        pending.attempts += 1
+        self._pending.move_to_end(seq)
+        return True
+
+    def _next_peer(self, now: float) -> Optional[bytes]:
+        for _ in range(len(self._peers)):
+            peer = next(self._rotation)
+            if now - self._peers.get(peer, 0) < self.peer_timeout:
+                return peer
+        return None
+
+    def _send_to(self, peer: bytes, frames: list) -> bool:
+        try:
+            self.socket.send_multipart([peer] + frames, flags=zmq.NOBLOCK, copy=False)
+            if self.stats:
+                self.stats.publish_bytes.inc(sum(len(frame) for frame in frames))
+            return True
+        except zmq.Again:
+            # 客户端接收缓冲已满
+            return False
+        except zmq.ZMQError as e:
+            # 客户端已断开（EHOSTUNREACH），移除该客户端，消息留在窗口中
+            if self.stats:
+                self.stats.send_errors.inc()
+            logger.warning("发送到客户端 %s 失败: %s", peer.hex(), e)
+            self._peers.pop(peer, None)
+            self._rotation = itertools.cycle(list(self._peers))
+            return False
+
+
+class SequenceFilter:
+    """
+    客户端按数据序列号去重：记住最近 capacity 个序列号
+    重复只来自窗口内的重发，capacity 不小于服务端窗口（zmq_ack_window）即可
+    """
+
+    def __init__(self, capacity: int = 100000):
+        self._epoch = None
+        self._seen = set()
+        self._order = collections.deque(maxlen=capacity)
+
+    def accept(self, epoch: int, seq: int) -> bool:
+        """返回 True 表示第一次收到"""
+        if epoch != self._epoch:
+            self._epoch = epoch
+            self._seen.clear()
+            self._order.clear()
+        if seq in self._seen:
+            return False
+        if len(self._order) == self._order.maxlen:
+            self._seen.discard(self._order[0])
+        self._order.append(seq)
+        self._seen.add(seq)
+        return True
+
+
+class AckTracker:
+    """
+    客户端：一条消息中的数据全部离开处理管道（转发成功、写入重试队列或进入死信）后才确认，
+    客户端重启时还在交接队列、解码队列、转发通道中的数据没有确认，由服务端重发
+    - 接收线程 track 登记消息，返回每条数据完成时调用一次的回调（解码、转发线程中调用，线程安全）
+    - 接收线程 drain 取出已完成的消息交给 AckBatcher
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (纪元, 消息序列号) -> 未完成的数据条数
+        self._remaining: Dict[Tuple[int, int], int] = {}
+        self._completed = collections.deque()
+        self._epoch = None
+
+    def in_flight(self, epoch: int, seq: int) -> bool:
+        """消息是否还在处理（重发的消息到达时原消息可能还未完成，不能再处理一次，也不能提前确认）"""
+        with self._lock:
+            return (epoch, seq) in self._remaining
+
+    def track(self, epoch: int, seq: int, count: int) -> Callable[[], None]:
+        """登记一条消息中需要处理的 count 条数据，count 为 0 时直接完成"""
+        key = (epoch, seq)
+        with self._lock:
+            self._epoch = epoch
+            if count > 0:
+                self._remaining[key] = count
+            else:
+                self._completed.append(key)
+        return functools.partial(self._settle, key)
+
+    def _settle(self, key: Tuple[int, int]):
+        with self._lock:
+            remaining = self._remaining.get(key)
+            if remaining is None:
+                return
+            if remaining > 1:
+                self._remaining[key] = remaining - 1
+                return
+            del self._remaining[key]
+            self._completed.append(key)
+
+    def drain(self) -> List[Tuple[int, int]]:
+        """取出已完成的消息；服务端重启（纪元变化）前的消息不再确认，服务端会忽略"""
+        completed = []
+        with self._lock:
+            while self._completed:
+                key = self._completed.popleft()
+                if key[0] == self._epoch:
+                    completed.append(key)
+        return completed
+
+    def __len__(self):
+        """处理中的消息数"""
+        return len(self._remaining)
+
+
+class AckBatcher:
+    """客户端累积待确认的消息序列号，达到 batch_size 条或超过 interval 秒时一起发送"""
+
+    def __init__(self, batch_size: int = 64, interval: float = 0.02):
+        self.batch_size = batch_size
+        self.interval = interval
+        self._epoch = None
+        self._sequences = []
+        self._since = 0.0
+
+    def add(self, epoch: int, seq: int):
+        if epoch != self._epoch:
+            # 旧纪元的确认服务端会忽略
+            self._sequences = []
+            self._epoch = epoch
+        if not self._sequences:
+            self._since = time.time()
+        self._sequences.append(seq)
+
+    def __len__(self):
+        return len(self._sequences)
+
+    def due(self) -> bool:
+        return bool(self._sequences) and (
+            len(self._sequences) >= self.batch_size or time.time() - self._since >= self.interval)
+
+    def take(self) -> Optional[list]:
+        """取出待发送的确认消息，没有时返回 None"""
+        if not self._sequences:
+            return None
+        frames = pack_ack(self._epoch, self._sequences)
+        self._sequences = []
+        return frames
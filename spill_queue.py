@@ -0,0 +1,319 @@
+# -*- coding:utf-8 -*-
+# @FileName  :spill_queue.py
+# @Time      :2026/10/18 02:10
+# @Author    :shi lei.wei  <slwei@eppei.com>.
+# 发布进程的待推送队列：内存环形缓冲 + 溢出到磁盘的分段日志（mmap），整体先进先出
+# 段文件: <目录>/<段号 20 位>.seg，固定大小预分配，记录依次追加，长度为 0 处表示尚未写入
+# 记录:   长度(4字节, payload 长度 + 8) + crc32(4字节) + received_at(8字节) + payload
+# 读位置定期写入 <目录>/cursor，进程重启后从该位置重放（可能重复少量已推送的数据）
+# 正常停止时内存中的数据（以及确认模式下未确认的数据）写入 <目录>/head，下次启动时最先取出
+import collections
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+from typing import Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+RECORD_HEADER = struct.Struct("!IId")
+CURSOR_FORMAT = struct.Struct("!QQ")
+_SEGMENT_SUFFIX = ".seg"
+
+
+class _Segment:
+    """一个预分配的段文件，通过 mmap 读写"""
+
+    def __init__(self, path: str, size: int, create: bool):
+        self.path = path
+        mode = os.O_RDWR | (os.O_CREAT if create else 0)
+        fd = os.open(path, mode, 0o644)
+        try:
+            if create:
+                os.ftruncate(fd, size)
+            self.size = os.fstat(fd).st_size
+            self.map = mmap.mmap(fd, self.size)
+        finally:
+            os.close(fd)
+
+    def read(self, offset: int):
+        """读取 offset 处的记录，返回 (received_at, payload, 下一条的偏移)，没有完整记录时返回 None"""
+        if offset + RECORD_HEADER.size > self.size:
+            return None
+        length, crc, received_at = RECORD_HEADER.unpack_from(self.map, offset)
+        end = offset + RECORD_HEADER.size - 8 + length
+        if length < 8 or end > self.size:
+            return None
+        body = self.map[offset + 8:end]
+        if zlib.crc32(body) != crc:
+            return None
+        return received_at, body[8:], end
+
+    def write(self, offset: int, received_at: float, payload: bytes) -> int:
+        """在 offset 处写入记录，返回下一条的偏移；长度最后写入，读到长度即表示记录完整"""
+        body = struct.pack("!d", received_at) + payload
+        start = offset + 8
+        self.map[start:start + len(body)] = body
+        self.map[offset:offset + 8] = struct.pack("!II", len(body), zlib.crc32(body))
+        return start + len(body)
+
+    def close(self):
+        self.map.close()
+
+
+class SpillQueue:
+    """
+    先进先出的待推送队列，元素为 {"payload": bytes, "received_at": float}
+    - 磁盘上没有积压时写入内存环形缓冲（快路径），缓冲满后写入磁盘分段日志
+    - 磁盘上有积压时新数据继续写入磁盘，保证内存中的数据（更早）先被取出
+    - 内存取空后从磁盘顺序读取，读完的段文件删除
+    - 磁盘占用达到 max_bytes 时 put 等待，超时返回 False，由调用方停止读取上游形成背压
+    put/get 可在不同线程调用
+    """
+
+    def __init__(self, directory: str, memory_items: int = 1000, segment_bytes: int = 64 * 1024 * 1024,
+                 max_bytes: int = 10 * 1024 * 1024 * 1024, cursor_interval: float = 1.0):
+        """
+        :param directory: 段文件目录
+        :param memory_items: 内存环形缓冲的条数
+        :param segment_bytes: 段文件大小
+        :param max_bytes: 段文件总大小上限，0 表示不使用磁盘（缓冲满时 put 等待）
+        :param cursor_interval: 读位置写盘的最小间隔（秒）
+        """
+        self.directory = directory
+        self.memory_items = memory_items
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        self.cursor_interval = cursor_interval
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._not_full = threading.Condition(self._lock)
+        self._memory = collections.deque()
+        # 段号 -> _Segment，只保留读、写位置所在的段
+        self._open: Dict[int, _Segment] = {}
+        self._segments: List[int] = []
+        self._read_segment = self._read_offset = 0
+        self._write_segment = self._write_offset = 0
+        self._disk_items = 0
+        self._disk_bytes = 0
+        self._cursor_saved_at = 0.0
+        self.spilled = 0
+        self.rejected = 0
+        if max_bytes:
+            os.makedirs(directory, exist_ok=True)
+            self._recover()
+
+    # ---------- 启动恢复 ----------
+
+    def _recover(self):
+        self._segments = sorted(int(name[:-len(_SEGMENT_SUFFIX)]) for name in os.listdir(self.directory)
+                                if name.endswith(_SEGMENT_SUFFIX))
+        cursor = self._load_cursor()
+        if cursor and cursor[0] in self._segments:
+            self._read_segment, self._read_offset = cursor
+        elif self._segments:
+            self._read_segment, self._read_offset = self._segments[0], 0
+        # 读位置之前的段已经推送完
+        for index in [i for i in self._segments if i < self._read_segment]:
+            os.remove(self._segment_path(index))
+            self._segments.remove(index)
+        # 统计积压条数，并找到写位置（最后一个段中第一条不完整的记录）
+        for index in self._segments:
+            segment = self._segment(index)
+            self._disk_bytes += segment.size
+            offset = self._read_offset if index == self._read_segment else 0
+            while True:
+                record = segment.read(offset)
+                if record is None:
+                    break
+                self._disk_items += 1
+                offset = record[2]
+            self._write_segment, self._write_offset = index, offset
+            if index not in (self._read_segment,):
+                self._close_segment(index)
+        if not self._segments:
+            self._read_segment = self._write_segment = self._read_offset = self._write_offset = 0
+        # 上次正常停止时留下的内存数据排在最前
+        head = os.path.join(self.directory, "head")
+        if os.path.exists(head):
+            with open(head, "rb") as f:
+                data = f.read()
+            offset = 0
+            while offset + RECORD_HEADER.size <= len(data):
+                length, crc, received_at = RECORD_HEADER.unpack_from(data, offset)
+                body = data[offset + 8:offset + 8 + length]
+                if len(body) != length or zlib.crc32(body) != crc:
+                    break
+                self._memory.append({"payload": body[8:], "received_at": received_at})
+                offset += 8 + length
+            os.remove(head)
+        if self._disk_items or self._memory:
+            logger.info("spill queue %s 恢复 %d 条（磁盘 %d 条，%d 个段）", self.directory,
+                        len(self._memory) + self._disk_items, self._disk_items, len(self._segments))
+
+    def _load_cursor(self):
+        try:
+            with open(os.path.join(self.directory, "cursor"), "rb") as f:
+                return CURSOR_FORMAT.unpack(f.read(CURSOR_FORMAT.size))
+        except (OSError, struct.error):
+            return None
+
+    def _save_cursor(self, force=False):
+        now = time.time()
+        if not force and now - self._cursor_saved_at < self.cursor_interval:
+            return
+        self._cursor_saved_at = now
+        path = os.path.join(self.directory, "cursor")
+        with open(path + ".tmp", "wb") as f:
+            f.write(CURSOR_FORMAT.pack(self._read_segment, self._read_offset))
+        os.replace(path + ".tmp", path)
+
+    # ---------- 段文件 ----------
+
+    def _segment_path(self, index: int) -> str:
+        return os.path.join(self.directory, f"{index:020d}{_SEGMENT_SUFFIX}")
+
+    def _segment(self, index: int, size: int = 0) -> _Segment:
+        segment = self._open.get(index)
+        if segment is None:
+            segment = _Segment(self._segment_path(index), size, create=size > 0)
+            self._open[index] = segment
+        return segment
+
+    def _close_segment(self, index: int):
+        segment = self._open.pop(index, None)
+        if segment:
+            segment.close()
+
+    def _delete_segment(self, index: int):
+        segment = self._open.get(index)
+        self._disk_bytes -= segment.size if segment else os.path.getsize(self._segment_path(index))
+        self._close_segment(index)
+        os.remove(self._segment_path(index))
+        self._segments.remove(index)
+
+    # ---------- 读写 ----------
+
+    def put(self, item: dict, timeout: Optional[float] = None) -> bool:
+        """加入队列，内存与磁盘都已满时最多等待 timeout 秒，仍无空间返回 False"""
+        with self._lock:
+            if not self._not_full.wait_for(lambda: self._has_room(item), timeout):
+                self.rejected += 1
+                return False
+            if not self._disk_items and len(self._memory) < self.memory_items:
+                self._memory.append(item)
+            else:
+                self._append_disk(item)
+            self._not_empty.notify()
+            return True
+
+    def _record_size(self, item) -> int:
+        return RECORD_HEADER.size + len(item["payload"])
+
+    def _has_room(self, item) -> bool:
+        if not self._disk_items and len(self._memory) < self.memory_items:
+            return True
+        if not self.max_bytes:
+            return False
+        if self._segments and self._write_offset + self._record_size(item) <= self._segment(self._write_segment).size:
+            return True
+        # 需要新的段文件
+        size = max(self.segment_bytes, self._record_size(item))
+        return self._disk_bytes + size <= self.max_bytes
+
+    def _append_disk(self, item):
+        record_size = self._record_size(item)
+        if not self._segments or self._write_offset + record_size > self._segment(self._write_segment).size:
+            index = self._segments[-1] + 1 if self._segments else 0
+            if self._segments and self._write_segment != self._read_segment:
+                self._close_segment(self._write_segment)
+            self._disk_bytes += self._segment(index, max(self.segment_bytes, record_size)).size
+            self._segments.append(index)
+            if len(self._segments) == 1:
+                self._read_segment, self._read_offset = index, 0
+            self._write_segment, self._write_offset = index, 0
+        self._write_offset = self._segment(self._write_segment).write(
+            self._write_offset, item["received_at"], item["payload"])
+        self._disk_items += 1
+        self.spilled += 1
+
+    def get(self, timeout: Optional[float] = None) -> Optional[dict]:
+        """取出最早的数据，队列为空时最多等待 timeout 秒后返回 None"""
+        with self._lock:
+            if not self._not_empty.wait_for(lambda: self._memory or self._disk_items, timeout):
+                return None
+            if self._memory:
+                item = self._memory.popleft()
+            else:
+                item = self._read_disk()
+            self._not_full.notify()
+            return item
+
+    def _read_disk(self) -> dict:
+        while True:
+            record = self._segment(self._read_segment).read(self._read_offset)
+            if record is not None:
+                received_at, payload, self._read_offset = record
+                self._disk_items -= 1
+                if not self._disk_items:
+                    self._reset_disk()
+                else:
+                    self._save_cursor()
+                return {"payload": payload, "received_at": received_at}
+            # 当前段已读完，删除后读下一个段
+            self._delete_segment(self._read_segment)
+            self._read_segment, self._read_offset = self._segments[0], 0
+
+    def _reset_disk(self):
+        """磁盘积压读完，删除全部段文件，之后的数据回到内存快路径"""
+        for index in list(self._segments):
+            self._delete_segment(index)
+        self._read_segment = self._write_segment = self._read_offset = self._write_offset = 0
+        self._save_cursor(force=True)
+
+    def __len__(self):
+        return len(self._memory) + self._disk_items
+
+    def disk_items(self) -> int:
+        return self._disk_items
+
+    def disk_bytes(self) -> int:
+        """段文件占用的字节数（预分配大小）"""
+        return self._disk_bytes
+
+    def close(self, head: Iterable[dict] = (), tail: Iterable[dict] = ()):
+        """
+        停止时调用：head（如未确认的数据）与内存中的数据按顺序写入 head 文件，下次启动时最先取出；
+        tail（如还没放入队列的数据）比磁盘上的积压更新，有积压时追加到段日志末尾（不受 max_bytes 限制），
+        没有积压时写在 head 文件最后。不使用磁盘（max_bytes 为 0）时这些数据丢弃
+        """
+        with self._lock:
+            items = list(head) + list(self._memory)
+            self._memory.clear()
+            tail = list(tail)
+            if self.max_bytes and self._disk_items:
+                for item in tail:
+                    self._append_disk(item)
+            else:
+                items += tail
+            if self.max_bytes:
+                if items:
+                    path = os.path.join(self.directory, "head")
+                    with open(path + ".tmp", "wb") as f:
+                        for item in items:
+                            body = struct.pack("!d", item["received_at"]) + item["payload"]
+                            f.write(struct.pack("!II", len(body), zlib.crc32(body)) + body)
+                        f.flush()
+                        os.fsync(f.fileno())
+                    os.replace(path + ".tmp", path)
+                self._save_cursor(force=True)
+                for segment in self._open.values():
+                    segment.map.flush()
+                    segment.close()
+                self._open.clear()
+            elif items:
+                logger.warning("spill queue 未启用磁盘，丢弃 %d 条", len(items))
+            logger.info("spill queue 关闭，磁盘积压 %d 条，内存数据 %d 条写入 head", self._disk_items, len(items))
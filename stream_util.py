@@ -0,0 +1,189 @@
+# -*- coding:utf-8 -*-
+# @FileName  :stream_util.py
+# @Time      :2026/10/17 15:10
+# @Author    :shi lei.wei  <slwei@eppei.com>.
+# 流式解析 JSON 数组 / NDJSON，边读边产出，不把整个请求体读入内存
+import codecs
+import json
+from typing import Any, BinaryIO, Iterator, Optional, Tuple
+
+_WHITESPACE = " \t\r\n"
+_decoder = json.JSONDecoder()
+
+
+class StreamParseError(ValueError):
+    """第 index 条数据无法解析，之后的数据无法继续读取"""
+
+    def __init__(self, index, msg):
+        super().__init__(f"item {index}: {msg}")
+        self.index = index
+
+
+class InvalidItem:
+    """NDJSON 中无法解析的单行，跳过后可以继续读取"""
+
+    def __init__(self, error):
+        self.error = error
+
+
+class _Reader:
+    """
+    按块读取并增量解码 UTF-8，维护一个可裁剪的文本缓冲区
+    一条数据跨越多块时，新读入的块先暂存，凑够后一次拼接，解析失败后至少读到两倍再重新解析，
+    单条数据的拼接与解析总量与其长度成正比
+    """
+
+    # 解析结果或错误距缓冲区末尾不超过该长度时视为可能被截断（如 "1."、"tru"、"\u12"），读到更多数据再确认
+    _TRUNCATED_MARGIN = 16
+
+    def __init__(self, stream: BinaryIO, chunk_size: int, max_item_size: int = 0):
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.max_item_size = max_item_size
+        self.decoder = codecs.getincrementaldecoder("utf-8")()
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    def _read(self) -> Optional[str]:
+        """读取并解码下一块，已到结尾返回 None"""
+        if self.eof:
+            return None
+        chunk = self.stream.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return self.decoder.decode(b"", final=True)
+        return self.decoder.decode(chunk)
+
+    def _check_size(self, size: int, index):
+        # 当前数据还不完整且已超过 size 个字符
+        if self.max_item_size and size > self.max_item_size:
+            raise StreamParseError(index, f"item larger than {self.max_item_size} characters")
+
+    def fill(self, size: int = 0) -> bool:
+        """继续读取，直到当前位置之后至少有 size 个字符（至少读取一块）或已到结尾；没有可读的数据返回 False"""
+        parts = [self.buf[self.pos:]]
+        available = len(parts[0])
+        while True:
+            text = self._read()
+            if text is None:
+                break
+            parts.append(text)
+            available += len(text)
+            if available >= size:
+                break
+        if len(parts) == 1:
+            return False
+        self.buf = "".join(parts)
+        self.pos = 0
+        return True
+
+    def skip_whitespace(self) -> str:
+        """跳过空白，返回下一个字符，已到结尾返回空串"""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self.fill():
+                return ""
+
+    def decode_value(self, index) -> Any:
+        """解析一个完整的 JSON 值，数据不完整时继续读取"""
+        self.skip_whitespace()
+        while True:
+            available = len(self.buf) - self.pos
+            try:
+                value, end = _decoder.raw_decode(self.buf, self.pos)
+                # 数字在缓冲区末尾可能被截断（"-2500.0" 读到 "-2500."），离末尾足够远或已到结尾才确认
+                if end + self._TRUNCATED_MARGIN <= len(self.buf) or self.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError as e:
+                truncated = e.pos >= len(self.buf) - self._TRUNCATED_MARGIN or e.msg.startswith("Unterminated")
+                if self.eof or not truncated:
+                    raise StreamParseError(index, e.msg)
+            self._check_size(available, index)
+            size = max(2 * available, available + self.chunk_size)
+            if self.max_item_size:
+                # 最多读到刚超过上限，不为超大的数据读入更多
+                size = min(size, self.max_item_size + 1)
+            self.fill(size)
+
+    def read_line(self, index) -> Optional[str]:
+        """读取到下一个换行（不含换行），已到结尾且没有数据时返回 None"""
+        newline = self.buf.find("\n", self.pos)
+        if newline < 0:
+            # 只在新读入的块中查找换行，找到后一次拼接
+            parts = [self.buf[self.pos:]]
+            size = len(parts[0])
+            while newline < 0:
+                self._check_size(size, index)
+                text = self._read()
+                if text is None:
+                    break
+                newline = text.find("\n")
+                if newline >= 0:
+                    newline += size
+                parts.append(text)
+                size += len(text)
+            self.buf = "".join(parts)
+            self.pos = 0
+        if newline < 0:
+            if self.pos >= len(self.buf):
+                return None
+            line = self.buf[self.pos:]
+            self.pos = len(self.buf)
+            return line
+        line = self.buf[self.pos:newline]
+        self.pos = newline + 1
+        return line
+
+
+def iter_json_items(stream: BinaryIO, chunk_size: int = 64 * 1024,
+                    max_item_size: int = 16 * 1024 * 1024) -> Iterator[Tuple[int, Any]]:
+    """
+    从二进制流中逐条解析数据，产出 (序号, 数据)
+    首个非空白字符为 '[' 时按 JSON 数组解析，否则按 NDJSON（每行一个 JSON 值）解析
+    :param max_item_size: 单条数据（NDJSON 为单行）的最大字符数，超过时抛出 StreamParseError，0 表示不限制
+    """
+    reader = _Reader(stream, chunk_size, max_item_size)
+    first = reader.skip_whitespace()
+    if first == "[":
+        reader.pos += 1
+        yield from _iter_array(reader)
+    elif first:
+        yield from _iter_ndjson(reader)
+
+
+def _iter_array(reader: _Reader):
+    index = 0
+    if reader.skip_whitespace() != "]":
+        while True:
+            yield index, reader.decode_value(index)
+            index += 1
+            sep = reader.skip_whitespace()
+            if sep == ",":
+                reader.pos += 1
+            elif sep == "]":
+                break
+            else:
+                raise StreamParseError(index, "expected ',' or ']'")
+    reader.pos += 1
+    # 数组结束后只允许空白
+    if reader.skip_whitespace():
+        raise StreamParseError(index, "unexpected data after ']'")
+
+
+def _iter_ndjson(reader: _Reader):
+    index = 0
+    while True:
+        line = reader.read_line(index)
+        if line is None:
+            return
+        if line.strip():
+            try:
+                yield index, json.loads(line)
+            except json.JSONDecodeError as e:
+                yield index, InvalidItem(e.msg)
+            index += 1
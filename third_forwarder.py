@@ -0,0 +1,106 @@
+# -*- coding:utf-8 -*-
+# @FileName  :third_forwarder.py
+# @Time      :2026/10/17 16:02
+# @Author    :shi lei.wei  <slwei@eppei.com>.
+# 并发转发到辅助决策系统，接收循环不再等待第三方接口响应
+import logging
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+from action_util import call_third_api, third_path_kind
+
+logger = logging.getLogger(__name__)
+
+
+class ThirdApiForwarder:
+    """
+    按转发路径（top / deal）分通道的有界转发线程池。
+    - 每个通道有独立的有界队列和工作线程，线程数即该路径的最大在途请求数，互不阻塞
+    - 全局信号量限制所有通道的总并发
+    - 通道队列满时 submit 阻塞，形成对接收端的背压
+    - 转发失败交给 on_failure（一般是退避重试队列）
+    """
+
+    def __init__(
+        self,
+        on_failure: Callable[[Any], None],
+        concurrency: int = 8,
+        inflight: Optional[Dict[str, int]] = None,
+        queue_size: int = 1000,
+        forward_func: Callable[[Any], Any] = call_third_api,
+        latency=None,
+        errors=None,
+        on_success: Optional[Callable[[Any], None]] = None
+    ):
+        """
+        :param on_failure: 转发失败时的回调，参数为原始数据
+        :param concurrency: 全部通道合计的最大在途请求数
+        :param inflight: 各路径的最大在途请求数，如 {"top": 4, "deal": 4}
+        :param queue_size: 每个通道的队列长度
+        :param forward_func: 实际转发函数
+        :param latency: 按路径统计转发耗时的直方图（metrics_util.Histogram，标签为路径）
+        :param errors: 按路径统计转发失败的计数（metrics_util.Counter，标签为路径）
+        :param on_success: 转发成功时的回调，参数为 submit 时传入的追踪记录（为空时不回调）
+        """
+        self.on_failure = on_failure
+        self.forward_func = forward_func
+        self.latency = latency
+        self.errors = errors
+        self.on_success = on_success
+        self._slots = threading.BoundedSemaphore(concurrency)
+        self._lanes = {}
+        for kind, count in (inflight or {"top": 4, "deal": 4}).items():
+            lane = queue.Queue(maxsize=queue_size)
+            self._lanes[kind] = lane
+            for i in range(count):
+                t = threading.Thread(target=self._worker, args=(kind, lane), name=f"Forward-{kind}-{i}",
+                                     daemon=True)
+                t.start()
+        logger.info("ThirdApiForwarder 启动，总并发: %d，通道: %s", concurrency, inflight)
+
+    def submit(self, data, timeout: Optional[float] = None, trace=None, done: Optional[Callable[[], None]] = None):
+        """
+        提交转发任务，通道队列已满时阻塞（timeout 秒后抛出 queue.Full）
+        :param trace: 追踪记录（trace_util.TraceRecord），转发成功后写入 forwarded_at 并交给 on_success
+        :param done: 转发成功或已交给 on_failure 后调用（确认模式下据此回确认）
+        """
+        self._lanes[third_path_kind(data)].put((data, trace, done), timeout=timeout)
+
+    def qsize(self) -> Dict[str, int]:
+        """各通道排队中的任务数"""
+        return {kind: lane.qsize() for kind, lane in self._lanes.items()}
+
+    def _worker(self, kind: str, lane: queue.Queue):
+        while True:
+            data, trace, done = lane.get()
+            try:
+                with self._slots:
+                    start = time.perf_counter()
+                    try:
+                        self.forward_func(data)
+                    finally:
+                        if self.latency:
+                            self.latency.labels(kind).observe(time.perf_counter() - start)
+            except Exception as e:
+                if self.errors:
+                    self.errors.labels(kind).inc()
+                logger.error(f"转发失败，加入重试队列: {e}")
+                try:
+                    self.on_failure(data)
+                except Exception as e2:
+                    logger.exception(f"转发失败回调异常: {e2}")
+            else:
+                if trace is not None and self.on_success:
+                    trace.forwarded_at = time.time()
+                    try:
+                        self.on_success(trace)
+                    except Exception as e:
+                        logger.exception(f"转发成功回调异常: {e}")
+            finally:
+                if done is not None:
+                    try:
+                        done()
+                    except Exception as e:
+                        logger.exception(f"转发完成回调异常: {e}")
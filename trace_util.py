@@ -0,0 +1,170 @@
+# -*- coding:utf-8 -*-
+# @FileName  :trace_util.py
+# @Time      :2026/10/17 23:50
+# @Author    :shi lei.wei  <slwei@eppei.com>.
+# 端到端时延追踪：序列号与各阶段时间戳随加密数据一起传输，客户端汇总各阶段时延分位数并统计序列号缺口
+# 追踪帧: 版本(1字节) + 发布进程纪元(4字节) + 条数(2字节)
+#         + 每条 [序列号(8字节) + received_at(8字节) + published_at(8字节)]
+# 时间戳为 time.time()，服务端与客户端的时钟偏差会计入 network 阶段
+import collections
+import logging
+import struct
+import threading
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+TRACE_VERSION = 1
+TRACE_HEADER = struct.Struct("!BIH")
+TRACE_ITEM = struct.Struct("!Qdd")
+
+# 阶段名 -> (起点字段, 终点字段)
+STAGES = collections.OrderedDict([
+    # 服务端 ingest 队列与发布进程内的等待
+    ("queue", ("received_at", "published_at")),
+    # PUSH/PULL 链路与客户端接收缓冲（含两端时钟偏差）
+    ("network", ("published_at", "received_by_client_at")),
+    # 交接队列 + 解密、解压、JSON 解析
+    ("decode", ("received_by_client_at", "decoded_at")),
+    # 转发队列 + 辅助决策系统响应
+    ("forward", ("decoded_at", "forwarded_at")),
+    ("total", ("received_at", "forwarded_at")),
+])
+
+
+class TraceRecord:
+    """单条数据的追踪信息，各阶段依次填入时间戳"""
+    __slots__ = ("epoch", "seq", "received_at", "published_at", "received_by_client_at", "decoded_at",
+                 "forwarded_at")
+
+    def __init__(self, epoch: int, seq: int, received_at: float, published_at: float):
+        self.epoch = epoch
+        self.seq = seq
+        self.received_at = received_at
+        self.published_at = published_at
+        self.received_by_client_at = None
+        self.decoded_at = None
+        self.forwarded_at = None
+
+    def durations(self) -> Dict[str, float]:
+        """已完成的各阶段耗时（秒）"""
+        result = {}
+        for stage, (begin, end) in STAGES.items():
+            begin_at, end_at = getattr(self, begin), getattr(self, end)
+            if begin_at is not None and end_at is not None:
+                result[stage] = end_at - begin_at
+        return result
+
+
+def pack_traces(epoch: int, items: List[tuple]) -> bytes:
+    """items 为 [(序列号, received_at, published_at), ...]"""
+    return TRACE_HEADER.pack(TRACE_VERSION, epoch, len(items)) + b"".join(
+        TRACE_ITEM.pack(*item) for item in items)
+
+
+def peek_message_id(frame: bytes) -> Optional[Tuple[int, int]]:
+    """
+    只读取纪元与第一条序列号（即消息序列号），不检查条数与帧长度，
+    用于追踪帧不完整时仍能确认整条消息；连第一条都无法读取时返回 None
+    """
+    if not frame or len(frame) < TRACE_HEADER.size + TRACE_ITEM.size:
+        return None
+    version, epoch, _ = TRACE_HEADER.unpack_from(frame)
+    if version != TRACE_VERSION:
+        return None
+    (seq, _, _) = TRACE_ITEM.unpack_from(frame, TRACE_HEADER.size)
+    return epoch, seq
+
+
+def unpack_traces(frame: bytes) -> List[TraceRecord]:
+    version, epoch, count = TRACE_HEADER.unpack_from(frame)
+    if version != TRACE_VERSION:
+        raise ValueError(f"unsupported trace version: {version}")
+    if len(frame) != TRACE_HEADER.size + count * TRACE_ITEM.size:
+        raise ValueError(f"trace frame size mismatch: {len(frame)} bytes for {count} items")
+    return [TraceRecord(epoch, *item) for item in TRACE_ITEM.iter_unpack(frame[TRACE_HEADER.size:])]
+
+
+class LatencyTracker:
+    """
+    汇总追踪记录：
+    - 各阶段最近 window 条的 p50/p95/p99，可同时写入 Prometheus 直方图
+    - 按接收顺序检查序列号，统计缺口（PUSH/PULL 链路丢失）、重复/乱序与发布进程重启
+    PUSH 在多个客户端之间轮询分发，连接了多个客户端时每个客户端都会看到缺口
+    """
+
+    def __init__(self, window: int = 10000, histogram=None, gaps=None, gap_events=None):
+        """
+        :param window: 每个阶段保留的最近样本数
+        :param histogram: 按阶段统计耗时的直方图（metrics_util.Histogram，标签为阶段）
+        :param gaps: 缺失条数计数（metrics_util.Counter）
+        :param gap_events: 缺口次数计数（metrics_util.Counter）
+        """
+        self.histogram = histogram
+        self.gaps = gaps
+        self.gap_events_counter = gap_events
+        self._lock = threading.Lock()
+        self._samples = {stage: collections.deque(maxlen=window) for stage in STAGES}
+        self._epoch = None
+        self._expected = None
+        self.received = 0
+        self.missing = 0
+        self.gap_events = 0
+        self.out_of_order = 0
+        self.resets = 0
+
+    def on_received(self, trace: TraceRecord):
+        """接收线程按到达顺序调用，检查序列号是否连续"""
+        with self._lock:
+            self.received += 1
+            if trace.epoch != self._epoch:
+                if self._epoch is not None:
+                    self.resets += 1
+                    logger.warning("发布进程已重启，序列号从 %d 重新计数", trace.seq)
+                self._epoch = trace.epoch
+            elif trace.seq > self._expected:
+                missing = trace.seq - self._expected
+                self.missing += missing
+                self.gap_events += 1
+                if self.gaps:
+                    self.gaps.inc(missing)
+                if self.gap_events_counter:
+                    self.gap_events_counter.inc()
+                logger.warning("序列号缺口: 期望 %d，收到 %d，缺失 %d 条", self._expected, trace.seq, missing)
+            elif trace.seq < self._expected:
+                self.out_of_order += 1
+                return
+            self._expected = trace.seq + 1
+
+    def on_completed(self, trace: TraceRecord):
+        """转发完成（第三方接口已响应）时调用"""
+        durations = trace.durations()
+        with self._lock:
+            for stage, seconds in durations.items():
+                self._samples[stage].append(seconds)
+        if self.histogram:
+            for stage, seconds in durations.items():
+                # 时钟偏差可能使 network 阶段为负，直方图只接受非负值
+                self.histogram.labels(stage).observe(max(seconds, 0.0))
+
+    def summary(self) -> Dict[str, object]:
+        """各阶段耗时分位数（毫秒）与序列号统计"""
+        with self._lock:
+            samples = {stage: sorted(values) for stage, values in self._samples.items()}
+            result = {
+                "received": self.received,
+                "missing": self.missing,
+                "gap_events": self.gap_events,
+                "out_of_order": self.out_of_order,
+                "resets": self.resets,
+            }
+        result["stages"] = {stage: _percentiles(values) for stage, values in samples.items() if values}
+        return result
+
+
+def _percentiles(values) -> Dict[str, float]:
+    def pick(q):
+        return round(values[min(len(values) - 1, int(len(values) * q))] * 1000, 3)
+
+    return {"count": len(values), "p50": pick(0.50), "p95": pick(0.95), "p99": pick(0.99)}
+
@@ -0,0 +1,58 @@
+# -*- coding:utf-8 -*-
+# @FileName  :train_zstd_dict.py
+# @Time      :2026/10/17 17:55
+# @Author    :shi lei.wei  <slwei@eppei.com>.
+# 用采集到的样本训练 zstd 字典，输出文件配置到 zstd_dict_path
+# 样本: .jsonl/.ndjson 文件每行一条，其他文件整个文件一条，目录递归读取
+import argparse
+import os
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+def load_samples(paths):
+    """读取样本，返回 bytes 列表"""
+    samples = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, files in os.walk(path):
+                samples.extend(load_samples(os.path.join(root, name) for name in sorted(files)))
+        elif path.endswith((".jsonl", ".ndjson")):
+            with open(path, "rb") as f:
+                samples.extend(line.rstrip(b"\r\n") for line in f if line.strip())
+        else:
+            with open(path, "rb") as f:
+                samples.append(f.read())
+    return samples
+
+
+def train(samples, dict_size, level):
+    dict_data = zstandard.train_dictionary(dict_size, samples, level=level)
+    plain = zstandard.ZstdCompressor(level=level)
+    with_dict = zstandard.ZstdCompressor(level=level, dict_data=dict_data)
+    raw = sum(len(s) for s in samples)
+    plain_size = sum(len(plain.compress(s)) for s in samples)
+    dict_size_total = sum(len(with_dict.compress(s)) for s in samples)
+    print(f"样本 {len(samples)} 条, 原始 {raw} 字节")
+    print(f"  zstd 无字典: {plain_size} 字节, 压缩比 {raw / plain_size:.2f}")
+    print(f"  zstd 有字典: {dict_size_total} 字节, 压缩比 {raw / dict_size_total:.2f}, dict_id={dict_data.dict_id()}")
+    return dict_data
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="训练 zstd 压缩字典")
+    parser.add_argument("samples", nargs="+", help="样本文件或目录，如 requests.jsonl")
+    parser.add_argument("-o", "--output", default="data/zstd.dict")
+    parser.add_argument("--dict-size", type=int, default=112640, help="字典大小（字节）")
+    parser.add_argument("--level", type=int, default=3)
+    args = parser.parse_args()
+    if zstandard is None:
+        raise SystemExit("需要安装 zstandard: pip install zstandard")
+    trained = train(load_samples(args.samples), args.dict_size, args.level)
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "wb") as out:
+        out.write(trained.as_bytes())
+    print(f"字典已保存: {args.output}，配置 zstd_dict_path 后生效")
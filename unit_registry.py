@@ -0,0 +1,124 @@
+# -*- coding:utf-8 -*-
+# @FileName  :unit_registry.py
+# @Time      :2026/10/17 21:20
+# @Author    :shi lei.wei  <slwei@eppei.com>.
+# 各 gunicorn worker 共享的活跃账号登记表：SQLite 表 + 进程内读缓存
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional
+
+from login_db import connect
+
+logger = logging.getLogger(__name__)
+
+
+class ActiveUnitRegistry:
+    """
+    机器 -> 账号编号 的活跃登记，保存在 active_units 表中，所有 worker 看到同一份数据
+    - 读：返回进程内缓存，只有 PRAGMA data_version 变化（其他连接有提交）或有记录到期时才重新加载，
+      未变化时一次读取只是一条 PRAGMA，不扫描表
+    - 写：登录/登出直接写表，本进程缓存立即失效
+    - 过期：超过 ttl 秒没有再次登录的机器视为离线（从不调用 /api/logout 的机器），读取时过滤，定期删除
+    """
+
+    def __init__(self, db_path: str, ttl: float = 43200):
+        """
+        :param db_path: 数据库文件路径（表由 login_db 迁移创建）
+        :param ttl: 机器最后一次登录后保持活跃的秒数
+        """
+        self.db_path = db_path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pid = None
+        # 缓存：机器 -> 账号编号，以及缓存对应的 data_version 与最早到期时间
+        self._cache: Dict[str, int] = {}
+        self._version = None
+        self._expires_at = 0.0
+        self._purged_at = 0.0
+
+    def _connection(self) -> sqlite3.Connection:
+        # fork 前打开的连接不能在子进程中使用
+        if self._pid != os.getpid():
+            self._conn = connect(self.db_path)
+            self._pid = os.getpid()
+            self._version = None
+        return self._conn
+
+    def activate(self, machine: str, unit_id: int):
+        """记录机器登录的账号，已登记的机器更新账号与最后登录时间"""
+        with self._lock:
+            self._connection().execute(
+                "INSERT INTO active_units (machine, unit_id, last_seen) VALUES (?, ?, ?) "
+                "ON CONFLICT(machine) DO UPDATE SET unit_id=excluded.unit_id, last_seen=excluded.last_seen",
+                (machine, unit_id, int(time.time()))
+            )
+            self._version = None
+
+    def deactivate(self, machine: str) -> Optional[int]:
+        """机器登出，返回其登记的账号编号，未登记（或已过期）时返回 None"""
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT unit_id, last_seen FROM active_units WHERE machine=?", (machine,)
+                ).fetchone()
+                if row is not None:
+                    conn.execute("DELETE FROM active_units WHERE machine=?", (machine,))
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            self._version = None
+        if row is None or row[1] < time.time() - self.ttl:
+            return None
+        return row[0]
+
+    def snapshot(self) -> Dict[str, int]:
+        """
+        当前活跃的 机器 -> 账号编号，返回的字典不可修改
+        重新加载时换成新的字典，数据未变化时返回同一个对象，调用方可以用 is 判断是否有变化
+        """
+        with self._lock:
+            conn = self._connection()
+            version = conn.execute("PRAGMA data_version").fetchone()[0]
+            now = time.time()
+            if version != self._version or now >= self._expires_at:
+                self._reload(conn, now)
+                # 本连接自己的提交不会改变 data_version，用加载前读到的值
+                self._version = version
+            return self._cache
+
+    def active_unit_ids(self):
+        return self.snapshot().values()
+
+    def __contains__(self, machine: str) -> bool:
+        return machine in self.snapshot()
+
+    def __len__(self):
+        return len(self.snapshot())
+
+    def _reload(self, conn: sqlite3.Connection, now: float):
+        cutoff = now - self.ttl
+        if now - self._purged_at > min(self.ttl, 600):
+            self._purged_at = now
+            deleted = conn.execute("DELETE FROM active_units WHERE last_seen < ?", (cutoff,)).rowcount
+            if deleted:
+                logger.info("清理过期的活跃机器 %d 台", deleted)
+        rows = conn.execute(
+            "SELECT machine, unit_id, last_seen FROM active_units WHERE last_seen >= ?", (cutoff,)
+        ).fetchall()
+        self._cache = {machine: unit_id for machine, unit_id, _ in rows}
+        # 最早的一条到期后需要重新过滤
+        self._expires_at = min((last_seen for _, _, last_seen in rows), default=now) + self.ttl
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None and self._pid == os.getpid():
+                self._conn.close()
+            self._conn = None
+            self._pid = None
@@ -0,0 +1,133 @@
+# -*- coding:utf-8 -*-
+# @FileName  :weighted_sampler.py
+# @Time      :2026/10/17 21:50
+# @Author    :shi lei.wei  <slwei@eppei.com>.
+# 按权重随机抽取空闲账号：树状数组（Fenwick）维护权重前缀和，抽样与登录/登出更新均为 O(log n)
+import random
+from typing import Dict, Iterable, Optional
+
+
+class WeightedSampler:
+    """
+    在全部名称中按权重随机抽取一个未被占用的名称
+    - 被占用（activate）的名称权重置 0，释放（deactivate）时恢复
+    - sample 在前缀和上二分下降，不再每次构建候选列表
+    - 名称统一按字符串处理，unit_pool 的键（"1"）与数据库中的账号编号（1）视为同一个
+    """
+
+    # 浮点权重反复加减会累积误差，更新次数达到该值后按原始权重重建
+    REBUILD_EVERY = 100000
+
+    def __init__(self, weights: Dict[str, float], rng: Optional[random.Random] = None):
+        """
+        :param weights: 名称 -> 权重，权重需大于 0
+        :param rng: 随机数生成器，默认使用 random 模块
+        """
+        self._names = [str(name) for name in weights]
+        self._index = {name: i for i, name in enumerate(self._names)}
+        self._base = [float(w) for w in weights.values()]
+        self._weights = list(self._base)
+        self._active = set()
+        # 上次 set_active 同步的数据版本
+        self._version = None
+        self._rng = rng or random
+        self._size = len(self._names)
+        # 二分下降的起始步长：不超过 n 的最大 2 的幂
+        self._top = 1 << (self._size.bit_length() - 1) if self._size else 0
+        self._build()
+
+    @classmethod
+    def from_priority(cls, unit_pool: Dict[str, float], rng: Optional[random.Random] = None):
+        """unit_pool 中的值为优先级，数值越小越优先，权重取倒数"""
+        return cls({name: 1 / priority for name, priority in unit_pool.items()}, rng)
+
+    def _build(self):
+        """O(n) 构建树状数组"""
+        tree = [0.0] + self._weights
+        for i in range(1, self._size + 1):
+            parent = i + (i & -i)
+            if parent <= self._size:
+                tree[parent] += tree[i]
+        self._tree = tree
+        self._updates = 0
+
+    def _set(self, i: int, weight: float):
+        delta = weight - self._weights[i]
+        if delta == 0:
+            return
+        self._weights[i] = weight
+        self._updates += 1
+        if self._updates >= self.REBUILD_EVERY:
+            self._build()
+            return
+        i += 1
+        while i <= self._size:
+            self._tree[i] += delta
+            i += i & -i
+
+    def total(self) -> float:
+        """空闲名称的权重之和"""
+        total, i = 0.0, self._size
+        while i > 0:
+            total += self._tree[i]
+            i -= i & -i
+        return total
+
+    def activate(self, name):
+        """名称被占用，不再参与抽取；未知名称忽略"""
+        self._version = None
+        name = str(name)
+        i = self._index.get(name)
+        if i is not None:
+            self._active.add(name)
+            self._set(i, 0.0)
+
+    def deactivate(self, name):
+        """名称释放，恢复原权重"""
+        self._version = None
+        name = str(name)
+        i = self._index.get(name)
+        if i is not None:
+            self._active.discard(name)
+            self._set(i, self._base[i])
+
+    def set_active(self, names: Iterable, version=None):
+        """
+        把占用集合同步为 names，只更新发生变化的名称
+        :param version: names 的数据版本（数据变化时换成新对象），与上次同步的是同一个对象时直接返回，
+            不遍历 names；为空时每次都比较。单独调用 activate / deactivate 后下次一定重新比较
+        """
+        if version is not None and version is self._version:
+            return
+        active = {str(name) for name in names}
+        for name in self._active - active:
+            self.deactivate(name)
+        for name in active - self._active:
+            self.activate(name)
+        self._version = version
+
+    def sample(self) -> Optional[str]:
+        """按权重抽取一个空闲名称，全部被占用时返回 None"""
+        total = self.total()
+        if total <= 0:
+            return None
+        for _ in range(3):
+            target = self._rng.random() * total
+            # 找到前缀和首次超过 target 的位置
+            pos, step = 0, self._top
+            while step:
+                nxt = pos + step
+                if nxt <= self._size and self._tree[nxt] <= target:
+                    pos = nxt
+                    target -= self._tree[nxt]
+                step >>= 1
+            if pos < self._size and self._weights[pos] > 0:
+                return self._names[pos]
+            # 浮点误差落在边界或权重为 0 的位置，重新抽取
+        candidates = [i for i, w in enumerate(self._weights) if w > 0]
+        if not candidates:
+            return None
+        return self._names[self._rng.choices(candidates, weights=[self._weights[i] for i in candidates])[0]]
+
+    def __len__(self):
+        return self._size
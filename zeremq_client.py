@@ -5,42 +5,129 @@
 # client.py (内网)
 import json
 import logging
+import multiprocessing
+import os
+import queue
 import threading
 import time
 import zlib
+from concurrent.futures import Future, ProcessPoolExecutor
 from datetime import datetime
 
 import zmq
 
+import codec_util
 import decrypt_util
+import frame_util
+import metrics_util
+import reliable_link
+import trace_util
+import zmq_util
 from action_util import call_third_api
 from back_off_queue import ExponentialBackoffQueue, on_permanent_failure
+from back_off_store import create_backoff_store
 from config_manager import load_config, ConfigManager
-from log import setup_logger
+from cryptor import get_cryptor
+from log import HotLogger, setup_logger
+from third_forwarder import ThirdApiForwarder
 
 logger = logging.getLogger(__name__)
+# 每条数据的日志，按事件类型采样与限速
+hot_logger = HotLogger(logger)
+
+
+def decode_payload(compressed_data: bytes):
+    """
+    解码阶段（在进程池中执行）：AES + GZIP 解密并解析 JSON，二进制信封与旧的 Base64 文本均可
+    返回 (数据, 耗时, 完成时间)，解密失败时数据为 None
+    """
+    start_time = time.time()
+    data = decrypt_util.decrypt_payload(compressed_data)
+    if not data:
+        return None, time.time() - start_time, time.time()
+    data = json.loads(data)
+    decoded_at = time.time()
+    return data, decoded_at - start_time, decoded_at
 
 
 class DataSubscriber:
+    """
+    分阶段的数据接收管道:
+    接收(只读 socket) -> 有界交接队列 -> 解码(进程池) -> 转发(ThirdApiForwarder)
+    任一阶段满载时上游阻塞，最终停止读取 socket，由 ZMQ RCVHWM 与 TCP 窗口把背压传给服务端
+    """
+
     def __init__(self, server_address="tcp://0.0.0.0:6666", recv_timeout=10000):
         """
         初始化订阅者
         :param server_address: 服务端地址
         :param recv_timeout: 接收超时时间（毫秒），None表示永久阻塞
         """
+        # 加载密钥与压缩配置，配置有误或 codec 依赖未安装时启动失败，而不是解密第一条数据时
+        get_cryptor()
+        logger.info("可用的压缩算法: %s", ", ".join(codec_util.available_codecs()))
         self.context = zmq.Context()
-        self.socket = self.context.socket(zmq.PULL)
+        # 与服务端 zmq_transport 一致：push 对应 PULL，ack 对应 DEALER（收到数据后回确认）
+        self.transport = ConfigManager.get_param_by_key("zmq_transport", "push")
         self.server_address = server_address
-        self.socket.connect(server_address)
-        # 订阅所有消息
-        # self.socket.setsockopt(zmq.SUBSCRIBE, b"")
-        # 设置接收超时
-        if recv_timeout is not None:
-            self.socket.setsockopt(zmq.RCVTIMEO, recv_timeout)
+        self.recv_timeout = recv_timeout
+        # socket 只在接收线程内创建、读写与重建，其他线程通过 reconnect_requested 请求重建
+        self.socket = None
+        self.monitor = None
+        self.poller = None
+        self.reconnect_requested = threading.Event()
+        # 连接断开的时间，重新连上后计入重连耗时
+        self.disconnected_at = time.time()
+        self.next_link_check = 0.0
+        # 确认模式：按序列号去重，批量回确认，定时发 hello 让服务端知道客户端在线
+        self.dedup = None
+        self.acks = None
+        self.ack_tracker = None
+        if self.transport == "ack":
+            self.dedup = reliable_link.SequenceFilter(ConfigManager.get_param_by_key("zmq_dedup_capacity", 100000))
+            self.acks = reliable_link.AckBatcher(
+                batch_size=ConfigManager.get_param_by_key("zmq_ack_batch", 64),
+                interval=ConfigManager.get_param_by_key("zmq_ack_interval_ms", 20) / 1000.0
+            )
+            # 数据转发成功、写入重试队列或进入死信后才确认
+            self.ack_tracker = reliable_link.AckTracker()
+            self.keepalive_interval = ConfigManager.get_param_by_key("zmq_keepalive_interval", 10)
+            self.next_keepalive = 0.0
         self.running = True
+        # 最近一次收到服务端消息（数据或心跳）的时间
         self.last_heartbeat = time.time()
-        # 多少秒无心跳认为连接异常
+        # 多少秒没有收到任何消息认为连接异常，重建 socket（连接中断一般由 ZMTP 心跳更早发现并自动重连）
         self.heartbeat_timeout = ConfigManager.get_param_by_key("zero_mq_heart_beat_timeout", 900)
+        # Prometheus 指标，由 metrics_port 上的 HTTP 服务导出
+        self.registry = metrics_util.MetricsRegistry()
+        r = self.registry
+        self.received_items = r.counter("pec_client_received_items_total", "Messages received from the server",
+                                        label="type", values=("data", "heartbeat"))
+        self.received_bytes = r.counter("pec_client_received_bytes_total", "Payload bytes received from the server")
+        self.decrypt_time = r.histogram("pec_client_decrypt_seconds", "Decrypt, decompress and JSON parse time")
+        self.decode_errors = r.counter("pec_client_decode_errors_total", "Payloads that failed to decode")
+        self.duplicate_items = r.counter("pec_client_duplicate_items_total",
+                                         "Retransmitted items dropped as duplicates")
+        # 连接状态
+        self.connected = r.gauge("pec_client_connected", "Whether the link to the server is up")
+        self.disconnects = r.counter("pec_client_disconnects_total", "Link drops reported by the socket monitor")
+        self.reconnects = r.counter("pec_client_socket_recreations_total", "Sockets recreated by the receive thread",
+                                    label="reason", values=("timeout", "error"))
+        self.reconnect_time = r.histogram("pec_client_reconnect_seconds", "Time from link drop to reconnect",
+                                          buckets=(0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0))
+        # 端到端追踪：各阶段时延与序列号缺口
+        self.latency_tracker = trace_util.LatencyTracker(
+            window=ConfigManager.get_param_by_key("trace_window", 10000),
+            histogram=r.histogram("pec_client_trace_stage_seconds", "End-to-end latency by pipeline stage",
+                                  label="stage", values=trace_util.STAGES,
+                                  buckets=metrics_util.DEFAULT_BUCKETS + (30.0, 60.0, 300.0)),
+            gaps=r.counter("pec_client_sequence_missing_total",
+                           "Items missing from the sequence on the PUSH/PULL link"),
+            gap_events=r.counter("pec_client_sequence_gaps_total",
+                                 "Breaks in the sequence, usually one per lost connection")
+        )
+        r.gauge("pec_client_pipeline_queue_size", "Items waiting in each pipeline stage", label="stage",
+                func=self._stage_sizes)
         # 启动重试线程
         self.ebq = ExponentialBackoffQueue(
             process_func=call_third_api,
@@ -49,8 +136,44 @@ class DataSubscriber:
             max_backoff=60 * 60 * 6.0,
             jitter=True,
             dead_letter_callback=on_permanent_failure,
-            worker_count=2
+            worker_count=2,
+            # 持久化重试任务，进程重启后重放
+            store=create_backoff_store(
+                ConfigManager.get_param_by_key("backoff_store_path", "data/subscriber_backoff.db"),
+                max_entries=ConfigManager.get_param_by_key("backoff_store_max_entries", 500000),
+                max_mb=ConfigManager.get_param_by_key("backoff_store_max_mb", 1024)
+            ),
+            metrics=metrics_util.BackoffMetrics(r, "subscriber", 5)
+        )
+        # 并发转发到辅助决策系统，失败进入重试队列
+        inflight = {
+            "top": ConfigManager.get_param_by_key("third_top_inflight", 4),
+            "deal": ConfigManager.get_param_by_key("third_deal_inflight", 4)
+        }
+        self.forwarder = ThirdApiForwarder(
+            on_failure=self._retry_later,
+            concurrency=ConfigManager.get_param_by_key("third_concurrency", 8),
+            inflight=inflight,
+            queue_size=ConfigManager.get_param_by_key("third_queue_size", 1000),
+            latency=r.histogram("pec_client_forward_seconds", "Decision system call latency",
+                                label="path", values=inflight),
+            errors=r.counter("pec_client_forward_errors_total", "Failed decision system calls",
+                             label="path", values=inflight),
+            on_success=self.latency_tracker.on_completed
         )
+        # 接收阶段 -> 解码阶段的有界交接队列
+        self.handoff = queue.Queue(maxsize=ConfigManager.get_param_by_key("pipeline_handoff_size", 1000))
+        # 解码阶段：AES/GZIP/JSON 属于 CPU 密集型，放到进程池，0 表示在线程内解码
+        # 此时重试、刷盘等线程已经启动，进程池的子进程在提交任务时才创建，不能从多线程进程 fork
+        # （可能继承被其他线程持有的日志锁、队列锁而死锁），改由 forkserver（不支持时 spawn）启动
+        decode_workers = ConfigManager.get_param_by_key("pipeline_decode_workers", os.cpu_count() or 1)
+        self.decode_pool = ProcessPoolExecutor(
+            max_workers=decode_workers, initializer=load_config, initargs=("config_client.json",),
+            mp_context=multiprocessing.get_context(
+                "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn")
+        ) if decode_workers > 0 else None
+        # 解码中的任务（按接收顺序），长度即解码阶段的最大在途数
+        self.decoding = queue.Queue(maxsize=max(decode_workers, 1) * 2)
         logger.info("zero mq client bind address: %s", server_address)
 
     def decompress_data(self, compressed_data):
@@ -64,49 +187,114 @@ class DataSubscriber:
             return None
 
     def monitor_heartbeat(self):
-        """心跳监控线程"""
+        """心跳监控线程：只检查时间，超时后请求接收线程重建 socket（zmq socket 不能跨线程使用）"""
         while self.running:
             current_time = time.time()
-            if current_time - self.last_heartbeat > self.heartbeat_timeout:
+            if current_time - self.last_heartbeat > self.heartbeat_timeout and not self.reconnect_requested.is_set():
                 logger.warning(f"[警告] 心跳超时！最后心跳时间: {datetime.fromtimestamp(self.last_heartbeat)}")
-                # 可以在这里添加重连逻辑
-                self.socket.connect(self.server_address)
-                # 订阅所有消息
-                # self.socket.setsockopt(zmq.SUBSCRIBE, b"")
+                self.reconnect_requested.set()
             time.sleep(10)
 
+    def _create_socket(self):
+        """创建并连接 socket，同时开启监控（在接收线程内调用）"""
+        self.socket = self.context.socket(zmq.DEALER if self.transport == "ack" else zmq.PULL)
+        # 接收缓冲上限，交接队列满后数据堆积在这里，再满则由 TCP 反压服务端
+        self.socket.setsockopt(zmq.RCVHWM, ConfigManager.get_param_by_key("zmq_rcvhwm", 1000))
+        self.socket.setsockopt(zmq.LINGER, 0)
+        # 设置接收超时
+        if self.recv_timeout is not None:
+            self.socket.setsockopt(zmq.RCVTIMEO, self.recv_timeout)
+        zmq_util.configure_liveness(self.socket)
+        self.monitor = self.socket.get_monitor_socket(zmq_util.MONITOR_EVENTS)
+        self.poller = zmq.Poller()
+        self.poller.register(self.socket, zmq.POLLIN)
+        self.poller.register(self.monitor, zmq.POLLIN)
+        self.socket.connect(self.server_address)
+        if self.acks is not None:
+            # 新连接立即发 hello，服务端据此重发未确认的消息
+            self.next_keepalive = 0.0
+
+    def _close_socket(self):
+        try:
+            self.socket.disable_monitor()
+        except zmq.ZMQError:
+            pass
+        self.monitor.close(0)
+        self.socket.close(0)
+
+    def _reconnect(self, reason):
+        """关闭并重建 socket，丢弃 libzmq 内部的重连状态"""
+        logger.warning("重建连接（%s）: %s", reason, self.server_address)
+        self.reconnects.labels(reason).inc()
+        self._close_socket()
+        self._on_disconnected()
+        self._create_socket()
+        self.last_heartbeat = time.time()
+
+    def _on_disconnected(self):
+        self.connected.set(0)
+        if self.disconnected_at is None:
+            self.disconnected_at = time.time()
+
+    def _check_link(self):
+        """处理监控事件与重建请求，最多每秒一次（在接收线程内调用）"""
+        now = time.time()
+        if now < self.next_link_check:
+            return
+        self.next_link_check = now + 1
+        for event in zmq_util.drain_monitor(self.monitor):
+            if event["event"] == zmq.EVENT_CONNECTED:
+                self.connected.set(1)
+                if self.disconnected_at is not None:
+                    elapsed = time.time() - self.disconnected_at
+                    self.reconnect_time.observe(elapsed)
+                    logger.info("已连接服务端 %s，断开 %.3f 秒", event["endpoint"].decode(), elapsed)
+                    self.disconnected_at = None
+            elif event["event"] == zmq.EVENT_DISCONNECTED:
+                self.disconnects.inc()
+                self._on_disconnected()
+                logger.warning("与服务端的连接断开: %s", event["endpoint"].decode())
+        if self.reconnect_requested.is_set():
+            self.reconnect_requested.clear()
+            self._reconnect("timeout")
+
     def start_subscribing(self):
         """开始订阅数据"""
         # 启动心跳监控线程
         monitor_thread = threading.Thread(target=self.monitor_heartbeat, daemon=True)
         monitor_thread.start()
+        metrics_port = ConfigManager.get_param_by_key("metrics_port", 9108)
+        if metrics_port:
+            metrics_util.start_http_exporter(self.registry, metrics_port)
+        # 启动解码、转发阶段与监控线程
+        threading.Thread(target=self._decode_loop, name="Pipeline-Decode", daemon=True).start()
+        threading.Thread(target=self._forward_loop, name="Pipeline-Forward", daemon=True).start()
+        threading.Thread(target=self._stat_pipeline, name="Pipeline-Stat", daemon=True).start()
         logger.info("内网客户端启动，等待接收数据...")
+        self._create_socket()
         try:
             while self.running:
                 try:
+                    self._check_link()
                     # 接收多部分消息
-                    message_parts = self.socket.recv_multipart()
+                    message_parts = self._recv()
+                    if message_parts is None:
+                        continue
                     if len(message_parts) >= 2:
                         msg_type = message_parts[0]
                         compressed_data = message_parts[1]
-                        if msg_type == b"heartbeat":
+                        if msg_type == frame_util.MSG_HEARTBEAT:
                             # 处理心跳包
                             heartbeat_data = self.decompress_data(compressed_data)
                             if heartbeat_data:
+                                self.received_items.labels("heartbeat").inc()
                                 self.last_heartbeat = time.time()
                                 logger.info(
                                     f"[心跳] 收到心跳包 - {datetime.fromtimestamp(heartbeat_data['timestamp'])} - "
                                     f"{heartbeat_data['queue_size']}")
-                        elif msg_type == b"data":
-                            # 处理数据包
-                            start_time = time.time()
-                            # data = self.decompress_data(compressed_data)
-                            data = decrypt_util.decrypt_data(compressed_data.decode("utf-8"))
-                            if data:
-                                process_time = time.time() - start_time
-                                self.process_data(json.loads(data), process_time)
-                            else:
-                                logger.error("数据解压失败")
+                        elif msg_type in (frame_util.MSG_DATA, frame_util.MSG_BATCH):
+                            # 数据包（批量数据包拆分后逐条处理）
+                            self.handle_message(message_parts)
                         else:
                             logger.info(f"未知消息类型: {msg_type}")
                     else:
@@ -114,6 +302,11 @@ class DataSubscriber:
                 except zmq.Again:
                     # 超时，继续循环
                     continue
+                except zmq.ZMQError as e:
+                    # socket 异常，重建后继续
+                    logger.exception(f"接收错误: {e}")
+                    time.sleep(1)
+                    self._reconnect("error")
                 except Exception as e:
                     logger.error(f"接收错误: {e}")
                     logger.exception(e)
@@ -123,31 +316,214 @@ class DataSubscriber:
         finally:
             self.stop()
 
-    def process_data(self, data, process_time):
+    def handle_message(self, message_parts):
+        """拆分数据消息，带追踪帧时记录到达时间并检查序列号"""
+        self.last_heartbeat = time.time()
+        payloads, trace_frame = frame_util.unpack_message(message_parts)
+        traces = [None] * len(payloads)
+        if trace_frame is not None:
+            try:
+                traces = trace_util.unpack_traces(trace_frame)
+                if len(traces) != len(payloads):
+                    raise ValueError(f"trace count mismatch: {len(traces)} traces, {len(payloads)} payloads")
+                received_at = time.time()
+                for trace in traces:
+                    trace.received_by_client_at = received_at
+                    self.latency_tracker.on_received(trace)
+            except ValueError as e:
+                logger.error(f"追踪帧解析失败: {e}")
+                traces = [None] * len(payloads)
+        if self.ack_tracker is not None:
+            if traces[0] is not None:
+                message_id = (traces[0].epoch, traces[0].seq)
+            else:
+                # 追踪帧不完整时按消息序列号处理并确认，否则服务端会一直重发
+                message_id = trace_util.peek_message_id(trace_frame)
+            if message_id is None:
+                # 无法得到消息序列号，不能确认，数据直接进入死信
+                error = ValueError("ack mode message without a readable trace frame")
+                for compressed_data in payloads:
+                    on_permanent_failure(compressed_data, 0, error)
+                return
+            self._handle_acked(payloads, traces, message_id)
+            return
+        for compressed_data, trace in zip(payloads, traces):
+            self.handle_data(compressed_data, trace)
+
+    def _handle_acked(self, payloads, traces, message_id):
+        """
+        确认模式：跳过重发导致的重复数据，消息中的数据全部转发成功、写入重试队列或进入死信后才确认
+        - 原消息还在处理中：重发的消息直接丢弃，原消息完成后确认
+        - 原消息已处理完（确认丢失）：数据都是重复的，立即再次确认
+        """
+        if self.ack_tracker.in_flight(*message_id):
+            self.duplicate_items.inc(len(payloads))
+            return
+        accepted = [(compressed_data, trace) for compressed_data, trace in zip(payloads, traces)
+                    if trace is None or self.dedup.accept(trace.epoch, trace.seq)]
+        if len(accepted) < len(payloads):
+            self.duplicate_items.inc(len(payloads) - len(accepted))
+        done = self.ack_tracker.track(*message_id, len(accepted))
+        for compressed_data, trace in accepted:
+            self.handle_data(compressed_data, trace, done)
+
+    def _recv(self):
+        """
+        读取一条消息：有数据时直接读取，没有时等待数据或监控事件，超时返回 None
+        确认模式下先发送到期的确认与 hello
+        """
+        timeout = self._ack_tick() if self.acks is not None else 1000
+        try:
+            return self.socket.recv_multipart(zmq.NOBLOCK)
+        except zmq.Again:
+            pass
+        events = dict(self.poller.poll(timeout))
+        if self.monitor in events:
+            # 连接状态变化，下一轮立即处理
+            self.next_link_check = 0.0
+        if self.socket not in events:
+            return None
+        return self.socket.recv_multipart(zmq.NOBLOCK)
+
+    def _ack_tick(self):
+        """发送到期的确认与 hello，返回下一次 poll 的超时（毫秒）"""
+        now = time.time()
+        for epoch, seq in self.ack_tracker.drain():
+            self.acks.add(epoch, seq)
+        if self.acks.due():
+            self._send_control(self.acks.take())
+        if now >= self.next_keepalive:
+            self._send_control([reliable_link.MSG_HELLO])
+            self.next_keepalive = now + self.keepalive_interval
+        # 有处理中的消息时按确认间隔醒来，及时发出完成的确认
+        return self.acks.interval * 1000 if len(self.acks) or len(self.ack_tracker) else 1000
+
+    def _send_control(self, frames):
+        try:
+            self.socket.send_multipart(frames, flags=zmq.NOBLOCK)
+        except zmq.Again:
+            # 未连接或发送缓冲已满，丢弃的确认由服务端超时重发补上
+            logger.debug("确认发送失败，等待服务端重发")
+
+    def handle_data(self, compressed_data, trace=None, done=None):
+        """
+        接收阶段：只把数据交给解码阶段，交接队列满时阻塞，不再读取 socket
+        :param done: 确认模式下数据离开处理管道时调用（见 AckTracker），随数据经过各阶段
+        """
+        self.received_items.labels("data").inc()
+        self.received_bytes.inc(len(compressed_data))
+        while self.running:
+            try:
+                self.handoff.put((compressed_data, trace, done), timeout=1)
+                return
+            except queue.Full:
+                # 下游繁忙而非链路中断，避免心跳监控误判
+                self.last_heartbeat = time.time()
+
+    def _decode_loop(self):
+        """解码阶段：从交接队列取数据提交到进程池，在途数量受 self.decoding 限制"""
+        while self.running:
+            try:
+                compressed_data, trace, done = self.handoff.get(timeout=1)
+            except queue.Empty:
+                continue
+            if self.decode_pool:
+                future = self.decode_pool.submit(decode_payload, compressed_data)
+            else:
+                future = Future()
+                try:
+                    future.set_result(decode_payload(compressed_data))
+                except Exception as e:
+                    future.set_exception(e)
+            self.decoding.put((future, trace, done))
+
+    def _forward_loop(self):
+        """转发阶段：按接收顺序取解码结果，交给转发线程池"""
+        while self.running:
+            try:
+                future, trace, done = self.decoding.get(timeout=1)
+            except queue.Empty:
+                continue
+            try:
+                data, process_time, decoded_at = future.result()
+                self.decrypt_time.observe(process_time)
+                if data:
+                    if trace is not None:
+                        trace.decoded_at = decoded_at
+                    # done 由转发阶段（或失败时的重试队列）负责调用
+                    self.process_data(data, process_time, trace, done)
+                    continue
+                self.decode_errors.inc()
+                logger.error("数据解压失败")
+            except Exception as e:
+                self.decode_errors.inc()
+                logger.exception(f"数据解析错误: {e}")
+            # 无法解码的数据重发也无法解码，作为死信处理并确认
+            self._settle(done)
+
+    def stats(self):
+        """各阶段队列深度"""
+        return {
+            "handoff": self.handoff.qsize(),
+            "decoding": self.decoding.qsize(),
+            "forward": self.forwarder.qsize(),
+            "backoff": self.ebq.qsize()
+        }
+
+    def _stage_sizes(self):
+        sizes = {"handoff": self.handoff.qsize(), "decoding": self.decoding.qsize(), "backoff": self.ebq.qsize()}
+        for kind, size in self.forwarder.qsize().items():
+            sizes[f"forward_{kind}"] = size
+        return sizes
+
+    def _stat_pipeline(self):
+        while self.running:
+            try:
+                logger.info("pipeline queue size: %s", self.stats())
+                logger.info("pipeline latency: %s", self.latency_tracker.summary())
+            except Exception as e:
+                logger.exception(e)
+            finally:
+                time.sleep(60)
+
+    @staticmethod
+    def _settle(done):
+        if done is not None:
+            done()
+
+    def _retry_later(self, data):
+        """转发失败：加入重试队列并立即落盘，之后才能确认"""
+        self.ebq.add_task(data)
+        self.ebq.sync()
+
+    def process_data(self, data, process_time, trace=None, done=None):
         """处理接收到的数据"""
         try:
             inner_payload = data.get('payload', 'N/A')
             # 内存对象: {"data": data, "timestamp": datetime.now().isoformat(), "sequence": sequence}
-            sequence = inner_payload.get('sequence', 'N/A')
             timestamp = inner_payload.get('timestamp', 'N/A')
-            data_size = len(str(inner_payload.get('data', '')))
-            logger.info(f"[数据] 接收消息 #{sequence}")
-            logger.info(
-                f"      时间戳: {datetime.fromtimestamp(timestamp) if isinstance(timestamp, (int, float)) else timestamp}")
-            logger.info(f"      数据大小: {data_size} 字节")
-            logger.info(f"      处理耗时: {process_time:.3f} 秒")
-            # 转发到辅助决策系统
-            call_third_api(data)
+            # 时间戳转换与数据大小（需要把整条数据转成字符串）只在确实输出时计算
+            hot_logger.info(
+                "data", "[数据] 接收消息 #%s, 时间戳: %s, 数据大小: %d 字节, 处理耗时: %.3f 秒",
+                inner_payload.get('sequence', 'N/A'),
+                lambda: datetime.fromtimestamp(timestamp) if isinstance(timestamp, (int, float)) else timestamp,
+                lambda: len(str(inner_payload.get('data', ''))), process_time)
+            # 转发到辅助决策系统（异步，队列满时阻塞接收循环形成背压）
+            self.forwarder.submit(data, trace=trace, done=done)
             # push_with_retry(data)
         except Exception as e:
             logger.exception(f"数据处理错误: {e}")
-            self.ebq.add_task(data)
+            self._retry_later(data)
+            self._settle(done)
 
     def stop(self):
         """停止客户端"""
         self.running = False
-        self.socket.close()
+        if self.socket is not None:
+            self._close_socket()
         self.context.term()
+        if self.decode_pool:
+            self.decode_pool.shutdown(wait=False, cancel_futures=True)
 
 
 if __name__ == "__main__":
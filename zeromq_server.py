@@ -3,88 +3,203 @@
 # @Time      :2025/9/4 15:54
 # @Author    :shi lei.wei  <slwei@eppei.com>.
 # server.py (外网)
+import collections
 import json
 import logging
+import multiprocessing
+import os
+import signal
+import struct
 import threading
 import time
 import zlib
-from multiprocessing import Queue
-from queue import Empty
 
 import zmq
 from flask import Flask, request, jsonify
 
+import auth_util
+import envelope_util
+import frame_util
+import metrics_util
+import reliable_link
+import stream_util
+import trace_util
+import zmq_util
 from back_off_queue import on_permanent_failure, ExponentialBackoffQueue
+from back_off_store import create_backoff_store
 from config_manager import load_config, ConfigManager
-from log import setup_logger
+from log import HotLogger, setup_logger, stop_logging
 from login_api import LoginApi
+from spill_queue import SpillQueue
 
 logger = logging.getLogger(__name__)
+# 每条数据、每个请求的日志，按事件类型采样与限速
+hot_logger = HotLogger(logger)
+# ipc 帧中 received_at 的编码格式
+_TS_FORMAT = struct.Struct("!d")
+# 发布进程重试队列的最大重试次数
+_MAX_RETRIES = 5
+
+
+class PublisherStats:
+    """跨进程共享的发布计数（在 fork 前创建）"""
+
+    def __init__(self, max_queue_size):
+        self.max_queue_size = max_queue_size
+        # worker 成功交给发布进程的条数
+        self.enqueued = multiprocessing.Value('q', 0)
+        # 发布进程已从汇聚入口取出的条数（推送成功或转入重试队列）
+        self.drained = multiprocessing.Value('q', 0)
+        # 发布循环最近一次存活时间，用于健康检查
+        self.alive_at = multiprocessing.Value('d', 0.0, lock=False)
+        # Prometheus 指标，保存在共享内存中，各 worker 与发布进程的更新在 /metrics 中汇总
+        self.registry = metrics_util.MetricsRegistry()
+        r = self.registry
+        self.ingest_items = r.counter("pec_ingest_items_total", "Items offered to the ingest queue",
+                                      label="result", values=("accepted", "rejected"))
+        self.ingest_bytes = r.counter("pec_ingest_bytes_total", "Payload bytes accepted into the ingest queue")
+        self.enqueue_wait = r.histogram("pec_ingest_enqueue_wait_seconds",
+                                        "Time spent handing an item to the publisher")
+        self.publish_items = r.counter("pec_publish_items_total", "Items pushed to the intranet client")
+        self.publish_bytes = r.counter("pec_publish_bytes_total", "Bytes pushed to the intranet client")
+        self.publish_latency = r.histogram("pec_publish_latency_seconds", "Time from HTTP receipt to ZMQ push")
+        self.send_errors = r.counter("pec_zmq_send_errors_total", "Failed ZMQ sends")
+        self.backoff = metrics_util.BackoffMetrics(r, "publisher", _MAX_RETRIES)
+        # 确认模式（zmq_transport = "ack"）
+        self.acked_items = r.counter("pec_ack_items_total", "Items acknowledged by the intranet client")
+        self.retransmitted_items = r.counter("pec_ack_retransmitted_items_total",
+                                             "Items sent again after an ack timeout")
+        self.unacked = r.gauge("pec_ack_window_unacked", "Items sent or waiting to be sent but not acknowledged yet")
+        # 待推送队列溢出到磁盘的部分
+        self.spill_items = r.gauge("pec_spill_items", "Items waiting in the on-disk spill log")
+        self.spill_bytes = r.gauge("pec_spill_bytes", "Bytes allocated by spill log segments")
+        self.spill_full = r.counter("pec_spill_full_total", "Times ingest waited because the spill budget was full")
+        self.publisher_restarts = r.counter("pec_publisher_restarts_total",
+                                            "Publisher processes restarted by the supervisor")
+        r.gauge("pec_ingest_queue_size", "Items waiting for the publisher", func=self.queue_size)
+        r.gauge("pec_publisher_up", "Whether the publisher loop is alive",
+                func=lambda: 1 if self.publisher_alive() else 0)
+
+    @staticmethod
+    def incr(counter, n=1):
+        with counter.get_lock():
+            counter.value += n
+
+    def rebase(self, backlog: int):
+        """
+        发布进程（重新）启动时调用：以恢复的待推送条数为准重新计算 drained。
+        被结束的发布进程内存中与 ipc 管道中的数据已丢失，不会再被取出，不能累加到 enqueued 上
+        """
+        with self.enqueued.get_lock(), self.drained.get_lock():
+            self.drained.value = self.enqueued.value - backlog
+
+    def queue_size(self):
+        """待推送的数据条数（近似值）"""
+        return max(0, self.enqueued.value - self.drained.value)
+
+    def publisher_alive(self, timeout=5.0):
+        return time.time() - self.alive_at.value < timeout
 
 
 class DataPublisher:
-    def __init__(self, flask_app: Flask, zmq_bind_address="tcp://0.0.0.0:6666", api_port=6100, shared_queue=None):
-        self.api_port = api_port
+    """
+    发布进程：独占对外的 PUSH socket。
+    各 gunicorn worker 通过 ipc PUSH 把数据交给本进程的 PULL socket（fan-in），
+    数据以原始字节帧传输，不经过 pickle。
+    接收线程把 ipc 上的数据放入待推送队列（内存 + 磁盘溢出），发布线程从队列读取推送，
+    客户端长时间离线时数据写入磁盘，只有磁盘配额用满时才传回背压，worker 返回 503。
+    """
+
+    def __init__(self, zmq_bind_address="tcp://0.0.0.0:6666", ingest_address="ipc:///tmp/pec-cloud-ingest.ipc",
+                 stats: PublisherStats = None):
         # ZMQ配置
+        # push: PUSH/PULL，发送成功即视为送达；ack: ROUTER/DEALER，客户端确认后才移出发送窗口，超时重发
+        self.transport = ConfigManager.get_param_by_key("zmq_transport", "push")
         self.zmq_context = zmq.Context()
-        self.zmq_socket = self.zmq_context.socket(zmq.PUSH)
+        if self.transport == "ack":
+            self.zmq_socket = self.zmq_context.socket(zmq.ROUTER)
+            # 发给已断开的客户端时报错，而不是静默丢弃
+            self.zmq_socket.setsockopt(zmq.ROUTER_MANDATORY, 1)
+            self.zmq_socket.setsockopt(zmq.SNDHWM, ConfigManager.get_param_by_key("zmq_sndhwm", 1000))
+        else:
+            self.zmq_socket = self.zmq_context.socket(zmq.PUSH)
+        # ZMTP 心跳：客户端掉线（含网络中断、进程挂起）时及时断开，PUSH 不再把数据排到已失效的连接上
+        zmq_util.configure_liveness(self.zmq_socket)
         self.zmq_socket.bind(zmq_bind_address)
+        # zmq socket 不是线程安全的，发布、心跳、重试线程共用时需要加锁
+        self._send_lock = threading.Lock()
+        # worker 数据汇聚入口，只在接收线程内使用
+        self.ingest_socket = self.zmq_context.socket(zmq.PULL)
+        self.ingest_socket.setsockopt(zmq.RCVHWM, stats.max_queue_size if stats else 1000)
+        self.ingest_socket.setsockopt(zmq.RCVTIMEO, 1000)
+        self.ingest_socket.bind(ingest_address)
+        # 待推送队列：内存部分写满后溢出到磁盘分段日志，重启后从磁盘重放
+        memory_items = ConfigManager.get_param_by_key("spill_memory_items", stats.max_queue_size if stats else 1000)
+        self.queue = SpillQueue(
+            ConfigManager.get_param_by_key("spill_dir", "data/spill"),
+            memory_items=memory_items,
+            segment_bytes=ConfigManager.get_param_by_key("spill_segment_mb", 64) * 1024 * 1024,
+            max_bytes=ConfigManager.get_param_by_key("spill_max_mb", 10240) * 1024 * 1024
+        )
+        # 接收线程没能放入队列（磁盘配额已满）时停止处理的数据，停止时保存
+        self._ingest_held = None
+        if stats:
+            # 待推送条数从磁盘上恢复的数据开始计算，监督者重启发布进程后不会重复计入
+            stats.rebase(len(self.queue))
         self.heart_beat = ConfigManager.get_param_by_key("zero_mq_heart_beat", 300)
-
-        # API配置
-        # self.app = Flask(__name__)
-        self.app = flask_app
-        # 缓冲队列
-        self.data_queue = shared_queue
+        # 批量发送：最多攒 batch_size 条或等待 batch_linger 秒合并成一条多帧消息，1 表示不合并
+        self.batch_size = min(ConfigManager.get_param_by_key("zmq_batch_size", 1), frame_util.MAX_BATCH_SIZE)
+        self.batch_linger = ConfigManager.get_param_by_key("zmq_batch_linger_ms", 5) / 1000.0
+        self.stats = stats
         self.running = True
+        # 端到端追踪：每条数据附带序列号与时间戳，客户端据此统计各阶段时延与序列号缺口
+        # 确认模式以追踪帧中的序列号标识消息，总是带追踪帧
+        self.trace_enabled = self.transport == "ack" or ConfigManager.get_param_by_key("zmq_trace", True)
+        # 发布进程纪元，客户端据此区分重启后重新计数的序列号
+        self.epoch = int(time.time()) & 0xFFFFFFFF
         self.sequence_counter = 0
         self.sequence_lock = threading.Lock()
-
-        # 注册API路由
-        # self._register_routes()
-
-        # 启动数据发布线程
-        self.publish_thread = threading.Thread(target=self._publish_data_loop, daemon=True)
-        self.heartbeat_thread = threading.Thread(target=self._send_heartbeat, daemon=True)
-        self.start(zmq_bind_address)
         # 启动重试线程
         self.ebq = ExponentialBackoffQueue(
             process_func=self._process_data,
-            max_retries=5,
+            max_retries=_MAX_RETRIES,
             base_delay=60.0,
             max_backoff=60 * 60 * 6.0,
             jitter=True,
             dead_letter_callback=on_permanent_failure,
-            worker_count=2
+            worker_count=2,
+            # 持久化重试任务，进程重启后重放
+            store=create_backoff_store(
+                ConfigManager.get_param_by_key("backoff_store_path", "data/publisher_backoff.db"),
+                max_entries=ConfigManager.get_param_by_key("backoff_store_max_entries", 500000),
+                max_mb=ConfigManager.get_param_by_key("backoff_store_max_mb", 1024)
+            ),
+            metrics=stats.backoff if stats else None
         )
-
-    def _register_routes(self):
-        """注册API路由"""
-
-        @self.app.route('/api/data2', methods=['POST'])
-        def receive_data():
-            try:
-                # 接收JSON数据
-                data = request.get_json()
-                if not data:
-                    return jsonify({"error": "No JSON data provided"}), 400
-                # 验证必要字段
-                if 'data' not in data:
-                    return jsonify({"error": "Missing 'data' field"}), 400
-                # 添加到队列（阻塞等待，直到有空间）
-                queue_data = {
-                    "payload": data,
-                    "received_at": time.time()
-                }
-                # # 改为接受纯文本
-                # text_data = request.get_data(as_text=True)
-                # 阻塞put
-                self.data_queue.put(queue_data)
-                logger.info(f"数据已接收并加入队列，队列大小: {self.data_queue.qsize()}")
-                return jsonify({"status": "success", "message": "Data received"}), 200
-            except Exception as e:
-                logger.error(f"接收数据错误: {e}")
-                return jsonify({"error": str(e)}), 500
+        self.window = None
+        self.heartbeat_thread = None
+        if self.transport == "ack":
+            self.window = reliable_link.AckWindow(
+                self.zmq_socket, self.epoch,
+                window=ConfigManager.get_param_by_key("zmq_ack_window", 10000),
+                ack_timeout=ConfigManager.get_param_by_key("zmq_ack_timeout_ms", 5000) / 1000.0,
+                peer_timeout=ConfigManager.get_param_by_key("zmq_peer_timeout", 30),
+                stats=stats
+            )
+            # 重试队列重放的数据，由发布线程放入发送窗口（ROUTER socket 只在发布线程内使用）
+            self._replay = collections.deque()
+            # 接收线程放入队列后唤醒发布线程（发布线程同时在等待 ROUTER socket 上的确认）
+            self._wakeup_address = f"inproc://pec-publisher-wakeup-{id(self)}"
+            self._wakeup = self.zmq_context.socket(zmq.PAIR)
+            self._wakeup.bind(self._wakeup_address)
+            # 收发确认、重发与心跳都在发布线程内完成
+            self.publish_thread = threading.Thread(target=self._ack_publish_loop, name="Publisher", daemon=True)
+        else:
+            # 启动数据发布线程
+            self.publish_thread = threading.Thread(target=self._publish_data_loop, name="Publisher", daemon=True)
+            self.heartbeat_thread = threading.Thread(target=self._send_heartbeat, name="Heartbeat", daemon=True)
+        self.ingest_thread = threading.Thread(target=self._ingest_loop, name="Ingest", daemon=True)
+        self.start(zmq_bind_address, ingest_address)
 
     def compress_data(self, data):
         """压缩数据"""
@@ -92,131 +207,532 @@ class DataPublisher:
         compressed = zlib.compress(json_data.encode('utf-8'))
         return compressed
 
+    def _send(self, frames, flags=0):
+        with self._send_lock:
+            self._send_locked(frames, flags)
+
+    def _wait_writable(self, timeout_ms):
+        """等待 PUSH socket 可以发送（有在线客户端且发送缓冲未满）"""
+        with self._send_lock:
+            return self.zmq_socket.poll(timeout_ms, zmq.POLLOUT)
+
+    def _send_items(self, batch):
+        """
+        推送一条或多条数据。序列号在发送锁内分配，发送失败时收回，
+        保证链路上的序列号连续，客户端看到的缺口即为链路上的丢失
+        """
+        payloads = [queue_data["payload"] for queue_data in batch]
+        with self._send_lock:
+            if not self.trace_enabled:
+                self._send_locked(frame_util.pack_data(payloads))
+                return
+            first = self._get_next_sequence(len(batch))
+            published_at = time.time()
+            trace = trace_util.pack_traces(self.epoch, [
+                (first + i, queue_data["received_at"], published_at) for i, queue_data in enumerate(batch)])
+            try:
+                self._send_locked(frame_util.pack_data(payloads, trace))
+            except Exception:
+                with self.sequence_lock:
+                    self.sequence_counter -= len(batch)
+                raise
+
+    def _send_locked(self, frames, flags=0):
+        try:
+            self.zmq_socket.send_multipart(frames, flags)
+        except zmq.Again:
+            raise
+        except Exception:
+            if self.stats:
+                self.stats.send_errors.inc()
+            raise
+        if self.stats:
+            self.stats.publish_bytes.inc(sum(len(frame) for frame in frames))
+
+    def _heartbeat_frames(self):
+        heartbeat_data = {
+            "type": "heartbeat",
+            "timestamp": time.time(),
+            "status": "alive",
+            "queue_size": self.stats.queue_size() if self.stats else 0
+        }
+        return [frame_util.MSG_HEARTBEAT, self.compress_data(heartbeat_data)]
+
     def _send_heartbeat(self):
         """心跳线程"""
         while self.running:
             try:
-                heartbeat_data = {
-                    "type": "heartbeat",
-                    "timestamp": time.time(),
-                    "status": "alive",
-                    "queue_size": self.data_queue.qsize()
-                }
-                compressed_heartbeat = self.compress_data(heartbeat_data)
-                self.zmq_socket.send_multipart([b"heartbeat", compressed_heartbeat])
+                # 不阻塞：没有在线客户端时 PUSH 会一直阻塞并占住发送锁
+                self._send(self._heartbeat_frames(), zmq.NOBLOCK)
                 logger.debug(f"[心跳] 发送心跳包")
                 time.sleep(self.heart_beat)
+            except zmq.Again:
+                logger.debug("[心跳] 没有在线客户端，跳过")
+                time.sleep(self.heart_beat)
             except Exception as e:
                 logger.error(f"[心跳] 错误: {e}")
                 time.sleep(self.heart_beat)
 
-    def _get_next_sequence(self):
-        """获取下一个序列号"""
+    def _get_next_sequence(self, count=1):
+        """获取下一个序列号，count 大于 1 时连续分配 count 个，返回第一个"""
         with self.sequence_lock:
             seq = self.sequence_counter
-            self.sequence_counter += 1
+            self.sequence_counter += count
             return seq
 
+    def _recv_ingest(self, flags=0):
+        ts_frame, payload = self.ingest_socket.recv_multipart(flags)
+        return {
+            "payload": payload,
+            "received_at": _TS_FORMAT.unpack(ts_frame)[0]
+        }
+
+    def _ingest_loop(self):
+        """接收线程：把 worker 交来的数据放入待推送队列，磁盘配额用满时停止读取 ipc，背压传回 worker"""
+        wakeup = None
+        if self.window is not None:
+            wakeup = self.zmq_context.socket(zmq.PAIR)
+            wakeup.connect(self._wakeup_address)
+        while self.running:
+            try:
+                if self._ingest_held is None:
+                    self._ingest_held = self._recv_ingest()
+                # 有数据时连续读取，减少唤醒发布线程的次数
+                for _ in range(256):
+                    if not self.queue.put(self._ingest_held, timeout=1.0):
+                        if self.stats:
+                            self.stats.spill_full.inc()
+                        break
+                    self._ingest_held = None
+                    self._ingest_held = self._recv_ingest(zmq.NOBLOCK)
+            except zmq.Again:
+                pass
+            except Exception as e:
+                logger.exception(f"接收数据异常: {e}")
+                time.sleep(1)
+            if wakeup is not None:
+                try:
+                    wakeup.send(b"", zmq.NOBLOCK)
+                except zmq.Again:
+                    pass
+            if self.stats:
+                self.stats.spill_items.set(self.queue.disk_items())
+                self.stats.spill_bytes.set(self.queue.disk_bytes())
+        if wakeup is not None:
+            wakeup.close(0)
+
+    def _take(self, timeout=None):
+        """从待推送队列取出一条，超时返回 None"""
+        queue_data = self.queue.get(timeout)
+        if queue_data is not None and self.stats:
+            PublisherStats.incr(self.stats.drained)
+        return queue_data
+
+    def _collect_batch(self, first):
+        """在 batch_linger 内继续读取，最多凑满 batch_size 条"""
+        batch = [first]
+        deadline = time.time() + self.batch_linger
+        while len(batch) < self.batch_size:
+            queue_data = self._take(max(0.0, deadline - time.time()))
+            if queue_data is None:
+                break
+            batch.append(queue_data)
+        return batch
+
     def _publish_data_loop(self):
-        """数据发布循环 - 使用阻塞队列读取"""
+        """数据发布循环 - 从待推送队列阻塞读取（内存中没有时按顺序读取磁盘上的积压）"""
         logger.info("数据发布循环启动")
         while self.running:
-            queue_data = None
+            batch = None
+            if self.stats:
+                self.stats.alive_at.value = time.time()
             try:
-                # 阻塞等待队列数据（超时1秒，避免无法响应停止信号）
-                queue_data = self.data_queue.get(timeout=1)
-                # 获取序列号
-                # sequence = self._get_next_sequence()
-                # 构造完整数据包
-                # full_data = {
-                #     "type": "data",
-                #     "sequence": sequence,
-                #     "payload": queue_data["payload"],
-                #     "received_at": queue_data["received_at"],
-                #     "published_at": time.time()
-                # }
-                # 压缩并发送
-                # compressed_data = self.compress_data(full_data)
-                # encrypt_data = encrypt_util.encrypt_data(json.dumps(full_data))
+                # 客户端离线或接收缓慢时不取出，数据留在待推送队列（溢出到磁盘），停止时不会丢失发送中的数据
+                if not self._wait_writable(1000):
+                    continue
+                # 阻塞等待数据（超时1秒，避免无法响应停止信号）
+                first = self._take(timeout=1.0)
+                if first is None:
+                    continue
+                batch = self._collect_batch(first)
                 # 这里采集端上传的时候已经压缩过了，所以直接传
-                logger.info("zmq push data: %s", str(queue_data["received_at"]))
-                self.zmq_socket.send_multipart([b"data", queue_data["payload"].encode("utf-8")])
-
-                # original_size = len(json.dumps(full_data).encode('utf-8'))
-                # compressed_size = len(encrypt_data)
-                # compression_ratio = (1 - compressed_size / original_size) * 100
-                #
-                # logger.info(f"[数据] 发送消息 #{sequence}")
-                # logger.info(f"      原始大小: {original_size} 字节")
-                # logger.info(f"      压缩后: {compressed_size} 字节")
-                # logger.info(f"      压缩率: {compression_ratio:.2f}%")
-                # 标记任务完成
-                # self.data_queue.task_done()
-            except Empty:
-                # 超时，继续循环检查running状态
-                continue
+                hot_logger.info("publish", "zmq push data: %d 条, %s", len(batch), batch[0]["received_at"])
+                self._send_items(batch)
+                if self.stats:
+                    self._observe_published(batch)
+            except Exception as e:
+                logger.exception(f"发布数据异常: {e}")
+                for queue_data in batch or []:
+                    self.ebq.add_task(queue_data)
+                time.sleep(1)
+
+    def _ack_publish_loop(self):
+        """确认模式的发布循环：窗口有空位时从待推送队列读取，同时接收确认、重发超时消息、发送心跳"""
+        logger.info("数据发布循环启动（确认模式）")
+        poller = zmq.Poller()
+        poller.register(self.zmq_socket, zmq.POLLIN)
+        poller.register(self._wakeup, zmq.POLLIN)
+        next_heartbeat = 0.0
+        while self.running:
+            batch = None
+            if self.stats:
+                self.stats.alive_at.value = time.time()
+            try:
+                credit = self.window.has_credit()
+                # 窗口已满时不再读取队列，数据留在队列（内存或磁盘）中
+                events = dict(poller.poll(0 if credit and (self._replay or len(self.queue)) else 100))
+                if self._wakeup in events:
+                    while self._wakeup.poll(0):
+                        self._wakeup.recv()
+                if self.zmq_socket in events:
+                    self._drain_acks()
+                self.window.resend_due()
+                if time.time() >= next_heartbeat:
+                    self.window.broadcast(self._heartbeat_frames())
+                    next_heartbeat = time.time() + self.heart_beat
+                if credit and self._replay:
+                    batch = [self._replay.popleft() for _ in range(min(self.batch_size, len(self._replay)))]
+                    self._send_window(batch)
+                elif credit:
+                    # 有数据时连续读取多批再回到 poll，减少每条消息的系统调用
+                    for _ in range(64):
+                        if not self.window.has_credit():
+                            break
+                        first = self._take(timeout=0)
+                        if first is None:
+                            break
+                        batch = self._collect_batch(first)
+                        self._send_window(batch)
+                        batch = None
+                if self.stats:
+                    self.stats.unacked.set(self.window.unacked)
             except Exception as e:
                 logger.exception(f"发布数据异常: {e}")
-                if queue_data:
+                for queue_data in batch or []:
                     self.ebq.add_task(queue_data)
                 time.sleep(1)
 
+    def _drain_acks(self, limit=1000):
+        for _ in range(limit):
+            try:
+                parts = self.zmq_socket.recv_multipart(zmq.NOBLOCK)
+            except zmq.Again:
+                return
+            self.window.on_message(parts[0], parts[1:])
+
+    def _send_window(self, batch):
+        """分配序列号，放入发送窗口，客户端确认前保留在窗口中"""
+        first = self._get_next_sequence(len(batch))
+        published_at = time.time()
+        trace = trace_util.pack_traces(self.epoch, [
+            (first + i, queue_data["received_at"], published_at) for i, queue_data in enumerate(batch)])
+        self.window.send(first, frame_util.pack_data([queue_data["payload"] for queue_data in batch], trace),
+                         len(batch))
+        if self.stats:
+            self._observe_published(batch)
+
     def _process_data(self, queue_data):
+        if self.window is not None:
+            # 交给发布线程放入发送窗口，窗口负责重发，不再经过重试队列
+            self._replay.append(queue_data)
+            return
         # 这里采集端上传的时候已经压缩过了，所以直接传
         logger.info("zmq re-push data: %s", str(queue_data["received_at"]))
-        self.zmq_socket.send_multipart([b"data", queue_data["payload"].encode("utf-8")])
+        self._send_items([queue_data])
+        if self.stats:
+            self._observe_published([queue_data])
 
-    def add_data(self, data):
-        """添加数据到队列"""
-        try:
-            queue_data = {
-                "payload": data,
-                "received_at": time.time()
-            }
-            self.data_queue.put(queue_data, timeout=5)
-            return True
-        except Exception as e:
-            logger.exception("队列已满，数据添加失败", e)
-            return False
+    def _observe_published(self, batch):
+        self.stats.publish_items.inc(len(batch))
+        now = time.time()
+        for queue_data in batch:
+            self.stats.publish_latency.observe(now - queue_data["received_at"])
+
+    def _unacked_items(self):
+        """发送窗口中未确认的数据与待放入窗口的重放数据，停止时保存到待推送队列的最前面"""
+        items = []
+        for frames in self.window.pending_messages():
+            payloads, trace = frame_util.unpack_message(frames)
+            for payload, record in zip(payloads, trace_util.unpack_traces(trace)):
+                items.append({"payload": payload, "received_at": record.received_at})
+        return items + list(self._replay)
 
     def stop(self):
         """停止服务"""
         self.running = False
+        self.ingest_thread.join(timeout=5)
         self.publish_thread.join(timeout=5)
-        self.heartbeat_thread.join(timeout=5)
+        if self.heartbeat_thread:
+            self.heartbeat_thread.join(timeout=5)
+        self.ebq.close()
+        # 内存中的数据（确认模式下含未确认的数据）写盘，下次启动时最先推送
+        held = [self._ingest_held] if self._ingest_held else []
+        self.queue.close(head=self._unacked_items() if self.window is not None else (), tail=held)
+        self.ingest_socket.close()
+        if self.window is not None:
+            self._wakeup.close(0)
         self.zmq_socket.close()
         self.zmq_context.term()
 
-    def start(self, zmq_bind_address="tcp://0.0.0.0:6666"):
+    def start(self, zmq_bind_address="tcp://0.0.0.0:6666", ingest_address="ipc:///tmp/pec-cloud-ingest.ipc"):
         """启动服务"""
         # 启动线程
+        self.ingest_thread.start()
         self.publish_thread.start()
         # 是否需要发送心跳？占用流量
-        self.heartbeat_thread.start()
+        if self.heartbeat_thread:
+            self.heartbeat_thread.start()
 
         logger.info("数据发布服务启动完成")
-        logger.info("ZMQ服务: %s", zmq_bind_address)
-        logger.info("API服务: http://0.0.0.0:6100")
+        logger.info("ZMQ服务: %s (%s)", zmq_bind_address, self.transport)
+        logger.info("数据汇聚入口: %s", ingest_address)
+
+
+def run_publisher(zmq_bind_address, ingest_address, stats):
+    """发布进程入口，由 PublisherSupervisor 启动"""
+    stopped = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopped.set())
+    signal.signal(signal.SIGINT, lambda signum, frame: stopped.set())
+    publisher = DataPublisher(zmq_bind_address, ingest_address, stats)
+    logger.info("发布进程启动, PID: %d", os.getpid())
+    stopped.wait()
+    logger.info("发布进程停止...")
+    publisher.stop()
+    # 子进程以 os._exit 退出，不执行 atexit，这里写出后台队列中的日志
+    stop_logging()
+
+
+class PublisherSupervisor:
+    """
+    发布进程的监督进程，由 gunicorn master 在 when_ready 钩子中启动（worker fork 之前），on_exit 钩子中停止
+    - 监督进程与发布进程都用 os.fork 创建，不进入 multiprocessing 的子进程列表，worker 退出时不会误停发布进程
+    - 发布进程退出或发布循环超过 stall_timeout 秒没有存活信号时重启，连续失败时重启间隔指数增长（最长 max_delay 秒）
+    - master 退出（父进程变化）后停止发布进程并退出
+    共享计数 PublisherStats 在 create_app 中创建（fork 前），各进程共享
+    """
+
+    def __init__(self, zmq_bind_address, ingest_address, stats: PublisherStats, stall_timeout: float = 60.0,
+                 max_delay: float = 30.0):
+        self.zmq_bind_address = zmq_bind_address
+        self.ingest_address = ingest_address
+        self.stats = stats
+        self.stall_timeout = stall_timeout
+        self.max_delay = max_delay
+        # 停止时等待发布进程写出数据的最长时间，小于 stop 的等待时间
+        self.stop_timeout = 25.0
+        self.pid = None
+        self._stopping = False
+
+    def start(self, close_fds=()):
+        """
+        在 gunicorn master 中调用
+        :param close_fds: 监督进程中关闭的文件描述符（master 的监听 socket，避免 master 退出后端口仍被占用）
+        """
+        if self.pid is not None:
+            return
+        master_pid = os.getpid()
+        pid = os.fork()
+        if pid:
+            self.pid = pid
+            logger.info("发布进程监督者启动, PID: %d", pid)
+            return
+        code = 0
+        try:
+            for fd in close_fds:
+                try:
+                    os.close(fd)
+                except OSError:
+                    pass
+            self._reset_signals()
+            self._supervise(master_pid)
+        except BaseException as e:
+            logger.exception(f"发布进程监督者异常退出: {e}")
+            code = 1
+        finally:
+            stop_logging()
+            os._exit(code)
+
+    def stop(self, timeout: float = 30.0):
+        """在 gunicorn master 中调用：停止监督者，监督者先停止发布进程（写出未推送的数据）"""
+        if self.pid is None:
+            return
+        try:
+            os.kill(self.pid, signal.SIGTERM)
+        except ProcessLookupError:
+            return
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            try:
+                if os.waitpid(self.pid, os.WNOHANG)[0]:
+                    return
+            except ChildProcessError:
+                # 已被 gunicorn 的 SIGCHLD 处理回收
+                try:
+                    os.kill(self.pid, 0)
+                except ProcessLookupError:
+                    return
+            time.sleep(0.1)
+        logger.warning("发布进程监督者 %d 秒内未退出", timeout)
+
+    def _reset_signals(self):
+        # 继承自 gunicorn master 的信号处理会写 master 的管道，恢复默认后只处理停止信号
+        for sig in (signal.SIGHUP, signal.SIGQUIT, signal.SIGTTIN, signal.SIGTTOU, signal.SIGUSR1,
+                    signal.SIGUSR2, signal.SIGWINCH, signal.SIGCHLD):
+            signal.signal(sig, signal.SIG_DFL)
+        signal.set_wakeup_fd(-1)
+
+        def on_stop(signum, frame):
+            self._stopping = True
+
+        signal.signal(signal.SIGTERM, on_stop)
+        signal.signal(signal.SIGINT, on_stop)
+
+    def _spawn(self) -> int:
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                run_publisher(self.zmq_bind_address, self.ingest_address, self.stats)
+            except BaseException as e:
+                logger.exception(f"发布进程异常退出: {e}")
+                code = 1
+            finally:
+                stop_logging()
+                os._exit(code)
+        logger.info("发布进程已启动, PID: %d", pid)
+        return pid
+
+    def _supervise(self, master_pid):
+        delay = 1.0
+        pid = self._spawn()
+        started_at = time.time()
+        while not self._stopping and os.getppid() == master_pid:
+            time.sleep(0.5)
+            exited, status = os.waitpid(pid, os.WNOHANG)
+            # 刚启动的发布进程还没有存活信号时，从启动时间开始计算
+            last_seen = max(self.stats.alive_at.value, started_at)
+            if not exited and time.time() - last_seen < self.stall_timeout:
+                if time.time() - started_at > self.stall_timeout:
+                    # 稳定运行后恢复初始重启间隔
+                    delay = 1.0
+                continue
+            if exited:
+                logger.error("发布进程 %d 退出（状态 %d），%.0f 秒后重启", pid, status, delay)
+            else:
+                logger.error("发布进程 %d 超过 %.0f 秒没有存活信号，强制结束后重启", pid, self.stall_timeout)
+                os.kill(pid, signal.SIGKILL)
+                os.waitpid(pid, 0)
+            # 清除存活信号，重启完成前健康检查返回 503
+            self.stats.alive_at.value = 0.0
+            deadline = time.time() + delay
+            while not self._stopping and time.time() < deadline:
+                time.sleep(0.1)
+            if self._stopping:
+                return
+            delay = min(delay * 2, self.max_delay)
+            self.stats.publisher_restarts.inc()
+            pid = self._spawn()
+            started_at = time.time()
+        # 收到停止信号或 master 已退出：停止发布进程，等待其写出未推送的数据
+        logger.info("停止发布进程 %d", pid)
+        os.kill(pid, signal.SIGTERM)
+        deadline = time.time() + self.stop_timeout
+        while time.time() < deadline:
+            if os.waitpid(pid, os.WNOHANG)[0]:
+                return
+            time.sleep(0.1)
+        logger.error("发布进程 %d 在 %.0f 秒内未停止，强制结束", pid, self.stop_timeout)
+        os.kill(pid, signal.SIGKILL)
+        os.waitpid(pid, 0)
+
+
+class IngestProducer:
+    """
+    worker 侧：通过 ipc PUSH 把原始字节交给发布进程。
+    socket 按 (进程, 线程) 惰性创建，fork 后在 worker 内首次使用时才连接。
+    """
+
+    def __init__(self, ingest_address, stats: PublisherStats, send_timeout=5000):
+        """
+        :param ingest_address: 发布进程的 ipc 地址
+        :param stats: 跨进程共享的发布计数
+        :param send_timeout: 发布进程缓冲已满时最长等待时间（毫秒）
+        """
+        self.ingest_address = ingest_address
+        self.stats = stats
+        self.send_timeout = send_timeout
+        self._local = threading.local()
+
+    def _socket(self):
+        pid = os.getpid()
+        if getattr(self._local, "pid", None) != pid:
+            # Context.instance() 在 fork 后会为新进程重新创建
+            sock = zmq.Context.instance().socket(zmq.PUSH)
+            sock.setsockopt(zmq.SNDHWM, self.stats.max_queue_size)
+            sock.setsockopt(zmq.LINGER, 1000)
+            # 发布进程未就绪时不在本地排队，直接超时
+            sock.setsockopt(zmq.IMMEDIATE, 1)
+            sock.connect(self.ingest_address)
+            self._local.socket = sock
+            self._local.pid = pid
+        return self._local.socket
+
+    def add_data(self, data: bytes, timeout=None) -> bool:
+        """
+        添加数据到发布进程，缓冲已满时最多等待 timeout 毫秒（默认 send_timeout）后返回 False
+        """
+        sock = self._socket()
+        start = time.perf_counter()
+        try:
+            if not sock.poll(self.send_timeout if timeout is None else timeout, zmq.POLLOUT):
+                raise zmq.Again()
+            sock.send_multipart([_TS_FORMAT.pack(time.time()), data], flags=zmq.NOBLOCK, copy=False)
+            PublisherStats.incr(self.stats.enqueued)
+            self.stats.ingest_items.labels("accepted").inc()
+            self.stats.ingest_bytes.inc(len(data))
+            return True
+        except zmq.Again:
+            self.stats.ingest_items.labels("rejected").inc()
+            logger.error("队列已满，数据添加失败")
+            return False
+        finally:
+            self.stats.enqueue_wait.observe(time.perf_counter() - start)
+
+    def queue_size(self):
+        return self.stats.queue_size()
 
 
 # 创建Flask应用
 def create_app(api_port, zmq_bind_address):
     app = Flask(__name__)
-    # 在主进程创建队列
-    shared_queue = Queue(maxsize=1000)
-    # 传递给 worker 进程（需在 fork 前设置好）
-    # 创建全局DataPublisher实例
-    app.publisher = DataPublisher(app, zmq_bind_address, api_port, shared_queue)
+    ingest_address = ConfigManager.get_param_by_key("zmq_ingest_address", "ipc:///tmp/pec-cloud-ingest.ipc")
+    # 在主进程创建共享计数，fork 后各 worker 共享
+    stats = PublisherStats(ConfigManager.get_param_by_key("ingest_queue_size", 1000))
+    # 独立的发布进程独占对外 socket，worker 只持有 ipc PUSH
+    # 由 gunicorn master 在 when_ready 钩子中启动监督进程（见 gunicorn.conf.py），发布进程退出或卡住时重启
+    app.publisher_supervisor = PublisherSupervisor(
+        zmq_bind_address, ingest_address, stats,
+        stall_timeout=ConfigManager.get_param_by_key("publisher_stall_timeout", 60))
+    app.publisher = IngestProducer(ingest_address, stats)
+    # 批量接口中单条数据的最长入队等待（毫秒），超时即视为队列饱和
+    item_timeout = ConfigManager.get_param_by_key("batch_item_timeout_ms", 1000)
+    # 批量接口中单条数据的最大长度（字符），超过时停止读取并返回 400，避免超大或未结束的数据长时间占用 worker
+    max_item_size = ConfigManager.get_param_by_key("batch_max_item_mb", 16) * 1024 * 1024
+    # 签名校验中间件，auth_paths 中的接口（如 /api/data、/api/batch_data）统一校验，LoginApi 复用同一实例
+    auth_util.SignatureAuth(stats.registry).init_app(app)
     # 创建LoginApi实例，账号登录状态接口
     LoginApi(app)
 
     @app.route('/api/data', methods=['POST'])
     def receive_data():
         try:
-            # 改为接受纯文本
-            text_data = request.get_data(as_text=True)
-            if app.publisher.add_data(text_data):
-                logger.info(f"数据已接收并加入队列，队列大小: {app.publisher.data_queue.qsize()}")
+            # 直接转发原始字节，不做 str/bytes 转换
+            # application/octet-stream 为二进制信封，其他为旧的 Base64 文本，客户端按首字节区分
+            raw_data = request.get_data()
+            if request.mimetype == envelope_util.BINARY_CONTENT_TYPE and not envelope_util.is_binary(raw_data):
+                return jsonify({"error": "Invalid binary envelope"}), 400
+            if app.publisher.add_data(raw_data):
+                hot_logger.info("ingest", "数据已接收并加入队列，队列大小: %d", app.publisher.queue_size)
                 return jsonify({"status": "success", "message": "Data received"}), 200
             else:
                 return jsonify({"error": "Queue full, try again later"}), 503
@@ -226,41 +742,72 @@ def create_app(api_port, zmq_bind_address):
 
     @app.route('/api/batch_data', methods=['POST'])
     def receive_batch_data():
-        """批量接收数据接口"""
+        """
+        批量接收数据接口，支持 JSON 数组与 NDJSON，边解析边入队。
+        队列饱和时停止读取，返回已接收与被拒绝的序号，rejected_from 及之后的数据需要采集端重发。
+        """
+        accepted = []
+        rejected = []
+        rejected_from = None
+        error = None
+        status_code = 200
         try:
-            data_list = request.get_json()
-            if not isinstance(data_list, list):
-                return jsonify({"error": "Expected JSON array"}), 400
-            success_count = 0
-            for data in data_list:
-                app.publisher.add_data(data)
-                success_count += 1
-            logger.info(f"批量数据接收完成: {success_count} 条")
-            return jsonify({
-                "status": "success",
-                "message": f"Received {success_count} data items"
-            }), 200
+            for index, data in stream_util.iter_json_items(request.stream, max_item_size=max_item_size):
+                if isinstance(data, stream_util.InvalidItem):
+                    # NDJSON 中无法解析的行，跳过继续
+                    rejected.append(index)
+                    continue
+                raw_data = data.encode("utf-8") if isinstance(data, str) else json.dumps(data).encode("utf-8")
+                if app.publisher.add_data(raw_data, timeout=item_timeout):
+                    accepted.append(index)
+                else:
+                    # 队列已满
+                    rejected.append(index)
+                    rejected_from = index
+                    status_code = 503
+                    break
+        except stream_util.StreamParseError as e:
+            rejected.append(e.index)
+            rejected_from = e.index
+            error = str(e)
+            status_code = 400
         except Exception as e:
             logger.error(f"批量接收数据错误: {e}")
-            return jsonify({"error": str(e)}), 500
+            error = str(e)
+            status_code = 500
+        hot_logger.info("batch_ingest", "批量数据接收完成: 接收 %d 条, 拒绝 %d 条", len(accepted), len(rejected))
+        return jsonify({
+            "status": "success" if not rejected and not error else "partial",
+            "message": error or f"Received {len(accepted)} data items",
+            "accepted": accepted,
+            "rejected": rejected,
+            "rejected_from": rejected_from
+        }), status_code
 
     @app.route('/api/health', methods=['GET'])
     def health_check():
+        # 发布进程不可用时接收接口都会返回 503，健康检查同样返回 503，由编排系统发现（监督进程同时在重启发布进程）
+        alive = stats.publisher_alive()
         return jsonify({
-            "status": "healthy",
-            "queue_size": app.publisher.data_queue.qsize(),
+            "status": "healthy" if alive else "publisher down",
+            "queue_size": app.publisher.queue_size(),
             "timestamp": time.time()
-        }), 200
+        }), 200 if alive else 503
 
     @app.route('/api/stats', methods=['GET'])
     def get_stats():
         """获取统计信息"""
         return jsonify({
-            "queue_size": app.publisher.data_queue.qsize(),
-            "max_queue_size": app.publisher.data_queue.maxsize,
-            "zmq_address": "tcp://0.0.0.0:5555"
+            "queue_size": app.publisher.queue_size(),
+            "max_queue_size": stats.max_queue_size,
+            "zmq_address": zmq_bind_address
         }), 200
 
+    @app.route('/metrics', methods=['GET'])
+    def metrics():
+        """Prometheus 指标（所有 worker 与发布进程的汇总）"""
+        return stats.registry.render(), 200, {"Content-Type": metrics_util.CONTENT_TYPE}
+
     @app.teardown_appcontext
     def cleanup_publisher(exception):
         pass
@@ -279,11 +826,4 @@ gun_app = create_app(c_port, zmq_address)
 if __name__ == "__main__":
     # 直接运行时使用Flask开发服务器（仅用于开发测试）
     # gun_app.run(host='0.0.0.0', port=c_port, threaded=True, debug=debug_mode)
-    # # 创建全局实例
-    # publisher = DataPublisher(zmq_address, c_port)
-    # try:
-    #     publisher.start()
-    # except KeyboardInterrupt:
-    #     logger.info("服务停止...")
-    #     publisher.stop()
     pass
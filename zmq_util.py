@@ -0,0 +1,38 @@
+# -*- coding:utf-8 -*-
+# @FileName  :zmq_util.py
+# @Time      :2026/10/18 01:20
+# @Author    :shi lei.wei  <slwei@eppei.com>.
+# ZMQ 连接存活相关的公共设置，服务端与客户端共用
+# ZMTP 心跳（libzmq >= 4.2）由 libzmq 在连接上收发 PING/PONG，对端进程挂起或网络中断时在 heartbeat_timeout 内断开连接，
+# 之后 libzmq 按 RECONNECT_IVL 自动重连；应用层心跳（zero_mq_heart_beat）只用于展示服务端队列状态
+import zmq
+from zmq.utils.monitor import recv_monitor_message
+
+from config_manager import ConfigManager
+
+# 客户端关心的监控事件
+MONITOR_EVENTS = zmq.EVENT_CONNECTED | zmq.EVENT_DISCONNECTED | zmq.EVENT_CONNECT_RETRIED | zmq.EVENT_CLOSED
+
+
+def configure_liveness(socket):
+    """设置 ZMTP 心跳与重连间隔，需要在 bind/connect 之前调用"""
+    interval = ConfigManager.get_param_by_key("zmq_heartbeat_ivl_ms", 10000)
+    timeout = ConfigManager.get_param_by_key("zmq_heartbeat_timeout_ms", 30000)
+    if interval:
+        socket.setsockopt(zmq.HEARTBEAT_IVL, interval)
+        # 对端多久收不到本端的 PING 即断开
+        socket.setsockopt(zmq.HEARTBEAT_TTL, timeout)
+        # 发出 PING 后多久收不到回复即断开
+        socket.setsockopt(zmq.HEARTBEAT_TIMEOUT, timeout)
+    socket.setsockopt(zmq.RECONNECT_IVL, ConfigManager.get_param_by_key("zmq_reconnect_ivl_ms", 1000))
+    socket.setsockopt(zmq.RECONNECT_IVL_MAX, ConfigManager.get_param_by_key("zmq_reconnect_ivl_max_ms", 10000))
+
+
+def drain_monitor(monitor) -> list:
+    """读取监控 socket 上已到达的全部事件，返回 [{"event": ..., "value": ..., "endpoint": ...}, ...]"""
+    events = []
+    while True:
+        try:
+            events.append(recv_monitor_message(monitor, zmq.NOBLOCK))
+        except zmq.Again:
+            return events